@@ -1,24 +1,32 @@
 import os
 import json
+import asyncio
+import hashlib
 from functools import partial
 from app.setup.environment import setup
 
 # Call setup to initialize environment
 setup()
 
-from typing import Optional
-from fastapi import FastAPI, HTTPException, Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import Body, Depends, FastAPI, HTTPException, Path
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from langchain_openai import ChatOpenAI
+from fastapi.responses import FileResponse, JSONResponse
 from langchain.agents import AgentExecutor, create_react_agent
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from langchain_core.prompts import PromptTemplate
 from langchain_core.vectorstores import VectorStoreRetriever
-from app.setup.data import get_company_culture, get_conversations_retriever
-from app.tools import TeamMemberInterestsTool
+from app.setup.culture import load_company_culture
+from app.setup.data import COLLECTION_NAME, get_catalog, get_company_culture, get_conversations_retriever, get_index_version
+from app.setup.profiles import load_interest_profiles, refresh_interest_profiles
+from app.tools import TeamMemberInterestsTool, get_interests_question
+from app.utils.cache import AsyncTTLCache
+from app.utils.chains import GIFT_IDEAS_PROMPT, get_gift_ideas_chain
+from app.utils.embeddings import QueryCache, get_cache_stats
+from app.utils.llm import close_http_clients, get_chat_model
+from app.utils.streaming import EventLog, JsonArrayStream, StreamedList, format_sse
 
 app = FastAPI(title="Team Emotional Intelligence Companion")
 
@@ -31,85 +39,125 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# TODO:In real life, this content would come from emails, chats or transcripts.
-DATA_FILES = [
-    "app/data/_chat_abel_mesen.txt",
-    "app/data/_chat_francisco_salas.txt",
-    "app/data/_chat_grettel.txt",
-    "app/data/_chat_laura_monestel.txt",
-    "app/data/_chat_luisa_alfaro.txt",
-    "app/data/_chat_maria_jose_alfaro.txt",
-    "app/data/_chat_maritza_ortiz.txt",
-    "app/data/_chat_paola_mora_lopez.txt",
-    "app/data/_chat_robert_monestel.txt",
-]
-
-# Valid team members
-VALID_TEAM_MEMBERS = [
-    "Abel",
-    "Francisco Salas",
-    "Grettel",
-    "Laura Monestel",
-    "Luisa Alfaro",
-    "David",
-    "Maria José Alfaro",
-    "Maritza Ortiz",
-    "Paola Mora Lopez",
-    "Robert Monestel"
-]
-
-# Initialize during startup
+# Initialized in the background after startup (see initialize), so the server takes requests
+# right away
 mr_company_culture = None
 vector_store_retriever = None
+interest_profiles = None
+# Keep a reference to the background tasks: initialization, company culture and refresh of
+# the interest profiles
+init_task = None
+culture_task = None
+profiles_task = None
+
+# Seconds clients are told to wait before retrying while the application is starting
+RETRY_AFTER_SECONDS = 5
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize company culture and other async components during app startup"""
+    """Start initializing the app in the background, without holding up the server"""
+    global init_task
+    init_task = asyncio.create_task(initialize())
+    init_task.add_done_callback(partial(report_failure, "initialize the application"))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the background tasks and close the connections of the shared HTTP clients"""
+    for task in (init_task, culture_task, profiles_task):
+        if task is not None:
+            task.cancel()
+    await close_http_clients()
+
 
-    # TODO: This data should be more up to date
+def report_failure(what: str, task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Failed to {what}: {task.exception()!r}")
+
+
+async def initialize_company_culture(data_files) -> None:
+    """
+    Load the saved company culture summary, and bring it up to date with the chat exports
+    (see get_company_culture).
+    """
     global mr_company_culture
-    mr_company_culture = await get_company_culture(model="gpt-4.1-mini", data_files=DATA_FILES)
-    mr_company_culture = mr_company_culture.content
+    company_culture = load_company_culture()
+    # The summary of the last run is used until then
+    mr_company_culture = company_culture.summary
+    mr_company_culture = await get_company_culture(company_culture, model="gpt-4.1-mini", data_files=data_files)
+
+
+async def initialize() -> None:
+    """
+    Open (or build) the conversations index and everything that depends on it. The
+    application is ready once this is done (see get_readiness).
+
+    The blocking steps (reading the chat exports, opening the index, loading the embedding
+    model...) run in worker threads, so the server keeps answering in the meantime.
+    """
+    # The chat exports (and with them the valid team members) are discovered in DATA_DIR
+    data_files = (await asyncio.to_thread(get_catalog)).files
+
+    # Nothing waits for the company culture
+    global culture_task
+    culture_task = asyncio.create_task(initialize_company_culture(data_files))
+    culture_task.add_done_callback(partial(report_failure, "get the company culture"))
 
     global vector_store_retriever
-    vector_store_retriever = await get_conversations_retriever(data_files=DATA_FILES, collection_name="overlapped_conversations", k=6)
+    vector_store_retriever = await get_conversations_retriever(data_files=data_files, collection_name=COLLECTION_NAME, k=6)
 
     # Validate that we have a proper vector store retriever
     if not isinstance(vector_store_retriever, VectorStoreRetriever):
         raise ValueError(f"Failed to initialize vector store retriever. Got {type(vector_store_retriever)} instead.")
 
-    if mr_company_culture is None or vector_store_retriever is None:
-        raise HTTPException(status_code=503, detail="Failed to initialize application")
+    # Embed the question about every team member ahead of time
+    embeddings = vector_store_retriever.vectorstore.embeddings
+    if isinstance(embeddings, QueryCache):
+        await embeddings.aprewarm(get_interests_question(member) for member in get_catalog().member_names())
 
-@app.get("/api/gift-ideas/{teamMember}")
-async def get_gift_ideas(
-    teamMember: str = Path(..., description="The team member to get gift ideas for")
-):
+    # Work out the interests of the members whose chats changed in the background, the tool
+    # answers from them as soon as they are ready
+    global interest_profiles, profiles_task
+    interest_profiles = await asyncio.to_thread(load_interest_profiles, vector_store_retriever, get_catalog().member_names())
+    profiles_task = asyncio.create_task(refresh_interest_profiles(interest_profiles, vector_store_retriever))
+
+    # Build the agent (or chain) once, instead of on every request
+    model_name = os.getenv("GIFT_SUGGESTIONS_LLM")
+    if model_name:
+        if get_pipeline_mode() == "agent":
+            get_agent_executor(model_name)
+        else:
+            get_gift_ideas_chain(model_name, GIFT_SUGGESTIONS_TEMPERATURE)
+
+
+def get_readiness() -> str:
     """
-    Get thoughtful gift ideas for a specific team member based on their interests 
-    and aligned with the company culture.
-    
-    Args:
-        teamMember: The team member to get gift ideas for
-        
-    Returns:
-        A list with 3 gift ideas. Each gift idea is a dictionary with the following keys:
-        - name: The name of the gift idea
-        - description: A description of the gift idea
+    Whether the application is "starting", "ready" to suggest gift ideas, or "failed" to
+    initialize.
     """
-    model_name = os.getenv("GIFT_SUGGESTIONS_LLM")
-    if not model_name:
-        raise ValueError("GIFT_SUGGESTIONS_LLM environment variable not set")
+    if init_task is None or not init_task.done():
+        return "starting"
+    if init_task.cancelled() or init_task.exception() is not None:
+        return "failed"
+    return "ready"
 
-    # Validate team member
-    if teamMember not in VALID_TEAM_MEMBERS:
+
+def require_ready() -> None:
+    """
+    Dependency of the endpoints that need the conversations index: until it's ready, they
+    answer at once with a 503 and a Retry-After header.
+    """
+    readiness = get_readiness()
+    if readiness == "starting":
         raise HTTPException(
-            status_code=400,
-            detail=f"Invalid team member. Must be one of: {', '.join(VALID_TEAM_MEMBERS)}"
+            status_code=503,
+            detail="Application is starting, try again later",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
         )
-    
-    # Use a proper ReAct formatted prompt
-    AGENT_PROMPT = """Eres un amigo experto regalando regalos. Puedes sugerir ideas de regalos concretas que no sean demasiado caras o puedes responder que no hay suficiente información en caso de que no sepás suficiente sobre los intereses de la persona. El formato del resultado debe ser una lista de ideas de regalos en JSON, donde cada idea es de la forma:
+    if readiness == "failed":
+        raise HTTPException(status_code=503, detail="Failed to initialize application")
+
+# Use a proper ReAct formatted prompt
+AGENT_PROMPT = """Eres un amigo experto regalando regalos. Puedes sugerir ideas de regalos concretas que no sean demasiado caras o puedes responder que no hay suficiente información en caso de que no sepás suficiente sobre los intereses de la persona. El formato del resultado debe ser una lista de ideas de regalos en JSON, donde cada idea es de la forma:
     {{
         name: nombre del regalo,
         description: una explicación simple de por qué es un buen regalo (máximo 30 palabras),
@@ -134,39 +182,143 @@ async def get_gift_ideas(
 
     Question: {input}
     Thought: {agent_scratchpad}"""
-    
-    prompt_template = PromptTemplate.from_template(AGENT_PROMPT)
 
-    # Create the agent with the required tools
-    tools = [TeamMemberInterestsTool(vector_store_retriever)]
-    
-    # Create the agent using our custom prompt template
-    agent = create_react_agent(
-        llm=ChatOpenAI(model=model_name, temperature=1.2),
-        tools=tools,
-        prompt=prompt_template,
-    )
+AGENT_PROMPT_TEMPLATE = PromptTemplate.from_template(AGENT_PROMPT)
+
+GIFT_SUGGESTIONS_TEMPERATURE = 1.2
+
+# Tags the LLM calls of the agent, to tell their tokens from those of the tools when streaming
+GIFT_IDEAS_TAG = "gift_ideas"
+FINAL_ANSWER = "Final Answer:"
 
-    # Initialize the agent with the team member's name
-    agent_executor = AgentExecutor.from_agent_and_tools(
-        agent=agent,
-        tools=tools,
-        verbose=True,
-        handle_parsing_errors=True,
-        max_iterations=7
+# Gift suggestions agents by model (see get_agent_executor)
+agent_executors = {}
+interests_tool = None
+
+# Team members of a batch request whose gift ideas are worked out at the same time
+GIFT_IDEAS_BATCH_CONCURRENCY = int(os.getenv("GIFT_IDEAS_BATCH_CONCURRENCY", "4"))
+
+# Gift ideas are reused for GIFT_IDEAS_CACHE_TTL seconds, for up to GIFT_IDEAS_CACHE_SIZE members
+gift_ideas_cache = AsyncTTLCache(
+    ttl=float(os.getenv("GIFT_IDEAS_CACHE_TTL", "600")),
+    max_size=int(os.getenv("GIFT_IDEAS_CACHE_SIZE", "128")),
+)
+# Events of the gift ideas being streamed, by key in the cache, so the streams of a team member
+# that come in while they're being worked out follow the same run of the pipeline
+gift_ideas_streams: Dict[tuple, EventLog] = {}
+
+
+def get_pipeline_mode() -> str:
+    """
+    How gift ideas are worked out, from PIPELINE_MODE: "agent" (the default) lets a ReAct
+    agent decide when to look up the interests of the team member, "direct" always looks
+    them up once and then asks for the gift ideas in a single structured output call, which
+    makes the latency and tokens of a request predictable.
+    """
+    mode = os.getenv("PIPELINE_MODE", "agent").lower()
+    if mode not in {"agent", "direct"}:
+        raise ValueError("PIPELINE_MODE must be one of: 'agent', 'direct'")
+    return mode
+
+
+def get_gift_ideas_key(teamMember: str, model_name: str) -> tuple:
+    """
+    Key of the gift ideas of a team member in the cache: they change with the conversations
+    that are searched and with the pipeline, models and prompts that come up with them.
+    """
+    model_config = hashlib.sha256(json.dumps([
+        get_pipeline_mode(),
+        model_name,
+        GIFT_SUGGESTIONS_TEMPERATURE,
+        os.getenv("INTERESTS_RAG_LLM"),
+        AGENT_PROMPT,
+        GIFT_IDEAS_PROMPT,
+    ]).encode("utf-8")).hexdigest()
+    return (teamMember, get_index_version(), model_config)
+
+
+def get_interests_tool() -> TeamMemberInterestsTool:
+    """Tool that gets the interests of a team member, shared by both pipelines."""
+    global interests_tool
+    if interests_tool is None:
+        interests_tool = TeamMemberInterestsTool(vector_store_retriever, interest_profiles)
+    return interests_tool
+
+
+def get_agent_executor(model_name: str) -> AgentExecutor:
+    """
+    Gift suggestions agent, built the first time it's needed and then shared by every
+    request: the agent and its tools keep no state between runs.
+    """
+    if model_name not in agent_executors:
+        # Create the agent with the required tools
+        tools = [get_interests_tool()]
+
+        # Create the agent using our custom prompt template
+        agent = create_react_agent(
+            llm=get_chat_model(model_name, temperature=GIFT_SUGGESTIONS_TEMPERATURE).with_config(tags=[GIFT_IDEAS_TAG]),
+            tools=tools,
+            prompt=AGENT_PROMPT_TEMPLATE,
+        )
+
+        agent_executors[model_name] = AgentExecutor.from_agent_and_tools(
+            agent=agent,
+            tools=tools,
+            verbose=True,
+            handle_parsing_errors=True,
+            max_iterations=7
+        )
+    return agent_executors[model_name]
+
+
+async def suggest_gift_ideas(teamMember: str, model_name: str) -> list:
+    """
+    Come up with gift ideas for a team member with the pipeline of PIPELINE_MODE.
+
+    Returns:
+        The gift ideas
+    """
+    if get_pipeline_mode() == "direct":
+        return await suggest_gift_ideas_directly(teamMember, model_name)
+    return await suggest_gift_ideas_with_agent(teamMember, model_name)
+
+
+async def suggest_gift_ideas_directly(teamMember: str, model_name: str) -> list:
+    """
+    Look up the interests of a team member (from their profile, or one RAG call) and ask
+    for gift ideas in a single structured output call.
+
+    Returns:
+        The gift ideas
+    """
+    interests = await get_interests_tool().ainvoke(teamMember)
+    gift_ideas = await get_gift_ideas_chain(model_name, GIFT_SUGGESTIONS_TEMPERATURE).ainvoke(
+        {"team_member": teamMember, "interests": interests}
     )
+    return [idea.model_dump() for idea in gift_ideas.ideas]
+
 
+async def suggest_gift_ideas_with_agent(teamMember: str, model_name: str) -> list:
+    """
+    Run the gift suggestions agent for a team member.
+
+    Returns:
+        The gift ideas the agent came up with
+    """
     # Get the agent's response
-    response = await agent_executor.ainvoke(
+    response = await get_agent_executor(model_name).ainvoke(
         {"input": f"Sugiere 3 regalos para {teamMember}"}
     )
     
     # Extract the output
-    content = response.get("output", "")
-    
+    return parse_gift_ideas(response.get("output", ""))
+
+
+def parse_gift_ideas(content: str) -> list:
+    """Gift ideas in the final answer of the agent."""
     # Try to parse the JSON from the content
     try:
-        gift_ideas = json.loads(content)
+        return json.loads(content)
 
     except json.JSONDecodeError:
         # If JSON parsing fails, return an error
@@ -174,19 +326,333 @@ async def get_gift_ideas(
             status_code=500,
             detail="Failed to parse gift ideas from the response"
         )
+
+
+async def stream_gift_ideas(teamMember: str, model_name: str) -> AsyncIterator[str]:
+    """
+    Come up with gift ideas for a team member like suggest_gift_ideas, as server-sent events:
+    "status" events with the step the pipeline is in ("interests" while the interests are
+    looked up, "ideas" while the gift ideas are written), an "idea" event for each gift idea
+    as soon as the LLM finishes writing it, and then a "done" event with all of them, or an
+    "error" event. A "reset" event drops the ideas sent so far, when the LLM writes them again
+    differently (see StreamedList).
+
+    Streams for the same gift ideas share the run of the pipeline (and the cache) with each
+    other and with suggest_gift_ideas: the ones that come in later get the events sent so far
+    first.
+    """
+    key = get_gift_ideas_key(teamMember, model_name)
+
+    def compute():
+        gift_ideas_streams[key] = EventLog()
+        return run_gift_ideas_stream(key, gift_ideas_streams[key], teamMember, model_name)
+
+    result = gift_ideas_cache.future(key, compute)
+    # Events of the run in flight, None if the gift ideas are cached or being worked out
+    # without streaming
+    log = gift_ideas_streams.get(key)
+
+    ideas = StreamedList("idea")
+    try:
+        if log is not None:
+            async for event, data in log.follow():
+                events = ideas.update(data) if event == "ideas" else [(event, data)]
+                for event, data in events:
+                    yield format_sse(event, data)
+        # A client that goes away doesn't cancel the run the others follow
+        gift_ideas = await asyncio.shield(result)
+    except HTTPException as e:
+        yield format_sse("error", {"detail": e.detail})
+        return
+    except Exception as e:
+        print(f"Error streaming gift ideas for {teamMember}: {e}")
+        yield format_sse("error", {"detail": "Failed to suggest gift ideas"})
+        return
+
+    # The full answer has the last word, in case the ideas streamed differ from it
+    for event, data in ideas.finish(gift_ideas):
+        yield format_sse(event, data)
+    yield format_sse("done", {"giftIdeas": gift_ideas})
+
+
+async def run_gift_ideas_stream(key: tuple, log: EventLog, teamMember: str, model_name: str) -> list:
+    """
+    Run the pipeline of PIPELINE_MODE for a team member, putting its events in the log the
+    streams follow (see stream_gift_ideas).
+
+    Returns:
+        The gift ideas
+    """
+    if get_pipeline_mode() == "direct":
+        events = stream_gift_ideas_directly(teamMember, model_name)
+    else:
+        events = stream_gift_ideas_with_agent(teamMember, model_name)
+
+    try:
+        async for event, data in events:
+            if event == "result":
+                return data
+            log.append((event, data))
+        raise ValueError("The pipeline ended without gift ideas")
+    finally:
+        log.close()
+        if gift_ideas_streams.get(key) is log:
+            del gift_ideas_streams[key]
+
+
+async def stream_gift_ideas_directly(teamMember: str, model_name: str) -> AsyncIterator[Tuple[str, object]]:
+    """Events of suggest_gift_ideas_directly (see stream_gift_ideas), ending with a "result" one."""
+    yield "status", {"step": "interests"}
+    interests = await get_interests_tool().ainvoke(teamMember)
+
+    yield "status", {"step": "ideas"}
+    parser, ideas = JsonArrayStream(), []
+    gift_ideas = None
+    async for event in get_gift_ideas_chain(model_name, GIFT_SUGGESTIONS_TEMPERATURE).astream_events(
+        {"team_member": teamMember, "interests": interests}, version="v2"
+    ):
+        if event["event"] == "on_chat_model_stream":
+            for idea in parser.feed(event["data"]["chunk"].content):
+                ideas.append(idea)
+                yield "ideas", list(ideas)
+        elif event["event"] == "on_chain_end" and not event["parent_ids"]:
+            gift_ideas = event["data"]["output"]
+    yield "result", [idea.model_dump() for idea in gift_ideas.ideas]
+
+
+async def stream_gift_ideas_with_agent(teamMember: str, model_name: str) -> AsyncIterator[Tuple[str, object]]:
+    """
+    Events of suggest_gift_ideas_with_agent (see stream_gift_ideas), ending with a "result"
+    one. The gift ideas are parsed out of the tokens of the final answer as they arrive, each
+    "ideas" event with those of the answer being written so far (an answer that can't be
+    parsed is written again).
+    """
+    yield "status", {"step": "ideas"}
+    text, parser, ideas, output = "", None, [], ""
+    async for event in get_agent_executor(model_name).astream_events(
+        {"input": f"Sugiere 3 regalos para {teamMember}"}, version="v2"
+    ):
+        kind = event["event"]
+        if kind == "on_tool_start":
+            yield "status", {"step": "interests"}
+        elif kind == "on_tool_end":
+            yield "status", {"step": "ideas"}
+        elif kind == "on_chat_model_start" and GIFT_IDEAS_TAG in event["tags"]:
+            # Every step of the agent is a new LLM call, only the last one has the final answer
+            text, parser, ideas = "", None, []
+        elif kind == "on_chat_model_stream" and GIFT_IDEAS_TAG in event["tags"]:
+            chunk = event["data"]["chunk"].content
+            if parser is None:
+                text += chunk
+                if FINAL_ANSWER not in text:
+                    continue
+                parser = JsonArrayStream()
+                chunk = text.split(FINAL_ANSWER, 1)[1]
+            for idea in parser.feed(chunk):
+                ideas.append(idea)
+                yield "ideas", list(ideas)
+        elif kind == "on_chain_end" and not event["parent_ids"]:
+            output = event["data"]["output"].get("output", "")
+    yield "result", parse_gift_ideas(output)
+
+
+def get_gift_ideas_model(teamMember: str) -> str:
+    """Model the gift ideas are suggested with, once the team member is checked to be valid."""
+    model_name = os.getenv("GIFT_SUGGESTIONS_LLM")
+    if not model_name:
+        raise ValueError("GIFT_SUGGESTIONS_LLM environment variable not set")
+
+    # Validate team member
+    catalog = get_catalog()
+    if not catalog.has_member(teamMember):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid team member. Must be one of: {', '.join(catalog.member_names())}"
+        )
+    return model_name
+
+
+@app.get("/api/gift-ideas/{teamMember}", dependencies=[Depends(require_ready)])
+async def get_gift_ideas(
+    teamMember: str = Path(..., description="The team member to get gift ideas for")
+):
+    """
+    Get thoughtful gift ideas for a specific team member based on their interests 
+    and aligned with the company culture.
+
+    Recent answers are cached (see gift_ideas_cache), and concurrent requests for the same
+    team member share a single run of the pipeline (see get_pipeline_mode).
     
+    Args:
+        teamMember: The team member to get gift ideas for
+        
+    Returns:
+        A list with 3 gift ideas. Each gift idea is a dictionary with the following keys:
+        - name: The name of the gift idea
+        - description: A description of the gift idea
+    """
+    model_name = get_gift_ideas_model(teamMember)
+    gift_ideas = await gift_ideas_cache.get_or_compute(
+        get_gift_ideas_key(teamMember, model_name),
+        partial(suggest_gift_ideas, teamMember, model_name)
+    )
     return {"giftIdeas": gift_ideas}
 
 
+@app.get("/api/gift-ideas/{teamMember}/stream", dependencies=[Depends(require_ready)])
+async def stream_gift_ideas_endpoint(
+    teamMember: str = Path(..., description="The team member to get gift ideas for")
+):
+    """
+    Same as /api/gift-ideas/{teamMember}, as server-sent events: each gift idea is sent as
+    soon as it's written, instead of once the pipeline is done (see stream_gift_ideas).
+
+    Args:
+        teamMember: The team member to get gift ideas for
+
+    Returns:
+        A text/event-stream of "status", "idea", and "done" or "error" events
+    """
+    model_name = get_gift_ideas_model(teamMember)
+    return StreamingResponse(
+        stream_gift_ideas(teamMember, model_name),
+        media_type="text/event-stream",
+        # Proxies must not hold the events back
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def stream_gift_ideas_batch(teamMembers: List[str], model_name: str) -> AsyncIterator[str]:
+    """
+    Come up with gift ideas for several team members, as server-sent events: a "giftIdeas"
+    event for each team member as soon as theirs are ready (or an "error" event with their
+    name), and then a "done" event.
+
+    The interests of the members that have no up to date profile are worked out first, with
+    the context of all of them retrieved at once (see refresh_interest_profiles). The gift
+    ideas are then worked out GIFT_IDEAS_BATCH_CONCURRENCY members at a time, through the
+    gift ideas cache, so the pipeline finds every interest profile ready.
+    """
+    if interest_profiles is not None:
+        yield format_sse("status", {"step": "interests"})
+        await refresh_interest_profiles(
+            interest_profiles, vector_store_retriever, GIFT_IDEAS_BATCH_CONCURRENCY, members=teamMembers
+        )
+
+    yield format_sse("status", {"step": "ideas"})
+    semaphore = asyncio.Semaphore(GIFT_IDEAS_BATCH_CONCURRENCY)
+
+    async def suggest(teamMember: str) -> list:
+        async with semaphore:
+            return await gift_ideas_cache.get_or_compute(
+                get_gift_ideas_key(teamMember, model_name),
+                partial(suggest_gift_ideas, teamMember, model_name)
+            )
+
+    tasks = [asyncio.ensure_future(suggest(teamMember)) for teamMember in teamMembers]
+    pending = dict(zip(tasks, teamMembers))
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                teamMember = pending.pop(task)
+                try:
+                    gift_ideas = task.result()
+                except HTTPException as e:
+                    yield format_sse("error", {"teamMember": teamMember, "detail": e.detail})
+                except Exception as e:
+                    print(f"Error suggesting gift ideas for {teamMember}: {e}")
+                    yield format_sse("error", {"teamMember": teamMember, "detail": "Failed to suggest gift ideas"})
+                else:
+                    yield format_sse("giftIdeas", {"teamMember": teamMember, "giftIdeas": gift_ideas})
+    finally:
+        # The client went away: the members left are not worked out
+        for task in pending:
+            task.cancel()
+    yield format_sse("done", {"teamMembers": teamMembers})
+
+
+@app.post("/api/gift-ideas", dependencies=[Depends(require_ready)])
+async def get_gift_ideas_batch(
+    teamMembers: List[str] = Body(..., embed=True, description="The team members to get gift ideas for")
+):
+    """
+    Get gift ideas for several team members at once, e.g. the whole team, as server-sent
+    events (see stream_gift_ideas_batch).
+
+    Args:
+        teamMembers: The team members to get gift ideas for
+
+    Returns:
+        A text/event-stream with a "giftIdeas" event (teamMember and giftIdeas) for each
+        team member as soon as theirs are ready, and a final "done" event
+    """
+    teamMembers = list(dict.fromkeys(teamMembers))
+    if not teamMembers:
+        raise HTTPException(status_code=400, detail="At least one team member is required")
+    model_name = get_gift_ideas_model(teamMembers[0])
+    for teamMember in teamMembers[1:]:
+        get_gift_ideas_model(teamMember)
+
+    return StreamingResponse(
+        stream_gift_ideas_batch(teamMembers, model_name),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/api/teamMembers")
 async def get_team_members():
     """
-    Get the list of valid team members.
+    Get the list of valid team members: everyone that talks in the chat exports. While the
+    application is starting, it answers as soon as the exports are read.
     
     Returns:
         List of valid team members
     """
-    return {"teamMembers": VALID_TEAM_MEMBERS}
+    catalog = await asyncio.to_thread(get_catalog)
+    return {"teamMembers": catalog.member_names()}
+
+@app.get("/api/stats", dependencies=[Depends(require_ready)])
+async def get_stats():
+    """
+    Get the hits, misses and hit rate of the embedding and gift ideas caches, and how many
+    interest profiles are ready.
+
+    Returns:
+        The stats of the query and document embedding caches, of the gift ideas cache and of
+        the interest profiles
+    """
+    return {
+        "embeddingCaches": get_cache_stats(vector_store_retriever.vectorstore.embeddings),
+        "giftIdeasCache": gift_ideas_cache.stats(),
+        "interestProfiles": interest_profiles.stats() if interest_profiles else None,
+    }
+
+@app.get("/healthz")
+async def healthz():
+    """
+    Liveness probe: fails only if the application couldn't initialize, so it can be
+    restarted. It doesn't wait for the initialization.
+    """
+    if get_readiness() == "failed":
+        return JSONResponse(status_code=503, content={"status": "failed"})
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness probe: succeeds once the conversations index is ready and gift ideas can be
+    suggested (see get_readiness).
+    """
+    readiness = get_readiness()
+    if readiness != "ready":
+        return JSONResponse(
+            status_code=503,
+            content={"status": readiness},
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)} if readiness == "starting" else None,
+        )
+    return {"status": "ready"}
 
 # Determine the frontend build directory 
 # If in Docker, the frontend build is at /app/frontend/build
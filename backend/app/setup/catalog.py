@@ -0,0 +1,185 @@
+import os
+import json
+import glob
+import hashlib
+from typing import Dict, List, Optional, Tuple
+from app.utils.messages import MessageTable
+
+DEFAULT_DATA_DIR = "app/data"
+DEFAULT_CATALOG_PATH = ".cache/catalog.json"
+
+# Chat exports are the text files of the data directory
+EXPORT_PATTERN = "*.txt"
+
+
+def get_data_dir() -> str:
+    """Directory the chat exports are discovered in, from DATA_DIR ("app/data" by default)."""
+    return os.getenv("DATA_DIR", DEFAULT_DATA_DIR)
+
+
+def get_catalog_path() -> str:
+    """
+    File the catalog is saved to, from CATALOG_PATH (".cache/catalog.json" by default). An
+    empty CATALOG_PATH keeps the catalog in memory only.
+    """
+    return os.getenv("CATALOG_PATH", DEFAULT_CATALOG_PATH)
+
+
+def file_digest(filepath: str) -> str:
+    """SHA-256 of the content of a file."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ExportCatalog:
+    """
+    Catalog of the chat exports in a directory and of the people that talk in them.
+
+    Each export is parsed once to find its senders, and only parsed again when its size or
+    modification time change. The catalog can be saved so restarts only look at new or
+    changed files.
+    """
+
+    def __init__(self, data_dir: str, timestamp_regex: str, date_format: str, path: Optional[str] = None):
+        """
+        Args:
+            data_dir (str): Directory of the chat exports
+            timestamp_regex (str): Regex pattern to match timestamps in the exports
+            date_format (str): Format string for parsing the dates of the timestamps
+            path (Optional[str]): File the catalog is saved to, None to keep it in memory only
+        """
+        self.data_dir = data_dir
+        self.timestamp_regex = timestamp_regex
+        self.date_format = date_format
+        self.path = path
+        # Exports by path: size, mtime_ns, sha256, senders and number of messages
+        self.exports: Dict[str, dict] = {}
+        # Exports each member talks in, by name
+        self.members: Dict[str, List[str]] = {}
+
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                if saved.get("timestamp_regex") == timestamp_regex and saved.get("date_format") == date_format:
+                    self.exports = saved.get("exports", {})
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+        self._index_members()
+
+    def _index_members(self) -> None:
+        self.members = {}
+        for filepath in sorted(self.exports):
+            for sender in self.exports[filepath]["senders"]:
+                self.members.setdefault(sender, []).append(filepath)
+
+    def refresh(self) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Look for new, changed and deleted exports in the data directory.
+
+        Returns:
+            Tuple[List[str], List[str], List[str]]: Paths of the added, changed and removed exports
+        """
+        added, changed = [], []
+        found = set()
+        for filepath in sorted(glob.glob(os.path.join(self.data_dir, EXPORT_PATTERN))):
+            found.add(filepath)
+            stat = os.stat(filepath)
+            entry = self.exports.get(filepath)
+            if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                continue
+
+            table = MessageTable(filepath, self.timestamp_regex, self.date_format)
+            self.exports[filepath] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": hashlib.sha256(table.source).hexdigest(),
+                "senders": table.sender_names,
+                "messages": len(table),
+            }
+            (changed if entry else added).append(filepath)
+
+        removed = [filepath for filepath in self.exports if filepath not in found]
+        for filepath in removed:
+            del self.exports[filepath]
+
+        if added or changed or removed:
+            self._index_members()
+        return added, changed, removed
+
+    def save(self) -> None:
+        """Save the catalog to its file, if it has one."""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "timestamp_regex": self.timestamp_regex,
+                "date_format": self.date_format,
+                "exports": self.exports,
+            }, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+    @property
+    def files(self) -> List[str]:
+        """Paths of the exports, sorted."""
+        return sorted(self.exports)
+
+    def member_names(self) -> List[str]:
+        """Names of everyone that talks in the exports, sorted."""
+        return sorted(self.members)
+
+    def has_member(self, name: str) -> bool:
+        return name in self.members
+
+    def files_of(self, name: str) -> List[str]:
+        """Paths of the exports a member talks in."""
+        return self.members.get(name, [])
+
+    def digest(self, filepath: str) -> str:
+        """SHA-256 of an export, without reading it again if the catalog is up to date."""
+        entry = self.exports.get(filepath)
+        if entry:
+            stat = os.stat(filepath)
+            if entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                return entry["sha256"]
+        return file_digest(filepath)
+
+
+def load_catalog(timestamp_regex: str, date_format: str, data_dir: Optional[str] = None, path: Optional[str] = None) -> ExportCatalog:
+    """
+    Load the catalog of the chat exports and bring it up to date with the data directory.
+
+    Args:
+        timestamp_regex (str): Regex pattern to match timestamps in the exports
+        date_format (str): Format string for parsing the dates of the timestamps
+        data_dir (Optional[str]): Directory of the chat exports (see get_data_dir)
+        path (Optional[str]): File the catalog is saved to (see get_catalog_path)
+
+    Returns:
+        ExportCatalog: The up to date catalog
+    """
+    catalog = ExportCatalog(
+        data_dir if data_dir is not None else get_data_dir(),
+        timestamp_regex,
+        date_format,
+        path if path is not None else get_catalog_path()
+    )
+    added, changed, removed = catalog.refresh()
+    if added or changed or removed:
+        catalog.save()
+
+    if os.getenv("DEBUG", "false").lower() == "true":
+        print(f"Catalog: {len(catalog.exports)} exports ({len(added)} new, {len(changed)} changed, {len(removed)} removed), {len(catalog.members)} members")
+    return catalog
+
+
+if __name__ == "__main__":
+    # Example usage
+    catalog = load_catalog(r"\[(\d{1,2}/\d{1,2}/\d{2}), \d{1,2}:\d{2}:\d{2}(?:.AM|.PM)?\]", "%d/%m/%y", path="")
+    for name in catalog.member_names():
+        print(f"{name}: {len(catalog.files_of(name))} exports")
@@ -0,0 +1,190 @@
+import os
+import json
+import asyncio
+import hashlib
+from typing import Callable, Dict, List, Optional
+from langchain.prompts import ChatPromptTemplate
+from langchain_core.language_models import BaseChatModel
+from langchain_core.output_parsers import StrOutputParser
+from app.utils.chunks import getFirstChunkFromFile
+from app.utils.llm import get_chat_model
+from app.utils.mocks import MockCompanyCultureModel
+
+DEFAULT_CULTURE_PATH = ".cache/culture.json"
+DEFAULT_CULTURE_CONCURRENCY = 4
+
+COMPANY_CULTURE_PROMPT = """\
+    Eres un psicólogo experto en psicología laboral. Se necesita que analices las siguientes conversaciones con el objetivo de resumir el tipo de cultura que se observa en la empresa. Enfocate en los aspectos positivos de la cultura de la empresa y obvia los aspectos negativos. Resume el ambiente de la empresa en una oración.
+
+    ### Conversaciones
+    {conversations}
+    """
+
+COMBINED_CULTURE_PROMPT = """\
+    Eres un psicólogo experto en psicología laboral. Los siguientes son resúmenes de la cultura que se observa en la empresa, cada uno de una conversación distinta. Combínalos para resumir el tipo de cultura de la empresa. Enfocate en los aspectos positivos de la cultura de la empresa y obvia los aspectos negativos. Resume el ambiente de la empresa en una oración.
+
+    ### Resúmenes
+    {summaries}
+    """
+
+
+def get_culture_path() -> str:
+    """
+    File the company culture summary is saved to, from CULTURE_PATH (".cache/culture.json" by
+    default, next to the index). An empty CULTURE_PATH keeps it in memory only.
+    """
+    return os.getenv("CULTURE_PATH", DEFAULT_CULTURE_PATH)
+
+
+def get_culture_chat_model(model: str) -> BaseChatModel:
+    """Chat model the culture is summarized with: a mock one in development."""
+    if os.getenv("ENV", "development").lower() == "development":
+        return MockCompanyCultureModel()
+    return get_chat_model(model)
+
+
+def digest(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class CompanyCulture:
+    """
+    Summary of the company culture, built hierarchically: a summary of the first day of each
+    chat export, and a combined one of all of them.
+
+    The summary of an export is only valid for the chunk it was made from (and the model and
+    prompt), and the combined one for the summaries it was made from, so only the exports
+    whose first day changed are summarized again.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path (Optional[str]): File the summaries are saved to, None to keep them in memory only
+        """
+        self.path = path
+        # Summary of each export by path: the SHA-256 of the export, of the model and prompt,
+        # and of its first day
+        self.files: Dict[str, dict] = {}
+        # Combined summary and the version of the summaries it was made from
+        self.combined: Optional[dict] = None
+
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                self.files = saved.get("files", {})
+                self.combined = saved.get("combined")
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+
+    @property
+    def summary(self) -> Optional[str]:
+        """The combined summary, as of the last time it was brought up to date."""
+        return self.combined["summary"] if self.combined else None
+
+    def save(self) -> None:
+        """Save the summaries to their file, if they have one."""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files, "combined": self.combined}, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
+
+
+def load_company_culture(path: Optional[str] = None) -> CompanyCulture:
+    """Load the saved company culture summary (see get_culture_path)."""
+    return CompanyCulture(path if path is not None else get_culture_path())
+
+
+async def refresh_company_culture(culture: CompanyCulture, model: str, data_files: List[str], timestamp_regex: str,
+                                  date_format: str, file_digest: Callable[[str], str],
+                                  concurrency: int = DEFAULT_CULTURE_CONCURRENCY) -> Optional[str]:
+    """
+    Bring the company culture summary up to date with the chat exports: summarize the first
+    day of the exports that were added or whose first day changed, a few at a time, and
+    combine the summaries again if any of them changed.
+
+    Args:
+        culture (CompanyCulture): The summaries to bring up to date
+        model (str): Name of the chat model
+        data_files (List[str]): Paths of the chat exports
+        timestamp_regex (str): Regex pattern to match the timestamps of the messages
+        date_format (str): Format of the dates of the messages
+        file_digest (Callable[[str], str]): SHA-256 of an export (e.g. ExportCatalog.digest)
+        concurrency (int): Exports summarized at the same time
+
+    Returns:
+        Optional[str]: The combined summary, None if no export has messages
+    """
+    chat_model = get_culture_chat_model(model)
+    config = digest(model, type(chat_model).__name__, COMPANY_CULTURE_PROMPT)
+    files = {filepath: entry for filepath, entry in culture.files.items() if filepath in data_files}
+
+    # Exports that changed are read again, but only summarized again if their first day did
+    changed = {}
+    for filepath in data_files:
+        entry = files.get(filepath)
+        sha256 = file_digest(filepath)
+        if entry is None or entry["sha256"] != sha256 or entry["config"] != config:
+            changed[filepath] = sha256
+
+    def read_first_days() -> Dict[str, Optional[List[str]]]:
+        first_days = {}
+        for filepath in changed:
+            try:
+                first_days[filepath] = getFirstChunkFromFile(filepath, timestamp_regex, date_format, "day")
+            except ValueError:
+                # No messages in the export
+                first_days[filepath] = None
+        return first_days
+
+    first_days = await asyncio.to_thread(read_first_days)
+    summarize_chain = ChatPromptTemplate.from_template(COMPANY_CULTURE_PROMPT) | chat_model | StrOutputParser()
+    semaphore = asyncio.Semaphore(concurrency)
+    summarized = []
+
+    async def summarize(filepath: str, lines: List[str]) -> None:
+        chunk = digest(lines)
+        entry = files.get(filepath)
+        if entry is None or entry["chunk"] != chunk or entry["config"] != config:
+            async with semaphore:
+                summary = await summarize_chain.ainvoke({"conversations": "\n".join(lines)})
+            summarized.append(filepath)
+        else:
+            summary = entry["summary"]
+        files[filepath] = {"sha256": changed[filepath], "config": config, "chunk": chunk, "summary": summary}
+
+    for filepath, lines in first_days.items():
+        if lines is None:
+            files.pop(filepath, None)
+    results = await asyncio.gather(
+        *(summarize(filepath, lines) for filepath, lines in first_days.items() if lines is not None),
+        return_exceptions=True
+    )
+    culture.files = files
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        # The exports summarized so far are kept for the next time
+        culture.save()
+        raise errors[0]
+
+    # A single summary needs no combining
+    summaries = [files[filepath]["summary"] for filepath in sorted(files)]
+    version = digest(model, type(chat_model).__name__, COMBINED_CULTURE_PROMPT, summaries)
+    if not summaries:
+        culture.combined = None
+    elif culture.combined is None or culture.combined["version"] != version:
+        if len(summaries) == 1:
+            summary = summaries[0]
+        else:
+            combine_chain = ChatPromptTemplate.from_template(COMBINED_CULTURE_PROMPT) | chat_model | StrOutputParser()
+            summary = await combine_chain.ainvoke({"summaries": "\n".join(f"- {summary}" for summary in summaries)})
+        culture.combined = {"version": version, "summary": summary}
+    culture.save()
+
+    if os.getenv("DEBUG", "false").lower() == "true":
+        print(f"Company culture: {len(summarized)} of {len(files)} exports summarized, {len(changed)} read again")
+    return culture.summary
@@ -1,44 +1,279 @@
 import os
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from app.utils.mocks import MockCompanyCultureModel
-from app.utils.chunks import getFirstChunkFromFile
-from langchain_community.vectorstores.qdrant import Qdrant
+import asyncio
+import threading
+from typing import Generator, Optional
 from langchain_cohere import CohereEmbeddings
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
-from app.utils.chunks import chunkTimeStampedFile
-
-async def get_company_culture(model: str, data_files: list[str]):
-    if os.getenv("ENV", "development").lower() == "development":
-        openai_chat_model = MockCompanyCultureModel()
-    else:
-        openai_chat_model = ChatOpenAI(model=model)
-
-    # Get first chunk from each file and join them
-    conversations = "\n".join(
-        line
-        for file in data_files
-        for chunk in [getFirstChunkFromFile(
-            file,
-            r"\[(\d{1,2}/\d{1,2}/\d{2}), \d{1,2}:\d{2}:\d{2}(?:.AM|.PM)?\]",
-            "%d/%m/%y",
-            "day"
-        )]
-        for line in chunk
-    )
-
-    COMPANY_CULTURE_PROMPT = """\
-    Eres un psicólogo experto en psicología laboral. Se necesita que analices las siguientes conversaciones con el objetivo de resumir el tipo de cultura que se observa en la empresa. Enfocate en los aspectos positivos de la cultura de la empresa y obvia los aspectos negativos. Resume el ambiente de la empresa en una oración.
-
-    ### Conversaciones
-    {conversations}
+from app.utils.chunks import chunkAppendedLines, chunkFiles
+from app.utils.messages import clearMessageTables, getSenders
+from app.utils.blocks import splitBlocks
+from app.utils.embeddings import cache_embeddings, cache_queries, get_cache_stats
+from app.utils.local_embeddings import get_local_embeddings, is_local_model
+from app.utils.retrievers import HybridRetriever
+from app.setup.catalog import ExportCatalog, load_catalog
+from app.setup.culture import CompanyCulture, refresh_company_culture
+from app.setup.index import (
+    build_index, get_index_dir, get_index_fingerprint, get_keyword_index, get_numpy_store, open_index, read_manifest, read_watermarks,
+    update_index, write_watermarks
+)
+
+# TODO:In real life, this content would come from emails, chats or transcripts. For now, the
+# chat exports are discovered in DATA_DIR (see get_catalog).
+COLLECTION_NAME = "overlapped_conversations"
+
+# How the chat exports are split into chunks
+TIMESTAMP_REGEX = r"\[(\d{1,2}/\d{1,2}/\d{2}), \d{1,2}:\d{2}:\d{2}(?:.AM|.PM)?\]"
+DATE_FORMAT = "%d/%m/%y"
+CHUNK_INTERVAL = "week"
+CHUNK_OVERLAP = 2
+
+# Chunk sizes when chunking by tokens (see get_chunking_config)
+DEFAULT_CHUNK_MIN_TOKENS = 300
+DEFAULT_CHUNK_MAX_TOKENS = 1200
+DEFAULT_CHUNK_OVERLAP_MESSAGES = 5
+
+_catalog = None
+# The catalog is loaded from worker threads, by whichever needs it first
+_catalog_lock = threading.Lock()
+_index_version = None
+
+def get_catalog(refresh: bool = False) -> ExportCatalog:
+    """
+    Catalog of the chat exports in DATA_DIR and the team members that talk in them, loaded
+    the first time it's needed (see load_catalog). Concurrent callers wait for the same load,
+    so call it from a worker thread while serving requests.
+
+    Args:
+        refresh (bool): Whether to look for new, changed or deleted exports again
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = load_catalog(TIMESTAMP_REGEX, DATE_FORMAT)
+        elif refresh:
+            added, changed, removed = _catalog.refresh()
+            if added or changed or removed:
+                _catalog.save()
+        return _catalog
+
+
+def get_index_version() -> Optional[str]:
+    """
+    Version of the conversations the retriever searches: changes with the chat exports, and
+    the configuration they are chunked, embedded and retrieved with. None until the retriever
+    is created (see get_conversations_retriever).
+    """
+    return _index_version
+
+
+async def get_company_culture(culture: CompanyCulture, model: str, data_files: list[str]) -> Optional[str]:
+    """
+    Bring the company culture summary up to date with the chat exports (see
+    refresh_company_culture): only the exports whose first day changed are summarized again.
+
+    Args:
+        culture (CompanyCulture): The saved summaries (see load_company_culture)
+        model (str): Name of the chat model
+        data_files (list[str]): Paths of the chat exports
+
+    Returns:
+        Optional[str]: The summary of the company culture
     """
+    return await refresh_company_culture(culture, model, data_files, TIMESTAMP_REGEX, DATE_FORMAT, get_catalog().digest)
+
+
+def get_chunking_workers() -> int:
+  """
+  Processes used to chunk the chat exports, from CHUNKING_WORKERS (1 by default, "auto" for
+  one per CPU).
+  """
+  workers = os.getenv("CHUNKING_WORKERS", "1")
+  if workers.lower() == "auto":
+    return os.cpu_count() or 1
+  return int(workers)
+
+
+def get_chunking_config() -> dict:
+  """
+  How the chat exports are split, from CHUNKING_MODE: "calendar" (the default) makes one chunk
+  per CHUNK_INTERVAL overlapping CHUNK_OVERLAP days, "tokens" starts from the same intervals
+  but splits or merges them to stay between CHUNK_MIN_TOKENS and CHUNK_MAX_TOKENS, overlapping
+  CHUNK_OVERLAP_MESSAGES messages.
+
+  Returns:
+      dict: The chunking options, which are also part of the index fingerprint
+  """
+  mode = os.getenv("CHUNKING_MODE", "calendar").lower()
+  if mode == "calendar":
+    return {"mode": mode, "interval": CHUNK_INTERVAL, "overlap": CHUNK_OVERLAP}
+
+  if mode != "tokens":
+    raise ValueError("CHUNKING_MODE must be one of: 'calendar', 'tokens'")
+
+  return {
+      "mode": mode,
+      "interval": CHUNK_INTERVAL,
+      "min_tokens": int(os.getenv("CHUNK_MIN_TOKENS", DEFAULT_CHUNK_MIN_TOKENS)),
+      "max_tokens": int(os.getenv("CHUNK_MAX_TOKENS", DEFAULT_CHUNK_MAX_TOKENS)),
+      "overlap": int(os.getenv("CHUNK_OVERLAP_MESSAGES", DEFAULT_CHUNK_OVERLAP_MESSAGES)),
+      "overlap_unit": "messages",
+  }
+
+
+def get_chunk_metadata(filepath: str, window: Optional[int], start, end, lines: list[str]) -> dict:
+  """
+  Metadata stored with a chunk, so searches can be narrowed down to what someone said.
+
+  Args:
+      filepath (str): Path to the chat export of the chunk
+      window (Optional[int]): Number of the calendar interval of the chunk, None if it's not a calendar chunk
+      start (datetime): Start date of the chunk
+      end (datetime): End date of the chunk
+      lines (list[str]): Lines of the chunk
+
+  Returns:
+      dict: The name of the chat export as "source", "window", the "start" and "end" dates in
+          ISO format, and everyone that sends a message in the chunk as "participants"
+  """
+  metadata = {
+      "source": os.path.basename(filepath),
+      "start": start.isoformat(),
+      "end": end.isoformat(),
+      "participants": getSenders(lines, TIMESTAMP_REGEX),
+  }
+  if window is not None:
+      metadata["window"] = window
+  return metadata
+
+
+def get_conversation_chunks(data_files: list[str], chunking: Optional[dict] = None,
+                            watermarks: Optional[dict] = None) -> Generator[tuple[list[str], list[dict]], None, None]:
+  """
+  Split chat exports into overlapping chunks of text (see get_chunking_config), on a process
+  pool when CHUNKING_WORKERS is more than 1.
+
+  Args:
+      data_files (list[str]): Paths to the chat exports
+      chunking (Optional[dict]): Chunking options, from get_chunking_config by default
+      watermarks (Optional[dict]): Where to put the watermark of each file, by name, so lines
+          appended later can be chunked on their own (calendar chunks only)
+
+  Yields:
+      tuple[list[str], list[dict]]: Text of every non-empty chunk of each file, in the order of
+          the files, with their metadata (see get_chunk_metadata)
+  """
+  chunking = chunking or get_chunking_config()
+  calendar = chunking["mode"] == "calendar"
+  token_budget = None if calendar else (chunking["min_tokens"], chunking["max_tokens"])
+  # The workers take the watermarks from the files they parse, with the digests of the catalog
+  catalog = get_catalog()
+  digests = {filepath: catalog.digest(filepath) for filepath in data_files} if calendar and watermarks is not None else None
+
+  for filepath, result in chunkFiles(
+      data_files,
+      TIMESTAMP_REGEX,
+      DATE_FORMAT,
+      chunking["interval"],
+      chunking["overlap"],
+      get_chunking_workers(),
+      tokenBudget=token_budget,
+      overlapUnit=chunking.get("overlap_unit", "messages"),
+      digests=digests
+  ):
+      if digests is not None:
+          file_chunks, watermarks[os.path.basename(filepath)] = result.result()
+      else:
+          file_chunks = result.result()
 
-    company_culture_prompt = ChatPromptTemplate.from_template(COMPANY_CULTURE_PROMPT)
-    company_culture_chain = company_culture_prompt | openai_chat_model
-    
-    return await company_culture_chain.ainvoke({"conversations": conversations})
+      chunks = []
+      metadatas = []
+      for i, (start, end, lines) in enumerate(file_chunks):
+          if len(lines) > 0:
+              chunks.append("".join(lines))
+              metadatas.append(get_chunk_metadata(filepath, i if calendar else None, start, end, lines))
+
+      if os.getenv("DEBUG", "false").lower() == "true":
+          print(f"Adding {len(chunks)} chunks from {filepath}")
+      yield chunks, metadatas
+
+
+def get_appended_chunks(filepath: str, chunking: dict, watermarks: dict, indexed: dict) -> Optional[tuple[list[int], tuple[list[str], list[dict]]]]:
+  """
+  Chunk only what was appended to a chat export since it was indexed (see chunkAppendedLines).
+
+  Args:
+      filepath (str): Path to the chat export
+      chunking (dict): Chunking options (see get_chunking_config)
+      watermarks (dict): Watermarks of the indexed files by name, updated with the new one
+      indexed (dict): SHA-256 of the indexed files, by name
+
+  Returns:
+      Optional[tuple[list[int], tuple[list[str], list[dict]]]]: The windows whose chunks are stale
+          and the chunks replacing them with their metadata, or None if the export has to be
+          chunked again
+  """
+  name = os.path.basename(filepath)
+  watermark = watermarks.get(name)
+  if chunking["mode"] != "calendar" or not watermark or watermark["sha256"] != indexed.get(name):
+    return None
+
+  result = chunkAppendedLines(filepath, TIMESTAMP_REGEX, DATE_FORMAT, chunking["interval"], chunking["overlap"], watermark)
+  if result is None:
+    return None
+
+  stale, chunks, watermarks[name] = result
+  chunks = [chunk for chunk in chunks if len(chunk[3]) > 0]
+  if os.getenv("DEBUG", "false").lower() == "true":
+    print(f"Replacing {len(stale)} chunks with {len(chunks)} from the tail of {filepath}")
+  return stale, (
+      ["".join(lines) for i, start, end, lines in chunks],
+      [get_chunk_metadata(filepath, i, start, end, lines) for i, start, end, lines in chunks]
+  )
+
+
+def get_chunk_embedding() -> str:
+  """
+  How chunks are embedded, from CHUNK_EMBEDDING: "full" (the default) embeds the text of each
+  chunk, "pooled" embeds the blocks chunks are made of only once and pools their vectors
+  into the vector of each chunk (see ingest_pooled_chunks). Pooling saves embedding the
+  overlap of the chunks over and over, at the cost of coarser chunk vectors.
+  """
+  mode = os.getenv("CHUNK_EMBEDDING", "full").lower()
+  if mode not in {"full", "pooled"}:
+    raise ValueError("CHUNK_EMBEDDING must be one of: 'full', 'pooled'")
+  return mode
+
+
+def get_conversation_blocks(data_files: list[str], chunking: Optional[dict] = None,
+                            watermarks: Optional[dict] = None) -> Generator[tuple[list[list[str]], list[dict]], None, None]:
+  """
+  Same as get_conversation_chunks, with every chunk split into its blocks (see splitBlocks).
+  """
+  for chunks, metadatas in get_conversation_chunks(data_files, chunking, watermarks):
+      yield [splitBlocks(chunk, TIMESTAMP_REGEX) for chunk in chunks], metadatas
+
+
+def get_retrieval_mode() -> str:
+  """
+  How chunks are retrieved, from RETRIEVAL_MODE: "vector" (the default) by the similarity of
+  their vectors, "hybrid" by fusing it with a BM25 keyword search (see HybridRetriever), which
+  catches chunks that mention the exact names or words of a question.
+  """
+  mode = os.getenv("RETRIEVAL_MODE", "vector").lower()
+  if mode not in {"vector", "hybrid"}:
+    raise ValueError("RETRIEVAL_MODE must be one of: 'vector', 'hybrid'")
+  return mode
+
+
+def get_vector_store_backend() -> str:
+  """
+  What searches the chunks, from VECTOR_STORE: "qdrant" (the default) or "numpy", an exact
+  search over a NumPy copy of the index (see NumpyVectorStore), which
+  VECTOR_STORE_QUANTIZE=true quantizes to int8. The index itself is always kept in Qdrant.
+  """
+  backend = os.getenv("VECTOR_STORE", "qdrant").lower()
+  if backend not in {"qdrant", "numpy"}:
+    raise ValueError("VECTOR_STORE must be one of: 'qdrant', 'numpy'")
+  return backend
 
 
 async def get_conversations_retriever(data_files: list[str], collection_name: str, k: int):
@@ -46,57 +281,141 @@ async def get_conversations_retriever(data_files: list[str], collection_name: st
   embedding_dim = os.getenv("EMBEDDING_DIM")
   cohere_api_key=os.getenv("COHERE_API_KEY")
 
-  timeStampRegex = r"\[(\d{1,2}/\d{1,2}/\d{2}), \d{1,2}:\d{2}:\d{2}(?:.AM|.PM)?\]"
-  dateRegex = "%d/%m/%y"
-  interval = "week"
-  overlap = 2
-
   if not model_name:
     raise ValueError("EMBEDDING_MODEL environment variable not set")
 
-  if not embedding_dim:
+  # A local model knows its own dimension and needs no API key
+  local = is_local_model(model_name)
+
+  if not embedding_dim and not local:
     raise ValueError("EMBEDDING_DIM environment variable not set")
 
-  if not cohere_api_key:
+  if not cohere_api_key and not local:
     raise ValueError("COHERE_API_KEY environment variable not set")
 
   try:
-      # Use Cohere embeddings (default model is multilingual: embed-multilingual-v3.0)
-      embedding_model = CohereEmbeddings(
-          model=model_name,
-          cohere_api_key=cohere_api_key
-      )
+      if local:
+          # Serve the (fine-tuned) SentenceTransformer model in-process
+          base_embeddings = await asyncio.to_thread(get_local_embeddings, model_name)
+          if embedding_dim and int(embedding_dim) != base_embeddings.dimension:
+              raise ValueError(f"EMBEDDING_DIM is {embedding_dim} but {model_name} has dimension {base_embeddings.dimension}")
+          embedding_dim = base_embeddings.dimension
+          # The weights are part of the name, so the cached vectors and the index of a
+          # retrained model at the same path aren't reused
+          model_name = ":".join(filter(None, [
+              model_name, base_embeddings.backend, "int8" if base_embeddings.quantize else None, base_embeddings.digest
+          ]))
+      else:
+          # Convert embedding_dim to integer
+          embedding_dim = int(embedding_dim)
 
-      # Convert embedding_dim to integer
-      embedding_dim = int(embedding_dim)
-      
-      client = QdrantClient(":memory:")
-      client.create_collection(
-          collection_name=collection_name,
-          vectors_config=VectorParams(size=embedding_dim, distance=Distance.COSINE),
-      )
+          # Use Cohere embeddings (default model is multilingual: embed-multilingual-v3.0)
+          base_embeddings = CohereEmbeddings(
+              model=model_name,
+              cohere_api_key=cohere_api_key
+          )
 
-      vector_store = Qdrant(
-          client=client,
-          collection_name=collection_name,
-          embeddings=embedding_model,
+      # Reuse the vectors of chunks that were already embedded in a previous run, and of
+      # the queries that were already asked
+      embedding_model = cache_queries(
+          cache_embeddings(base_embeddings, model_name, embedding_dim),
+          model_name,
+          embedding_dim
       )
-      
-      for filepath in data_files:  
-          chunks = []
-          for i, (start, end, lines) in enumerate(chunkTimeStampedFile(
-              filepath, timeStampRegex, dateRegex, interval, overlap
-          )):
-              if (len(lines) > 0):
-                  chunk = "".join(lines)
-                  chunks.append(chunk)
-          
+
+      # Open the persisted index if it was built with the same configuration
+      index_dir = get_index_dir()
+      chunking = get_chunking_config()
+      config = {
+          "embedding_model": model_name,
+          "embedding_dim": embedding_dim,
+          "timestamp_regex": TIMESTAMP_REGEX,
+          "date_format": DATE_FORMAT,
+          "chunking": chunking,
+          "chunk_embedding": get_chunk_embedding(),
+      }
+      pooled = config["chunk_embedding"] == "pooled"
+      fingerprint = get_index_fingerprint(config)
+      catalog = get_catalog()
+      files = {filepath: catalog.digest(filepath) for filepath in data_files}
+
+      global _index_version
+      _index_version = get_index_fingerprint({
+          **config,
+          "files": {os.path.basename(filepath): digest for filepath, digest in files.items()},
+          "retrieval_mode": get_retrieval_mode(),
+          "vector_store": get_vector_store_backend(),
+      })
+      get_chunks = get_conversation_blocks if pooled else get_conversation_chunks
+
+      vector_store = await asyncio.to_thread(open_index, index_dir, collection_name, embedding_model, fingerprint)
+
+      if vector_store is not None:
+          # Only the exports added or changed since the index was built are ingested, and
+          # the ones that only grew just have the chunks of their new lines replaced
+          indexed = read_manifest(index_dir).get("files", {})
+          watermarks = read_watermarks(index_dir)
+
+          def get_appended(filepath: str):
+              appended = get_appended_chunks(filepath, chunking, watermarks, indexed)
+              if appended is not None and pooled:
+                  stale, (chunks, metadatas) = appended
+                  return stale, ([splitBlocks(chunk, TIMESTAMP_REGEX) for chunk in chunks], metadatas)
+              return appended
+
+          changes = await update_index(
+              index_dir, vector_store, files, lambda paths: get_chunks(paths, chunking, watermarks), get_appended
+          )
+          if any(changes.values()):
+              names = {os.path.basename(filepath) for filepath in files}
+              write_watermarks(index_dir, {name: watermark for name, watermark in watermarks.items() if name in names})
+
+          if os.getenv("DEBUG", "false").lower() == "true":
+              print(f"Opened index from {index_dir}: {({change: len(paths) for change, paths in changes.items()})}")
+      else:
+          watermarks = {}
+          vector_store = await build_index(
+              index_dir,
+              collection_name,
+              embedding_model,
+              embedding_dim,
+              fingerprint,
+              config,
+              files,
+              get_chunks(data_files, chunking, watermarks),
+              pooled=pooled
+          )
+          if index_dir:
+              write_watermarks(index_dir, watermarks)
+
+      if os.getenv("DEBUG", "false").lower() == "true":
+          print(f"Embedding caches: {get_cache_stats(embedding_model)}")
+
+      keyword_index = await asyncio.to_thread(get_keyword_index, index_dir, vector_store) if get_retrieval_mode() == "hybrid" else None
+
+      if get_vector_store_backend() == "numpy":
+          quantized = os.getenv("VECTOR_STORE_QUANTIZE", "false").lower() == "true"
+          qdrant_store = vector_store
+          vector_store = await asyncio.to_thread(get_numpy_store, index_dir, qdrant_store, quantized)
+          # Searches no longer go through Qdrant
+          qdrant_store.client.close()
+
           if os.getenv("DEBUG", "false").lower() == "true":
-              print(f"Adding {len(chunks)} chunks from {filepath}")
-          vector_store.add_texts(chunks)
-      
+              print(f"NumPy vector store: {len(vector_store.ids)} vectors, {vector_store.nbytes / 1024:.0f} KiB")
+
+      if keyword_index is not None:
+          return HybridRetriever(
+              vectorstore=vector_store,
+              keyword_index=keyword_index,
+              search_kwargs={"k": k},
+              fetch_k=max(4 * k, 20)
+          )
+
       return vector_store.as_retriever(search_kwargs={"k": k})  
 
   except Exception as e:
       # Raise the exception instead of returning it as a string
       raise Exception(f"Error creating vector store retriever: {str(e)}")
+  finally:
+      # The exports parsed while ingesting aren't needed anymore
+      clearMessageTables()
@@ -0,0 +1,443 @@
+import os
+import sys
+import json
+import shutil
+import warnings
+import asyncio
+import hashlib
+import itertools
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores.qdrant import Qdrant
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, FieldCondition, Filter, FilterSelector, MatchAny, MatchValue, PayloadSchemaType, VectorParams
+from app.setup.ingestion import ingest_chunks, ingest_pooled_chunks
+from app.utils.blocks import BlockQdrant, BlockStore
+from app.utils.bm25 import BM25Index
+from app.utils.numpy_store import NumpyVectorStore
+
+# Bump when the layout of the index directory changes
+INDEX_FORMAT_VERSION = 2
+
+DEFAULT_INDEX_DIR = ".cache/index"
+MANIFEST_FILE = "manifest.json"
+QDRANT_DIR = "qdrant"
+BLOCKS_FILE = "blocks.sqlite"
+
+# Metadata fields searches and updates filter by
+INDEXED_FIELDS = {
+    "participants": PayloadSchemaType.KEYWORD,
+    "source": PayloadSchemaType.KEYWORD,
+    "window": PayloadSchemaType.INTEGER,
+}
+WATERMARKS_FILE = "watermarks.json"
+KEYWORDS_FILE = "bm25.npz"
+VECTORS_FILE = "vectors.npz"
+
+
+def get_index_dir() -> str:
+    """
+    Directory of the persisted index, from INDEX_DIR (".cache/index" by default). An empty
+    INDEX_DIR keeps the index in memory only.
+    """
+    return os.getenv("INDEX_DIR", DEFAULT_INDEX_DIR)
+
+
+def get_index_fingerprint(config: Dict[str, Any]) -> str:
+    """
+    Fingerprint of the chunking and embedding configuration of an index. The data files are
+    tracked separately (see update_index), so adding or changing one doesn't need a rebuild.
+
+    Args:
+        config (Dict[str, Any]): Chunking and embedding configuration (must be JSON serializable)
+
+    Returns:
+        str: Hex digest that changes whenever the index would have to be rebuilt
+    """
+    return hashlib.sha256(json.dumps({"version": INDEX_FORMAT_VERSION, **config}, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def read_manifest(index_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    Read the manifest of a persisted index.
+
+    Returns:
+        Optional[Dict[str, Any]]: The manifest, or None if there is no (readable) index
+    """
+    try:
+        with open(os.path.join(index_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_manifest(index_dir: str, manifest: Dict[str, Any]) -> None:
+    """Write the manifest of an index, replacing the previous one at once."""
+    temp_path = os.path.join(index_dir, f"{MANIFEST_FILE}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, os.path.join(index_dir, MANIFEST_FILE))
+
+
+def read_watermarks(index_dir: str) -> Dict[str, Any]:
+    """Watermarks of the data files of an index, by file name (see update_index)."""
+    try:
+        with open(os.path.join(index_dir, WATERMARKS_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_watermarks(index_dir: str, watermarks: Dict[str, Any]) -> None:
+    """Write the watermarks of the data files of an index, replacing the previous ones at once."""
+    temp_path = os.path.join(index_dir, f"{WATERMARKS_FILE}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(watermarks, f, ensure_ascii=False)
+    os.replace(temp_path, os.path.join(index_dir, WATERMARKS_FILE))
+
+
+def open_index(index_dir: str, collection_name: str, embeddings: Embeddings, fingerprint: str) -> Optional[Qdrant]:
+    """
+    Open a persisted index if it was built with the same configuration and data.
+
+    Args:
+        index_dir (str): Directory of the persisted index
+        collection_name (str): Name of the Qdrant collection
+        embeddings (Embeddings): Embeddings used to encode the queries
+        fingerprint (str): Expected fingerprint (see get_index_fingerprint)
+
+    Returns:
+        Optional[Qdrant]: The vector store, or None if the index is missing or out of date
+    """
+    if not index_dir:
+        return None
+
+    manifest = read_manifest(index_dir)
+    if not manifest or manifest.get("fingerprint") != fingerprint or manifest.get("collection_name") != collection_name:
+        return None
+
+    client = QdrantClient(path=os.path.join(index_dir, QDRANT_DIR))
+    if not client.collection_exists(collection_name):
+        client.close()
+        return None
+
+    if manifest.get("pooled"):
+        block_store = BlockStore(os.path.join(index_dir, BLOCKS_FILE))
+        return BlockQdrant(client=client, collection_name=collection_name, embeddings=embeddings, block_store=block_store)
+    return Qdrant(client=client, collection_name=collection_name, embeddings=embeddings)
+
+
+async def build_index(index_dir: str, collection_name: str, embeddings: Embeddings, embedding_dim: int,
+                      fingerprint: str, config: Dict[str, Any], files: Dict[str, str], chunks: Iterable[Any],
+                      pooled: bool = False) -> Qdrant:
+    """
+    Build an index and persist it, replacing the previous one.
+
+    The index is built next to the current one and only swapped in once it is complete, so
+    a failed build never leaves a broken index behind.
+
+    Args:
+        index_dir (str): Directory of the persisted index, empty to build it in memory only
+        collection_name (str): Name of the Qdrant collection
+        embeddings (Embeddings): Embeddings used to encode the chunks and the queries
+        embedding_dim (int): Dimension of the embeddings
+        fingerprint (str): Fingerprint of the configuration and data (see get_index_fingerprint)
+        config (Dict[str, Any]): Configuration the index is built with, stored in the manifest
+        files (Dict[str, str]): SHA-256 of the data files the index is built from, by path
+        chunks (Iterable[Any]): Batches of chunks to index with their metadata, e.g. one per file
+            (see ingest_chunks and ingest_pooled_chunks)
+        pooled (bool): Whether the chunks are embedded from their blocks (see ingest_pooled_chunks)
+
+    Returns:
+        Qdrant: The vector store, opened from its final location
+    """
+    staging_dir = f"{index_dir}.building" if index_dir else None
+    if staging_dir:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        os.makedirs(staging_dir)
+        client = QdrantClient(path=os.path.join(staging_dir, QDRANT_DIR))
+    else:
+        client = QdrantClient(":memory:")
+
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=VectorParams(size=embedding_dim, distance=Distance.COSINE),
+    )
+    with warnings.catch_warnings():
+        # Local Qdrant scans the payloads instead, and warns that it doesn't need the indexes
+        warnings.simplefilter("ignore")
+        for field, schema in INDEXED_FIELDS.items():
+            client.create_payload_index(collection_name, f"{Qdrant.METADATA_KEY}.{field}", field_schema=schema)
+    if pooled:
+        block_store = BlockStore(os.path.join(staging_dir, BLOCKS_FILE) if staging_dir else ":memory:")
+        vector_store = BlockQdrant(client=client, collection_name=collection_name, embeddings=embeddings, block_store=block_store)
+    else:
+        vector_store = Qdrant(client=client, collection_name=collection_name, embeddings=embeddings)
+
+    try:
+        if pooled:
+            await ingest_pooled_chunks(vector_store, chunks)
+        else:
+            await ingest_chunks(vector_store, chunks)
+    except BaseException:
+        client.close()
+        if pooled:
+            block_store.close()
+        raise
+
+    if not staging_dir:
+        return vector_store
+
+    count = client.count(collection_name).count
+    client.close()
+    if pooled:
+        block_store.close()
+
+    # The manifest goes in last: an index without one is never opened
+    write_manifest(staging_dir, {
+        "version": INDEX_FORMAT_VERSION,
+        "fingerprint": fingerprint,
+        "collection_name": collection_name,
+        "config": config,
+        "count": count,
+        "pooled": pooled,
+        "files": {os.path.basename(filepath): digest for filepath, digest in files.items()},
+    })
+
+    previous_dir = f"{index_dir}.previous"
+    shutil.rmtree(previous_dir, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.rename(index_dir, previous_dir)
+    os.rename(staging_dir, index_dir)
+    shutil.rmtree(previous_dir, ignore_errors=True)
+
+    return await asyncio.to_thread(open_index, index_dir, collection_name, embeddings, fingerprint)
+
+
+async def update_index(index_dir: str, vector_store: Qdrant, files: Dict[str, str], chunks: Callable[[List[str]], Iterable[Any]],
+                       append: Optional[Callable[[str], Optional[Tuple[List[int], Any]]]] = None) -> Dict[str, List[str]]:
+    """
+    Bring an opened index up to date with the data files, re-ingesting only the files that
+    were added or changed since it was built and dropping the chunks of the removed ones.
+
+    Chunks are matched to their file by the "source" field of their metadata (the name of the
+    file). Files that only grew can be updated in place through `append`, which replaces just
+    the chunks whose "window" field it reports as stale. The manifest is only updated once the
+    index is, so an interrupted update is done again the next time.
+
+    Args:
+        index_dir (str): Directory of the persisted index
+        vector_store (Qdrant): The opened index (see open_index)
+        files (Dict[str, str]): SHA-256 of the data files the index should hold, by path
+        chunks (Callable[[List[str]], Iterable[Any]]): Gets the batches of chunks of some files
+            with their metadata, as build_index takes them
+        append (Optional[Callable[[str], Optional[Tuple[List[int], Any]]]]): Gets the windows of a
+            changed file that are stale and the batch of chunks replacing them, or None if the
+            file has to be ingested again
+
+    Returns:
+        Dict[str, List[str]]: Paths of the files added, changed (and ingested again), appended
+            to and removed
+    """
+    manifest = read_manifest(index_dir)
+    indexed = manifest.get("files", {})
+    names = {os.path.basename(filepath): filepath for filepath in files}
+    payload_key = vector_store.metadata_payload_key
+
+    added = [filepath for name, filepath in names.items() if name not in indexed]
+    changed = [filepath for name, filepath in names.items() if name in indexed and indexed[name] != files[filepath]]
+    removed = [name for name in indexed if name not in names]
+
+    appended = {}
+    if append:
+        for filepath in changed:
+            result = await asyncio.to_thread(append, filepath)
+            if result is not None:
+                appended[filepath] = result
+        changed = [filepath for filepath in changed if filepath not in appended]
+
+    def delete(conditions: List[FieldCondition]) -> None:
+        vector_store.client.delete(
+            collection_name=vector_store.collection_name,
+            points_selector=FilterSelector(filter=Filter(must=conditions)),
+        )
+
+    stale = removed + [os.path.basename(filepath) for filepath in changed]
+    if stale:
+        await asyncio.to_thread(delete, [FieldCondition(key=f"{payload_key}.source", match=MatchAny(any=stale))])
+    for filepath, (windows, _) in appended.items():
+        if windows:
+            await asyncio.to_thread(delete, [
+                FieldCondition(key=f"{payload_key}.source", match=MatchValue(value=os.path.basename(filepath))),
+                FieldCondition(key=f"{payload_key}.window", match=MatchAny(any=windows)),
+            ])
+
+    if added or changed or appended:
+        batches = itertools.chain((batch for _, batch in appended.values()), chunks(added + changed))
+        if isinstance(vector_store, BlockQdrant):
+            await ingest_pooled_chunks(vector_store, batches)
+        else:
+            await ingest_chunks(vector_store, batches)
+
+    if isinstance(vector_store, BlockQdrant) and (stale or appended):
+        # Drop the blocks only the deleted chunks were made of
+        await asyncio.to_thread(prune_blocks, vector_store)
+
+    if stale or added or appended:
+        write_manifest(index_dir, {
+            **manifest,
+            "count": vector_store.client.count(vector_store.collection_name).count,
+            "files": {os.path.basename(filepath): digest for filepath, digest in files.items()},
+        })
+
+    return {"added": added, "changed": changed, "appended": list(appended), "removed": removed}
+
+
+def prune_blocks(vector_store: BlockQdrant) -> int:
+    """
+    Delete the blocks no chunk of a pooled index is made of anymore.
+
+    Returns:
+        int: Number of blocks deleted
+    """
+    ids = set()
+    offset = None
+    while True:
+        records, offset = vector_store.client.scroll(
+            collection_name=vector_store.collection_name,
+            limit=256,
+            offset=offset,
+            with_payload=True,
+        )
+        for record in records:
+            ids.update((record.payload.get(vector_store.metadata_payload_key) or {}).get("blocks", []))
+        if offset is None:
+            break
+    return vector_store.block_store.prune(ids)
+
+
+def get_manifest_stamp(manifest: Optional[Dict[str, Any]]) -> str:
+    """
+    Stamp of the content of an index: what the keyword index and the NumPy copy of an index
+    are saved with, so they are built again whenever the index changes.
+    """
+    if not manifest:
+        return ""
+    return hashlib.sha256(json.dumps(
+        [manifest.get("fingerprint"), manifest.get("count"), manifest.get("files")], sort_keys=True
+    ).encode("utf-8")).hexdigest()
+
+
+def scroll_points(vector_store: Qdrant, with_vectors: bool = False) -> Iterable[Tuple[str, str, dict, Optional[List[float]]]]:
+    """
+    Go through every point of an index.
+
+    Args:
+        vector_store (Qdrant): The index
+        with_vectors (bool): Whether to read the vectors of the points too
+
+    Returns:
+        Iterable[Tuple[str, str, dict, Optional[List[float]]]]: Id, text, metadata and vector of
+            each point. The text of pooled chunks is put back together from their blocks.
+    """
+    offset = None
+    while True:
+        records, offset = vector_store.client.scroll(
+            collection_name=vector_store.collection_name,
+            limit=256,
+            offset=offset,
+            with_payload=True,
+            with_vectors=with_vectors,
+        )
+        texts = [record.payload.get(vector_store.content_payload_key) or "" for record in records]
+        metadatas = [record.payload.get(vector_store.metadata_payload_key) or {} for record in records]
+        if isinstance(vector_store, BlockQdrant):
+            # Pooled points only hold the ids of their blocks
+            block_texts = vector_store.block_store.texts(id for metadata in metadatas for id in metadata.get("blocks", []))
+            texts = [text or "".join(block_texts.get(id, "") for id in metadata.get("blocks", [])) for text, metadata in zip(texts, metadatas)]
+        for record, text, metadata in zip(records, texts, metadatas):
+            yield str(record.id), text, metadata, record.vector
+        if offset is None:
+            break
+
+
+def get_keyword_index(index_dir: str, vector_store: Qdrant) -> BM25Index:
+    """
+    Get the BM25 index of the chunks of an index, for hybrid retrieval. It is saved next to
+    the index and built again from the stored chunks whenever the manifest changes.
+
+    Args:
+        index_dir (str): Directory of the persisted index, empty if it is in memory only
+        vector_store (Qdrant): The index
+
+    Returns:
+        BM25Index: The keyword index, with the ids of the points as document ids
+    """
+    manifest = read_manifest(index_dir) if index_dir else None
+    stamp = get_manifest_stamp(manifest)
+    if manifest:
+        try:
+            return BM25Index.load(os.path.join(index_dir, KEYWORDS_FILE), stamp)
+        except (FileNotFoundError, ValueError):
+            pass
+
+    keyword_index = BM25Index.build((id, text) for id, text, _, _ in scroll_points(vector_store))
+    if manifest:
+        keyword_index.save(os.path.join(index_dir, KEYWORDS_FILE), stamp)
+    return keyword_index
+
+
+def get_numpy_store(index_dir: str, vector_store: Qdrant, quantized: bool = False) -> NumpyVectorStore:
+    """
+    Get a NumPy copy of an index, to search it without Qdrant. It is saved next to the index
+    and built again from the stored points whenever the manifest changes.
+
+    Args:
+        index_dir (str): Directory of the persisted index, empty if it is in memory only
+        vector_store (Qdrant): The index
+        quantized (bool): Whether to quantize the vectors to int8
+
+    Returns:
+        NumpyVectorStore: The copy, using the embeddings (and block store) of the index
+    """
+    block_store = vector_store.block_store if isinstance(vector_store, BlockQdrant) else None
+    manifest = read_manifest(index_dir) if index_dir else None
+    stamp = f"{get_manifest_stamp(manifest)}:{'int8' if quantized else 'float32'}"
+    if manifest:
+        try:
+            return NumpyVectorStore.load(os.path.join(index_dir, VECTORS_FILE), vector_store.embeddings, stamp, block_store)
+        except (FileNotFoundError, ValueError):
+            pass
+
+    ids, texts, metadatas, vectors = [], [], [], []
+    for id, text, metadata, vector in scroll_points(vector_store, with_vectors=True):
+        ids.append(id)
+        # The text of pooled chunks stays in the block store
+        texts.append("" if block_store else text)
+        metadatas.append(metadata)
+        vectors.append(vector)
+    numpy_store = NumpyVectorStore.from_vectors(vector_store.embeddings, ids, vectors, texts, metadatas, quantized, block_store)
+    if manifest:
+        numpy_store.save(os.path.join(index_dir, VECTORS_FILE), stamp)
+    return numpy_store
+
+
+if __name__ == "__main__":
+    # Build the conversations index ahead of time (e.g. while building the Docker image), so
+    # that the app only has to open it on startup. Pass --force to rebuild it anyway.
+    from app.setup.environment import setup
+    setup()
+
+    from app.setup.data import COLLECTION_NAME, get_catalog, get_conversations_retriever
+
+    index_dir = get_index_dir()
+    if not index_dir:
+        print("Error: INDEX_DIR is empty, there is nothing to build.")
+        sys.exit(1)
+
+    if "--force" in sys.argv[1:]:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+    asyncio.run(get_conversations_retriever(data_files=get_catalog().files, collection_name=COLLECTION_NAME, k=6))
+    manifest = read_manifest(index_dir)
+    print(f"Index ready in {index_dir}: {manifest['count']} chunks, fingerprint {manifest['fingerprint'][:12]}")
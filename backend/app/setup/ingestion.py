@@ -0,0 +1,195 @@
+import os
+import uuid
+import asyncio
+from typing import Iterable, List, Optional, Tuple
+from langchain_community.vectorstores.qdrant import Qdrant
+from qdrant_client.http.models import PointStruct
+from app.utils.blocks import BlockQdrant, blockId, poolVectors
+
+# Cohere accepts up to 96 texts per embed request
+DEFAULT_EMBEDDING_BATCH_SIZE = 96
+DEFAULT_EMBEDDING_CONCURRENCY = 4
+
+# Namespace for the ids of the points, derived from their content so upserts are idempotent
+POINT_ID_NAMESPACE = uuid.UUID("6f1c4a52-2d0e-4c7e-9a51-4f3b8f0f5d1e")
+
+
+def get_embedding_batch_size() -> int:
+    """Texts per embedding request, from EMBEDDING_BATCH_SIZE (96 by default)."""
+    return int(os.getenv("EMBEDDING_BATCH_SIZE", DEFAULT_EMBEDDING_BATCH_SIZE))
+
+
+def get_embedding_concurrency() -> int:
+    """Embedding requests in flight at once, from EMBEDDING_CONCURRENCY (4 by default)."""
+    return int(os.getenv("EMBEDDING_CONCURRENCY", DEFAULT_EMBEDDING_CONCURRENCY))
+
+
+def point_id(content: str, metadata: Optional[dict] = None) -> str:
+    """
+    Id of the point of a chunk, derived from its content and source file so re-ingesting a file
+    replaces its points instead of adding new ones.
+    """
+    source = (metadata or {}).get("source", "")
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}\0{content}" if source else content))
+
+
+def upsert_chunks(vector_store: Qdrant, texts: List[str], vectors: List[List[float]], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None) -> None:
+    """
+    Store already embedded chunks in a single upsert, with the same payload layout that
+    Qdrant.add_texts uses so the retriever reads them back as documents.
+
+    Args:
+        vector_store (Qdrant): The vector store to add the chunks to
+        texts (List[str]): Text of the chunks
+        vectors (List[List[float]]): Embedding of each chunk
+        metadatas (Optional[List[dict]]): Metadata of each chunk
+        ids (Optional[List[str]]): Id of each chunk, derived from its text by default (see point_id)
+    """
+    points = [
+        PointStruct(
+            id=ids[i] if ids else point_id(text, metadatas[i] if metadatas else None),
+            vector=vector,
+            payload={
+                vector_store.content_payload_key: text,
+                vector_store.metadata_payload_key: metadatas[i] if metadatas else None,
+            },
+        )
+        for i, (text, vector) in enumerate(zip(texts, vectors))
+    ]
+    vector_store.client.upsert(collection_name=vector_store.collection_name, points=points)
+
+
+async def ingest_chunks(vector_store: Qdrant, chunks: Iterable[Tuple[List[str], List[dict]]], batch_size: Optional[int] = None, concurrency: Optional[int] = None) -> int:
+    """
+    Embed and store chunks coming from any number of files.
+
+    Chunks are pooled across files into batches of `batch_size` texts, and up to
+    `concurrency` batches are embedded at the same time through the async embeddings API.
+    Each batch is upserted as soon as its embeddings arrive. The chunks are produced, and
+    upserted one batch at a time, in worker threads so chunking the next file overlaps with
+    the requests in flight and the event loop is never held up.
+
+    Args:
+        vector_store (Qdrant): The vector store to add the chunks to
+        chunks (Iterable[Tuple[List[str], List[dict]]]): Batches of chunk texts with their metadata, e.g. one per file
+        batch_size (Optional[int]): Texts per embedding request (see get_embedding_batch_size)
+        concurrency (Optional[int]): Requests in flight at once (see get_embedding_concurrency)
+
+    Returns:
+        int: Number of chunks stored
+    """
+    batch_size = batch_size or get_embedding_batch_size()
+    semaphore = asyncio.Semaphore(concurrency or get_embedding_concurrency())
+    # The local Qdrant client isn't safe to write to from several threads at once
+    upsert_lock = asyncio.Lock()
+
+    async def embed_and_upsert(texts: List[str], metadatas: List[dict]) -> None:
+        async with semaphore:
+            vectors = await vector_store.embeddings.aembed_documents(texts)
+        async with upsert_lock:
+            await asyncio.to_thread(upsert_chunks, vector_store, texts, vectors, metadatas)
+
+    tasks = []
+    pending = []
+    pending_metadatas = []
+    total = 0
+    iterator = iter(chunks)
+    try:
+        while (batch := await asyncio.to_thread(next, iterator, None)) is not None:
+            texts, metadatas = batch
+            pending.extend(texts)
+            pending_metadatas.extend(metadatas)
+            total += len(texts)
+            while len(pending) >= batch_size:
+                tasks.append(asyncio.create_task(embed_and_upsert(pending[:batch_size], pending_metadatas[:batch_size])))
+                pending = pending[batch_size:]
+                pending_metadatas = pending_metadatas[batch_size:]
+
+        if pending:
+            tasks.append(asyncio.create_task(embed_and_upsert(pending, pending_metadatas)))
+
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return total
+
+
+async def ingest_pooled_chunks(vector_store: BlockQdrant, chunks: Iterable[Tuple[List[List[str]], List[dict]]], batch_size: Optional[int] = None,
+                               concurrency: Optional[int] = None) -> int:
+    """
+    Embed and store chunks made of shared blocks (see splitBlocks), embedding each distinct
+    block only once.
+
+    Blocks are embedded like the chunks in ingest_chunks and kept, with their text, in the
+    block store of the vector store. Each chunk is then stored with the mean of the vectors of
+    its blocks, weighted by their length, and only the ids of its blocks as payload.
+
+    Args:
+        vector_store (BlockQdrant): The vector store to add the chunks to
+        chunks (Iterable[Tuple[List[List[str]], List[dict]]]): Batches of chunks with their metadata, e.g. one per
+            file, each chunk being the text of its blocks
+        batch_size (Optional[int]): Blocks per embedding request (see get_embedding_batch_size)
+        concurrency (Optional[int]): Requests in flight at once (see get_embedding_concurrency)
+
+    Returns:
+        int: Number of chunks stored
+    """
+    batch_size = batch_size or get_embedding_batch_size()
+    semaphore = asyncio.Semaphore(concurrency or get_embedding_concurrency())
+    block_store = vector_store.block_store
+
+    async def embed_blocks(texts: List[str]) -> None:
+        async with semaphore:
+            vectors = await vector_store.embeddings.aembed_documents(texts)
+        await asyncio.to_thread(block_store.add, texts, vectors)
+
+    tasks = []
+    pending = []
+    seen = set()
+    # Block ids, lengths and metadata of every chunk, pooled once all the blocks are embedded
+    layouts = []
+    iterator = iter(chunks)
+    try:
+        while (batch := await asyncio.to_thread(next, iterator, None)) is not None:
+            new_blocks = {}
+            for blocks, metadata in zip(*batch):
+                ids = [blockId(block) for block in blocks]
+                layouts.append((ids, [len(block) for block in blocks], metadata))
+                for id, block in zip(ids, blocks):
+                    if id not in seen:
+                        seen.add(id)
+                        new_blocks[id] = block
+
+            missing = await asyncio.to_thread(block_store.missing, list(new_blocks))
+            pending.extend(new_blocks[id] for id in missing)
+            while len(pending) >= batch_size:
+                tasks.append(asyncio.create_task(embed_blocks(pending[:batch_size])))
+                pending = pending[batch_size:]
+
+        if pending:
+            tasks.append(asyncio.create_task(embed_blocks(pending)))
+
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    def upsert_pooled(group: List[Tuple[List[str], List[int], dict]]) -> None:
+        vectors = block_store.vectors(id for ids, _, _ in group for id in ids)
+        upsert_chunks(
+            vector_store,
+            [""] * len(group),
+            [poolVectors([vectors[id] for id in ids], lengths) for ids, lengths, _ in group],
+            [{**metadata, "blocks": ids} for ids, _, metadata in group],
+            [point_id("\0".join(ids), metadata) for ids, _, metadata in group],
+        )
+
+    for i in range(0, len(layouts), batch_size):
+        await asyncio.to_thread(upsert_pooled, layouts[i:i + batch_size])
+
+    return len(layouts)
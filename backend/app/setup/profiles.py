@@ -0,0 +1,172 @@
+import os
+import json
+import asyncio
+import hashlib
+import threading
+from typing import Dict, Iterable, List, Optional
+from langchain_core.vectorstores import VectorStore, VectorStoreRetriever
+from app.setup.index import scroll_points
+from app.tools import get_interests_question
+from app.utils.chains import RAG_PROMPT, abatch_retrieve_context, get_interests_rag_chain
+from app.utils.numpy_store import NumpyVectorStore
+
+DEFAULT_PROFILES_PATH = ".cache/profiles.json"
+DEFAULT_PROFILES_CONCURRENCY = 4
+
+
+def get_profiles_path() -> str:
+    """
+    File the interest profiles are saved to, from PROFILES_PATH (".cache/profiles.json" by
+    default). An empty PROFILES_PATH keeps them in memory only.
+    """
+    return os.getenv("PROFILES_PATH", DEFAULT_PROFILES_PATH)
+
+
+def get_member_chunk_ids(vector_store: VectorStore) -> Dict[str, List[str]]:
+    """Ids of the chunks each team member takes part in, by name."""
+    if isinstance(vector_store, NumpyVectorStore):
+        points = zip(vector_store.ids, vector_store.metadatas)
+    else:
+        points = ((id, metadata) for id, _, metadata, _ in scroll_points(vector_store))
+
+    chunk_ids: Dict[str, List[str]] = {}
+    for id, metadata in points:
+        for member in metadata.get("participants", []):
+            chunk_ids.setdefault(member, []).append(id)
+    return {member: sorted(ids) for member, ids in chunk_ids.items()}
+
+
+class InterestProfiles:
+    """
+    Interests of each team member, as the interests RAG chain answers them, so they don't have
+    to be worked out again on every request.
+
+    A profile is only valid for the version of the member it was computed for: a digest of
+    the chunks the member takes part in (their ids change with their content) and of the
+    model and prompts of the chain. Members whose chunks changed are the only ones computed
+    again.
+    """
+
+    def __init__(self, versions: Dict[str, str], path: Optional[str] = None):
+        """
+        Args:
+            versions (Dict[str, str]): Current version of each member (see get_member_versions)
+            path (Optional[str]): File the profiles are saved to, None to keep them in memory only
+        """
+        self.versions = versions
+        self.path = path
+        # Profiles by member name: the version they were computed for and the interests
+        self.profiles: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.profiles = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+
+    def get(self, member: str) -> Optional[str]:
+        """Interests of a member, or None if they were never computed or are out of date."""
+        profile = self.profiles.get(member)
+        if profile is None or profile["version"] != self.versions.get(member):
+            return None
+        return profile["interests"]
+
+    def put(self, member: str, interests: str) -> None:
+        with self._lock:
+            self.profiles[member] = {"version": self.versions.get(member), "interests": interests}
+
+    def stale(self, members: Iterable[str]) -> List[str]:
+        """Members whose profile has to be computed (again)."""
+        return [member for member in members if self.get(member) is None]
+
+    def stats(self) -> Dict[str, int]:
+        return {"members": len(self.versions), "ready": len(self.versions) - len(self.stale(self.versions))}
+
+    def save(self) -> None:
+        """Save the profiles to their file, if they have one."""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._lock:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.profiles, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.path)
+
+
+def get_member_versions(vector_store: VectorStore, members: Iterable[str]) -> Dict[str, str]:
+    """
+    Version of the profile of each member: changes with the chunks they take part in, and
+    with the model, prompt and question the interests are worked out with.
+    """
+    chunk_ids = get_member_chunk_ids(vector_store)
+    config = [os.getenv("INTERESTS_RAG_LLM"), RAG_PROMPT]
+    return {
+        member: hashlib.sha256(json.dumps(
+            [*config, get_interests_question(member), chunk_ids.get(member, [])]
+        ).encode("utf-8")).hexdigest()
+        for member in members
+    }
+
+
+def load_interest_profiles(vector_store_retriever: VectorStoreRetriever, members: Iterable[str],
+                           path: Optional[str] = None) -> InterestProfiles:
+    """
+    Load the saved interest profiles, checking them against the current chunks of each member.
+
+    Args:
+        vector_store_retriever (VectorStoreRetriever): Retriever of the conversations
+        members (Iterable[str]): Names of the team members
+        path (Optional[str]): File the profiles are saved to (see get_profiles_path)
+    """
+    return InterestProfiles(
+        get_member_versions(vector_store_retriever.vectorstore, members),
+        path if path is not None else get_profiles_path(),
+    )
+
+
+async def refresh_interest_profiles(profiles: InterestProfiles, vector_store_retriever: VectorStoreRetriever,
+                                    concurrency: int = DEFAULT_PROFILES_CONCURRENCY,
+                                    members: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Compute the profiles of the members that don't have an up to date one, a few at a time,
+    e.g. in the background after ingestion. The context of all of them is retrieved at once
+    (see abatch_retrieve_context). A member that fails is left for the next time.
+
+    Args:
+        profiles (InterestProfiles): The profiles to bring up to date
+        vector_store_retriever (VectorStoreRetriever): Retriever of the conversations
+        concurrency (int): Profiles computed at the same time
+        members (Optional[Iterable[str]]): Members to bring up to date, all of them if None
+
+    Returns:
+        List[str]: Names of the members whose profile was computed
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def compute(member: str, question: str, context: Optional[str]) -> str:
+        async with semaphore:
+            profiles.put(member, await rag_chain.ainvoke({"question": question, "team_member": member, "context": context}))
+            return member
+
+    stale = profiles.stale(members if members is not None else profiles.versions)
+    rag_chain = get_interests_rag_chain(vector_store_retriever) if stale else None
+    questions = [get_interests_question(member) for member in stale]
+    try:
+        contexts = await abatch_retrieve_context(vector_store_retriever, questions, stale)
+    except Exception as e:
+        # Each member retrieves its own context instead
+        print(f"Error retrieving the context of the interest profiles: {e}")
+        contexts = [None] * len(stale)
+
+    results = await asyncio.gather(*(compute(*arguments) for arguments in zip(stale, questions, contexts)), return_exceptions=True)
+    computed = [result for result in results if isinstance(result, str)]
+    if computed:
+        profiles.save()
+
+    if os.getenv("DEBUG", "false").lower() == "true":
+        failed = {member: str(result) for member, result in zip(stale, results) if isinstance(result, BaseException)}
+        print(f"Interest profiles: {len(computed)} computed, {len(profiles.versions) - len(stale)} up to date, failed: {failed}")
+    return computed
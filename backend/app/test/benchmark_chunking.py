@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import tempfile
+from app.utils.chunks import chunkFiles
+from app.utils.messages import clearMessageTables
+from app.test.synthetic_data import write_synthetic_export
+
+TIMESTAMP_REGEX = r"\[(\d{1,2}/\d{1,2}/\d{2}), \d{1,2}:\d{2}:\d{2}(?:.AM|.PM)?\]"
+DATE_FORMAT = "%d/%m/%y"
+
+def run(filepaths, workers: int):
+    """Chunks every file and returns the chunks of each one, in order."""
+    clearMessageTables()
+    return [result.result() for _, result in chunkFiles(filepaths, TIMESTAMP_REGEX, DATE_FORMAT, "day", 2, workers)]
+
+
+def benchmark_chunking(files: int = 48, days: int = 365, messages_per_day: int = 40, workers: int = None) -> None:
+    """
+    Compares serial chunking with the process pool on many synthetic exports.
+
+    Args:
+        files (int): Number of synthetic exports
+        days (int): Days covered by each export
+        messages_per_day (int): Average number of messages per day
+        workers (int): Worker processes for the parallel run, one per CPU by default
+    """
+    workers = workers or os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filepaths = []
+        lines = 0
+        for i in range(files):
+            filepath = os.path.join(tmp, f"_chat_synthetic_{i}.txt")
+            lines += write_synthetic_export(filepath, days, messages_per_day, seed=i)
+            filepaths.append(filepath)
+        print(f"{files} synthetic exports, {lines:,} lines, chunked by day with 2 days of overlap\n")
+
+        start = time.perf_counter()
+        serial = run(filepaths, 1)
+        serial_time = time.perf_counter() - start
+        print(f"  Serial:       {serial_time:8.2f} s")
+
+        start = time.perf_counter()
+        parallel = run(filepaths, workers)
+        parallel_time = time.perf_counter() - start
+        print(f"  Process pool: {parallel_time:8.2f} s ({workers} workers)")
+
+        print(f"  Speedup: {serial_time / parallel_time:.1f}x, same chunks: {serial == parallel}")
+
+
+if __name__ == "__main__":
+    benchmark_chunking(workers=int(sys.argv[1]) if len(sys.argv) > 1 else None)
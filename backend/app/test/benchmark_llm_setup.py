@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("INTERESTS_RAG_LLM", "gpt-4.1-mini")
+
+from langchain.agents import AgentExecutor, create_react_agent
+from langchain_core.prompts import PromptTemplate
+from langchain_core.retrievers import BaseRetriever
+from langchain_openai import ChatOpenAI
+
+COMPLETION = {
+    "id": "chatcmpl-benchmark",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4.1-mini",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}
+
+
+class CompletionHandler(BaseHTTPRequestHandler):
+    """Answers every chat completion at once, over keep-alive connections, counting them."""
+
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with CompletionHandler.lock:
+            CompletionHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps(COMPLETION).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(handler=CompletionHandler) -> ThreadingHTTPServer:
+    """Start the local server and point every OpenAI client created from now on to it."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["OPENAI_API_BASE"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    return server
+
+
+class EmptyRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query, *, run_manager):
+        return []
+
+
+def build_agent(llm: ChatOpenAI) -> AgentExecutor:
+    """What get_gift_ideas used to build on every request."""
+    from app.main import AGENT_PROMPT
+    from app.tools import TeamMemberInterestsTool
+
+    tools = [TeamMemberInterestsTool(EmptyRetriever())]
+    agent = create_react_agent(llm=llm, tools=tools, prompt=PromptTemplate.from_template(AGENT_PROMPT))
+    return AgentExecutor.from_agent_and_tools(agent=agent, tools=tools, handle_parsing_errors=True, max_iterations=7)
+
+
+async def benchmark_llm_setup(requests: int = 50, concurrency: int = 8) -> None:
+    """
+    Compares building the chat model and agent on every request with building them once on
+    the shared HTTP clients: setup time per request, and the connections and time taken by
+    LLM calls to a local, instant chat completions server. No TLS is involved, so against
+    the real API every new connection costs a handshake on top.
+
+    Args:
+        requests (int): Number of requests
+        concurrency (int): Requests in flight at once
+    """
+    from app.utils.llm import close_http_clients, get_chat_model
+
+    server = start_server()
+    start = time.perf_counter()
+    for _ in range(requests):
+        build_agent(ChatOpenAI(model="gpt-4.1-mini", temperature=1.2))
+    per_request = (time.perf_counter() - start) / requests
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        build_agent(get_chat_model("gpt-4.1-mini", temperature=1.2))
+    shared = (time.perf_counter() - start) / requests
+
+    print(f"Setup per request ({requests} requests)\n")
+    print(f"  New model and agent:     {per_request * 1000:8.2f} ms")
+    print(f"  Shared model, new agent: {shared * 1000:8.2f} ms")
+    print("  Built once at startup:       0.00 ms\n")
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(get_llm):
+        async with semaphore:
+            await get_llm().ainvoke("hola")
+
+    print(f"LLM calls ({requests} calls, {concurrency} at a time)\n")
+    for name, get_llm in [
+        ("New client per call", lambda: ChatOpenAI(model="gpt-4.1-mini")),
+        ("Shared clients", lambda: get_chat_model("gpt-4.1-mini")),
+    ]:
+        CompletionHandler.connections = 0
+        start = time.perf_counter()
+        await asyncio.gather(*(call(get_llm) for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+        print(f"  {name:<20}{elapsed / requests * 1000:8.2f} ms per call, {CompletionHandler.connections} connections")
+
+    await close_http_clients()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark_llm_setup(requests=int(sys.argv[1]) if len(sys.argv) > 1 else 50))
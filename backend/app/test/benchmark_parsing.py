@@ -0,0 +1,72 @@
+import os
+import re
+import tempfile
+import time
+from datetime import datetime
+from app.utils.dates import parseDate, parseTimestamp, parseTimestamps
+from app.utils.chunks import chunkMessageTable, streamTimeStampedFile
+from app.utils.messages import MessageTable
+from app.test.synthetic_data import write_synthetic_export
+
+TIMESTAMP_REGEX = r"\[(\d{1,2}/\d{1,2}/\d{2}), \d{1,2}:\d{2}:\d{2}(?:.AM|.PM)?\]"
+DATE_FORMAT = "%d/%m/%y"
+
+def timed(label: str, fn, repeat: int = 3) -> float:
+    """Runs fn a few times and prints the best time."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label:<45} {best * 1000:>10.1f} ms")
+    return best
+
+
+def benchmark_parsing(days: int = 730, messages_per_day: int = 150) -> None:
+    """
+    Compares the timestamp parsing strategies on a large synthetic export.
+
+    Args:
+        days (int): Number of days covered by the synthetic export
+        messages_per_day (int): Average number of messages per day
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        filepath = os.path.join(tmp, "_chat_synthetic.txt")
+        lines = write_synthetic_export(filepath, days, messages_per_day)
+        print(f"Synthetic export: {lines:,} lines over {days} days\n")
+
+        ts_pattern = re.compile(TIMESTAMP_REGEX)
+        with open(filepath, "r", encoding="utf-8") as f:
+            date_strs = [match.group(1) for match in map(ts_pattern.search, f) if match]
+
+        print("Parsing every date string:")
+        baseline = timed("datetime.strptime per line", lambda: [datetime.strptime(s, DATE_FORMAT) for s in date_strs])
+
+        def memoized():
+            parseTimestamp.cache_clear()
+            parseDate.cache_clear()
+            return [parseDate(s, DATE_FORMAT) for s in date_strs]
+
+        def vectorized():
+            parseTimestamp.cache_clear()
+            return parseTimestamps(date_strs, DATE_FORMAT)
+
+        memoized_time = timed("parseDate (memoized)", memoized)
+        vectorized_time = timed("parseTimestamps (vectorized)", vectorized)
+        print(f"  Speedup: {baseline / memoized_time:.1f}x memoized, {baseline / vectorized_time:.1f}x vectorized\n")
+
+        print("Chunking the export by week with 2 days of overlap:")
+        timed("streamTimeStampedFile", lambda: list(streamTimeStampedFile(filepath, TIMESTAMP_REGEX, DATE_FORMAT, "week", 2)), repeat=1)
+        table = None
+
+        def build_table():
+            nonlocal table
+            table = MessageTable(filepath, TIMESTAMP_REGEX, DATE_FORMAT)
+
+        timed("MessageTable (parse once)", build_table, repeat=1)
+        timed("chunkMessageTable (query)", lambda: list(chunkMessageTable(table, "week", 2)), repeat=1)
+
+
+if __name__ == "__main__":
+    benchmark_parsing()
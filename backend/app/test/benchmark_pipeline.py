@@ -0,0 +1,149 @@
+import sys
+import json
+import time
+import asyncio
+import numpy as np
+from langchain_community.callbacks import get_openai_callback
+from langchain_core.embeddings import FakeEmbeddings
+from app.test.benchmark_llm_setup import CompletionHandler, start_server
+from app.utils.numpy_store import NumpyVectorStore
+
+MODEL_NAME = "gpt-4.1-mini"
+TEAM_MEMBER = "Grettel"
+
+# Simulated time of a completion: a fixed overhead plus the time to generate each token
+SIMULATED_CALL_SECONDS = 0.05
+SIMULATED_TOKEN_SECONDS = 0.002
+
+GIFT_IDEAS = [
+    {"name": "Guía de viajes", "description": "Le encanta viajar y conocer ciudades nuevas."},
+    {"name": "Audífonos", "description": "Escucha música todo el día."},
+    {"name": "Curso de cocina", "description": "Siempre comparte recetas con el equipo."},
+]
+
+
+class PipelineHandler(CompletionHandler):
+    """
+    Plays the part of the OpenAI API for both pipelines: answers the interests question, the
+    steps of the ReAct agent (one tool call, then the final answer) and structured output
+    requests, streamed or not, with token usage estimated at 4 characters per token.
+    """
+
+    def completion(self, request: dict) -> str:
+        prompt = "\n".join(str(message.get("content", "")) for message in request["messages"])
+        if "response_format" in request:
+            return json.dumps({"ideas": GIFT_IDEAS}, ensure_ascii=False)
+        if "Tienes acceso a las siguientes herramientas" in prompt:
+            # Only the scratchpad after the question tells whether the tool was called already
+            if "Observation:" in prompt.rsplit("Question:", 1)[-1]:
+                return f"Ahora conozco la respuesta final\nFinal Answer: {json.dumps(GIFT_IDEAS, ensure_ascii=False)}"
+            return f"Necesito conocer sus intereses\nAction: get_team_member_interests\nAction Input: {TEAM_MEMBER}"
+        return "1. Viajar\n2. Música\n3. Cocina\n4. Fútbol\n5. Lectura"
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        content = self.completion(request)
+        prompt_tokens = len(json.dumps(request["messages"], ensure_ascii=False)) // 4
+        completion_tokens = len(content) // 4
+
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        completion = {"id": "chatcmpl-benchmark", "created": 0, "model": request["model"]}
+        time.sleep(SIMULATED_CALL_SECONDS)
+        if request.get("stream"):
+            self.stream(completion, content, usage)
+            return
+
+        time.sleep(SIMULATED_TOKEN_SECONDS * completion_tokens)
+        body = json.dumps({
+            **completion,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream(self, completion: dict, content: str, usage: dict):
+        """Send the completion as server-sent events, a token (4 characters) at a time."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(choices: list, **fields):
+            event = f"data: {json.dumps({**completion, 'object': 'chat.completion.chunk', 'choices': choices, **fields})}\n\n"
+            self.send_chunk(event.encode("utf-8"))
+
+        for i in range(0, len(content), 4):
+            time.sleep(SIMULATED_TOKEN_SECONDS)
+            send([{"index": 0, "delta": {"role": "assistant", "content": content[i:i + 4]}, "finish_reason": None}])
+        send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        send([], usage=usage)
+        self.send_chunk(b"data: [DONE]\n\n")
+        self.send_chunk(b"")
+
+    def send_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def get_sample_retriever():
+    """Retriever over a few chats of the team member, so the RAG step has something to search."""
+    texts = [
+        f"[1/2/25, 10:00:00 AM] {TEAM_MEMBER}: Este fin de semana me voy de viaje a la playa",
+        f"[2/2/25, 9:30:00 PM] {TEAM_MEMBER}: Estoy escuchando el disco nuevo, ¡qué buena música!",
+        f"[3/2/25, 1:15:00 PM] {TEAM_MEMBER}: Les comparto la receta del arroz con pollo",
+    ]
+    metadatas = [{"participants": ["David", TEAM_MEMBER], "source": "_chat_sample.txt"} for _ in texts]
+    return NumpyVectorStore.from_texts(texts, FakeEmbeddings(size=16), metadatas).as_retriever(search_kwargs={"k": 6})
+
+
+async def benchmark_pipeline(requests: int = 50, live: bool = False) -> None:
+    """
+    Compares the ReAct agent with the direct pipeline (see get_pipeline_mode): p50 and p99
+    latency, LLM calls and tokens per request. Interest profiles are left out, so both look
+    up the interests with the RAG chain on every request.
+
+    By default the OpenAI API is simulated by a local server that always follows the
+    shortest path of the agent, so the agent can only do worse against the real API. With
+    --live, the real API and conversations index are used (and billed).
+
+    Args:
+        requests (int): Requests per pipeline
+        live (bool): Whether to use the real OpenAI API and conversations index
+    """
+    import app.main as main
+
+    if live:
+        from app.setup.data import COLLECTION_NAME, get_catalog, get_conversations_retriever
+        main.vector_store_retriever = await get_conversations_retriever(get_catalog().files, COLLECTION_NAME, k=6)
+    else:
+        server = start_server(PipelineHandler)
+        main.vector_store_retriever = get_sample_retriever()
+
+    main.get_agent_executor(MODEL_NAME).verbose = False
+
+    print(f"{requests} requests per pipeline{' (live)' if live else ''}\n")
+    print(f"  {'Pipeline':<10}{'p50':>10}{'p99':>10}{'Calls':>8}{'Tokens':>9}")
+    for name, suggest in [("agent", main.suggest_gift_ideas_with_agent), ("direct", main.suggest_gift_ideas_directly)]:
+        latencies = []
+        with get_openai_callback() as callback:
+            for _ in range(requests):
+                start = time.perf_counter()
+                await suggest(TEAM_MEMBER, MODEL_NAME)
+                latencies.append(time.perf_counter() - start)
+        print(
+            f"  {name:<10}{np.percentile(latencies, 50) * 1000:>7.0f} ms{np.percentile(latencies, 99) * 1000:>7.0f} ms"
+            f"{callback.successful_requests / requests:>8.1f}{callback.total_tokens / requests:>9.0f}"
+        )
+
+    if not live:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    asyncio.run(benchmark_pipeline(requests=int(args[0]) if args else 50, live="--live" in sys.argv))
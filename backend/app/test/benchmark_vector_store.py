@@ -0,0 +1,122 @@
+import sys
+import time
+import warnings
+import tracemalloc
+import numpy as np
+from langchain_core.embeddings import FakeEmbeddings
+from langchain_community.vectorstores.qdrant import Qdrant
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, VectorParams
+from app.setup.ingestion import upsert_chunks
+from app.utils.numpy_store import NumpyVectorStore
+
+COLLECTION_NAME = "benchmark"
+MEMBERS = ["Abel", "Grettel", "Laura", "Luisa", "Maritza", "Robert"]
+
+
+def synthetic_vectors(count: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Vectors grouped around a few topics, like the chunks of the same conversations."""
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(max(count // 50, 1), dim))
+    vectors = topics[rng.integers(len(topics), size=count)] + rng.normal(scale=0.8, size=(count, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def measure(build):
+    """Builds a store, returning it with the memory it holds on to (in MiB)."""
+    tracemalloc.start()
+    store = build()
+    memory = tracemalloc.get_traced_memory()[0] / 2**20
+    tracemalloc.stop()
+    return store, memory
+
+
+def recall(results, truth) -> float:
+    return float(np.mean([len(set(found) & set(expected)) / len(expected) for found, expected in zip(results, truth)]))
+
+
+def benchmark_vector_store(count: int = 10000, dim: int = 1024, queries: int = 64, k: int = 6) -> None:
+    """
+    Compares the in-memory Qdrant store with NumpyVectorStore (float32 and int8) on
+    synthetic vectors: memory, search latency (one query at a time and batched) and recall of
+    the exact top-k, with and without a member filter.
+
+    Args:
+        count (int): Number of vectors
+        dim (int): Dimension of the vectors (embed-multilingual-v3.0 has 1024)
+        queries (int): Number of queries
+        k (int): Number of results per query
+    """
+    # The Qdrant wrapper of langchain_community is deprecated, but it is the one the app uses
+    warnings.simplefilter("ignore")
+    vectors = synthetic_vectors(count, dim)
+    query_vectors = synthetic_vectors(queries, dim, seed=1)
+    ids = [str(i) for i in range(count)]
+    texts = [f"chunk {i}" for i in range(count)]
+    metadatas = [{"participants": ["David", MEMBERS[i % len(MEMBERS)]], "source": f"_chat_{i % len(MEMBERS)}.txt"} for i in range(count)]
+    member_filter = {"participants": "Grettel"}
+    allowed = np.array(["Grettel" in metadata["participants"] for metadata in metadatas])
+
+    scores = query_vectors @ vectors.T
+    truth = [list(np.argsort(-row)[:k]) for row in scores]
+    filtered_truth = [list(np.argsort(-np.where(allowed, row, -np.inf))[:k]) for row in scores]
+    embeddings = FakeEmbeddings(size=dim)
+
+    def build_qdrant():
+        client = QdrantClient(":memory:")
+        client.create_collection(COLLECTION_NAME, vectors_config=VectorParams(size=dim, distance=Distance.COSINE))
+        store = Qdrant(client=client, collection_name=COLLECTION_NAME, embeddings=embeddings)
+        for i in range(0, count, 1000):
+            upsert_chunks(store, texts[i:i + 1000], vectors[i:i + 1000].tolist(), metadatas[i:i + 1000], ids=[
+                f"00000000-0000-0000-0000-{i + j:012d}" for j in range(len(texts[i:i + 1000]))
+            ])
+        return store
+
+    print(f"{count:,} vectors of dimension {dim}, {queries} queries, top {k}\n")
+    print(f"  {'Store':<16}{'Memory':>10}{'Query':>12}{'Batched':>12}{'Recall':>9}{'Filtered':>10}")
+
+    stores = [
+        ("Qdrant :memory:", build_qdrant),
+        ("NumPy float32", lambda: NumpyVectorStore.from_vectors(embeddings, ids, vectors, texts, metadatas)),
+        ("NumPy int8", lambda: NumpyVectorStore.from_vectors(embeddings, ids, vectors, texts, metadatas, quantized=True)),
+    ]
+    for name, build in stores:
+        store, memory = measure(build)
+        if isinstance(store, Qdrant):
+            def search(vector, filter=None):
+                return [int(document.metadata["_id"][-12:]) for document, _ in store.similarity_search_with_score_by_vector(
+                    vector, k, filter=filter
+                )]
+
+            def search_batch(batch, filter=None):
+                return [search(vector, filter) for vector in batch]
+            qdrant_filter = store._qdrant_filter_from_dict(member_filter)
+        else:
+            def search(vector, filter=None):
+                return [int(document.id) for document, _ in store.similarity_search_with_score_by_vector(vector, k, filter=filter)]
+
+            def search_batch(batch, filter=None):
+                return [[int(document.id) for document, _ in results] for results in store.search_by_vectors(batch, k, filter)]
+            qdrant_filter = member_filter
+
+        start = time.perf_counter()
+        results = [search(vector.tolist()) for vector in query_vectors]
+        query_time = (time.perf_counter() - start) / queries
+
+        start = time.perf_counter()
+        batched = search_batch(query_vectors.tolist())
+        batch_time = (time.perf_counter() - start) / queries
+
+        filtered = search_batch(query_vectors.tolist(), qdrant_filter)
+        assert batched == results
+        print(
+            f"  {name:<16}{memory:>7.1f} MiB{query_time * 1000:>9.2f} ms{batch_time * 1000:>9.2f} ms"
+            f"{recall(results, truth):>9.3f}{recall(filtered, filtered_truth):>10.3f}"
+        )
+        if isinstance(store, Qdrant):
+            store.client.close()
+        del store
+
+
+if __name__ == "__main__":
+    benchmark_vector_store(count=int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
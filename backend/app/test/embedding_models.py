@@ -11,7 +11,9 @@ from langchain_cohere import CohereEmbeddings
 from qdrant_client import QdrantClient
 from qdrant_client.http.models import Distance, VectorParams
 from app.utils.chunks import chunkTimeStampedFile, clean_up_string
+from app.utils.embeddings import CachedEmbeddings, cache_embeddings
 from app.setup.environment import setup
+from app.setup.data import get_catalog
 from ragas import EvaluationDataset, evaluate, RunConfig
 from ragas.llms import LangchainLLMWrapper
 from ragas.metrics import LLMContextRecall, Faithfulness, FactualCorrectness, ResponseRelevancy, ContextEntityRecall, NoiseSensitivity
@@ -30,6 +32,7 @@ llm = ChatOpenAI(model=model_name, temperature=0)
 
 async def get_conversations_retriever(model_name: str, data_files: list[str], k: int):
   embedding_dim = os.getenv("EMBEDDING_DIM")
+  cohere_api_key = os.getenv("COHERE_API_KEY")
   timeStampRegex = r"\[(\d{1,2}/\d{1,2}/\d{2}), \d{1,2}:\d{2}:\d{2}(?:.AM|.PM)?\]"
   dateRegex = "%d/%m/%y"
   interval = "week"
@@ -43,10 +46,17 @@ async def get_conversations_retriever(model_name: str, data_files: list[str], k:
     raise ValueError("COHERE_API_KEY environment variable not set")
 
   try:
-      # Use Cohere embeddings (default model is multilingual: embed-multilingual-v3.0)
-      embedding_model = CohereEmbeddings(
-          model=model_name,
-          cohere_api_key=cohere_api_key
+      embedding_dim = int(embedding_dim)
+
+      # Use Cohere embeddings (default model is multilingual: embed-multilingual-v3.0),
+      # sharing the on-disk cache with the app
+      embedding_model = cache_embeddings(
+          CohereEmbeddings(
+              model=model_name,
+              cohere_api_key=cohere_api_key
+          ),
+          model_name,
+          embedding_dim
       )
 
       client = QdrantClient(":memory:")
@@ -77,6 +87,9 @@ async def get_conversations_retriever(model_name: str, data_files: list[str], k:
           if os.getenv("DEBUG", "false").lower() == "true":
               print(f"Adding {len(chunks)} chunks from {filepath}")
           vector_store.add_texts(chunks)
+
+      if isinstance(embedding_model, CachedEmbeddings):
+          print(f"Embedding cache: {embedding_model.stats()}")
       
       return vector_store.as_retriever(search_kwargs={"k": k})  
 
@@ -126,17 +139,7 @@ if __name__ == "__main__":
     if not judge_model_name:
         raise ValueError("JUDGE_LLM environment variable not set")
 
-    data_files = [
-        "app/data/_chat_abel_mesen.txt",
-        "app/data/_chat_francisco_salas.txt",
-        "app/data/_chat_grettel.txt",
-        "app/data/_chat_laura_monestel.txt",
-        "app/data/_chat_luisa_alfaro.txt",
-        "app/data/_chat_maria_jose_alfaro.txt",
-        "app/data/_chat_maritza_ortiz.txt",
-        "app/data/_chat_paola_mora_lopez.txt",
-        "app/data/_chat_robert_monestel.txt",
-    ]
+    data_files = get_catalog().files
 
     custom_run_config = RunConfig(timeout=360)
     evaluator_llm = LangchainLLMWrapper(ChatOpenAI(model=judge_model_name))
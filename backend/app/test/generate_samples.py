@@ -3,7 +3,7 @@ import uuid
 import os
 import asyncio
 from typing import List, Dict, Any
-from app.utils.chunks import chunkTimeStampedFile, clean_up_string
+from app.utils.chunks import chunkFiles, clean_up_string
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from app.setup.environment import setup
@@ -12,7 +12,7 @@ setup()
 
 def generate_test_samples(filepaths: List[str], output_file: str = "test_data.json", 
                        timestamp_regex: str = r"\[(\d{1,2}/\d{1,2}/\d{2}), \d{1,2}:\d{2}:\d{2}(?:.AM|.PM)?\]", 
-                       date_format: str = "%d/%m/%y", interval: str = "week", overlap: int = 2) -> None:
+                       date_format: str = "%d/%m/%y", interval: str = "week", overlap: int = 2, workers: int = 1) -> None:
     """
     Generates test data by chunking timestamp files and saving chunks to a JSON file.
     
@@ -23,15 +23,14 @@ def generate_test_samples(filepaths: List[str], output_file: str = "test_data.js
         date_format (str): Format string for parsing the datetime
         interval (str): One of 'day', 'week', or 'month'
         overlap (int): Number of days to overlap at beginning and end of chunks
+        workers (int): Number of processes chunking the files (see chunkFiles)
     """
     samples = []
     
-    for filepath in filepaths:
+    for filepath, chunks in chunkFiles(filepaths, timestamp_regex, date_format, interval, overlap, workers):
         try:
             # Process each chunk in the file
-            for _, (_, _, lines) in enumerate(chunkTimeStampedFile(
-                filepath, timestamp_regex, date_format, interval, overlap
-            )):
+            for _, (_, _, lines) in enumerate(chunks.result()):
                 if (len(lines) > 0):
                     # Join the lines to create a single text chunk
                     chunk_text = "".join(lines)
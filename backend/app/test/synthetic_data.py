@@ -0,0 +1,48 @@
+import random
+from datetime import datetime, timedelta
+
+SENDERS = ["David", "Abel", "Grettel", "Laura Monestel", "Luisa Alfaro"]
+MESSAGES = [
+    "Buenos días! ¿Cómo amaneció?",
+    "Ok 👍",
+    "Ya le paso el documento en un rato",
+    "Este fin de semana fuimos a la playa y estuvo buenísimo",
+    "Jaja qué bueno",
+    "‎audio omitted",
+    "Mañana tenemos la reunión a las 10",
+]
+
+def write_synthetic_export(filepath: str, days: int, messages_per_day: int, seed: int = 0, start: datetime = datetime(2023, 1, 1)) -> int:
+    """
+    Writes a WhatsApp-like chat export with random messages, for benchmarks.
+
+    Args:
+        filepath (str): Path where to write the export
+        days (int): Number of days covered by the export
+        messages_per_day (int): Average number of messages per day
+        seed (int): Seed for the random generator
+        start (datetime): Date of the first message
+
+    Returns:
+        int: Number of lines written
+    """
+    rng = random.Random(seed)
+    lines = 0
+    with open(filepath, "w", encoding="utf-8") as f:
+        for day in range(days):
+            date = start + timedelta(days=day)
+            for _ in range(rng.randint(0, 2 * messages_per_day)):
+                hour = rng.randint(1, 12)
+                minute = rng.randint(0, 59)
+                second = rng.randint(0, 59)
+                meridiem = rng.choice(["AM", "PM"])
+                f.write(
+                    f"[{date.day}/{date.month}/{date:%y}, {hour}:{minute:02d}:{second:02d} {meridiem}] "
+                    f"{rng.choice(SENDERS)}: {rng.choice(MESSAGES)}\n"
+                )
+                lines += 1
+                # Some messages span several lines
+                if rng.random() < 0.05:
+                    f.write("y otra línea del mismo mensaje\n")
+                    lines += 1
+    return lines
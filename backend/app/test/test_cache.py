@@ -0,0 +1,126 @@
+import asyncio
+import pytest
+from app.utils.cache import AsyncTTLCache
+
+
+class Computation:
+    """Computes a result once released, recording every time it's called."""
+
+    def __init__(self, value="ideas"):
+        self.value = value
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if isinstance(self.value, Exception):
+            raise self.value
+        return self.value
+
+
+def test_concurrent_requests_share_one_computation():
+    async def run():
+        cache = AsyncTTLCache(ttl=60, max_size=8)
+        compute = Computation()
+        waiters = [asyncio.ensure_future(cache.get_or_compute("Grettel", compute)) for _ in range(5)]
+        await asyncio.sleep(0)
+        compute.release.set()
+        results = await asyncio.gather(*waiters)
+        return compute.calls, results, cache.stats()
+
+    calls, results, stats = asyncio.run(run())
+
+    assert calls == 1
+    assert results == ["ideas"] * 5
+    assert (stats["misses"], stats["coalesced"], stats["entries"], stats["inflight"]) == (1, 4, 1, 0)
+
+
+def test_cancelled_waiter_does_not_cancel_the_computation():
+    async def run():
+        cache = AsyncTTLCache(ttl=60, max_size=8)
+        compute = Computation()
+        first = asyncio.ensure_future(cache.get_or_compute("Grettel", compute))
+        second = asyncio.ensure_future(cache.get_or_compute("Grettel", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        compute.release.set()
+        second = await second
+        cached = await cache.get_or_compute("Grettel", Computation("other"))
+        return first.cancelled(), second, cached, compute.calls
+
+    first_cancelled, second, cached, calls = asyncio.run(run())
+
+    assert first_cancelled
+    assert second == cached == "ideas"
+    assert calls == 1
+
+
+def test_failed_computation_is_not_cached():
+    async def run():
+        cache = AsyncTTLCache(ttl=60, max_size=8)
+        failing = Computation(RuntimeError("LLM down"))
+        waiters = [asyncio.ensure_future(cache.get_or_compute("Grettel", failing)) for _ in range(2)]
+        await asyncio.sleep(0)
+        failing.release.set()
+        errors = await asyncio.gather(*waiters, return_exceptions=True)
+
+        retry = Computation()
+        retry.release.set()
+        return errors, await cache.get_or_compute("Grettel", retry), retry.calls
+
+    errors, result, calls = asyncio.run(run())
+
+    assert [str(error) for error in errors] == ["LLM down"] * 2
+    assert result == "ideas"
+    assert calls == 1
+
+
+def test_results_expire_after_the_ttl():
+    async def run():
+        cache = AsyncTTLCache(ttl=0.05, max_size=8)
+        compute = Computation()
+        compute.release.set()
+        await cache.get_or_compute("Grettel", compute)
+        await cache.get_or_compute("Grettel", compute)
+        await asyncio.sleep(0.06)
+        await cache.get_or_compute("Grettel", compute)
+        return compute.calls
+
+    assert asyncio.run(run()) == 2
+
+
+@pytest.mark.parametrize("ttl, max_size", [(0, 8), (60, 0)])
+def test_disabled_cache_only_coalesces(ttl, max_size):
+    async def run():
+        cache = AsyncTTLCache(ttl=ttl, max_size=max_size)
+        compute = Computation()
+        compute.release.set()
+        await cache.get_or_compute("Grettel", compute)
+        await cache.get_or_compute("Grettel", compute)
+        return compute.calls, cache.stats()["entries"]
+
+    assert asyncio.run(run()) == (2, 0)
+
+
+def test_least_recently_used_results_are_evicted():
+    async def run():
+        cache = AsyncTTLCache(ttl=60, max_size=2)
+        computations = {member: Computation(member) for member in ["Grettel", "Laura", "Abel"]}
+        for compute in computations.values():
+            compute.release.set()
+
+        await cache.get_or_compute("Grettel", computations["Grettel"])
+        await cache.get_or_compute("Laura", computations["Laura"])
+        # Grettel is used again, so Laura is the one evicted when Abel comes in
+        await cache.get_or_compute("Grettel", computations["Grettel"])
+        await cache.get_or_compute("Abel", computations["Abel"])
+        for member in ["Grettel", "Laura", "Abel"]:
+            await cache.get_or_compute(member, computations[member])
+        return {member: compute.calls for member, compute in computations.items()}, cache.stats()["entries"]
+
+    calls, entries = asyncio.run(run())
+
+    assert calls == {"Grettel": 1, "Laura": 2, "Abel": 2}
+    assert entries == 2
@@ -0,0 +1,23 @@
+import pytest
+from datetime import datetime
+from app.utils.dates import DEFAULT_DATE_FORMAT, dateToTimestamp, parseTimestamps
+
+
+def test_parse_timestamps_matches_strptime():
+    date_strs = [f"{day}/{month}/{year:02d}" for year in (0, 23, 68, 69, 99) for month in range(1, 13) for day in (1, 9, 28, 29, 30, 31)]
+    date_strs = [date_str for date_str in date_strs if not date_str.startswith(("29/2/", "30/2/", "31/2/", "31/4/", "31/6/", "31/9/", "31/11/"))]
+    date_strs += ["29/2/24", "01/02/23", "1/2/23"] * 3
+
+    assert list(parseTimestamps(iter(date_strs), DEFAULT_DATE_FORMAT)) == [
+        dateToTimestamp(datetime.strptime(date_str, DEFAULT_DATE_FORMAT)) for date_str in date_strs
+    ]
+
+
+@pytest.mark.parametrize("date_str", ["29/2/23", "31/4/23", "1/13/23", "0/1/23", "1-1-23"])
+def test_parse_timestamps_rejects_invalid_dates(date_str):
+    with pytest.raises(ValueError):
+        parseTimestamps(["1/1/23", date_str], DEFAULT_DATE_FORMAT)
+
+
+def test_parse_timestamps_in_other_formats():
+    assert list(parseTimestamps(["2023-01-05", "2023-01-05"], "%Y-%m-%d")) == [1672876800] * 2
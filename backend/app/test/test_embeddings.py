@@ -0,0 +1,84 @@
+import time
+import asyncio
+from typing import List
+from langchain_cohere import CohereEmbeddings
+from langchain_core.embeddings import Embeddings
+from app.setup.ingestion import DEFAULT_EMBEDDING_BATCH_SIZE
+from app.utils.embeddings import ACCESS_UPDATE_INTERVAL, CachedEmbeddings, QueryCache, aembed_queries
+
+
+class RecordingCohere(CohereEmbeddings):
+    """Cohere embeddings that record the size of each request instead of sending it."""
+
+    requests: List[int] = []
+
+    async def aembed(self, texts, *, input_type=None):
+        self.requests.append(len(texts))
+        await asyncio.sleep(0)
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def test_aembed_queries_splits_requests_in_batches():
+    embeddings = RecordingCohere(model="embed-multilingual-v3.0", cohere_api_key="test")
+    texts = [f"Cuáles son 5 de los principales intereses de {'x' * i}?" for i in range(250)]
+
+    vectors = asyncio.run(aembed_queries(embeddings, texts))
+
+    assert max(embeddings.requests) <= DEFAULT_EMBEDDING_BATCH_SIZE
+    assert sum(embeddings.requests) == len(texts)
+    assert vectors == [[float(len(text)), 1.0] for text in texts]
+
+
+def test_query_cache_prewarm_splits_requests_in_batches():
+    embeddings = RecordingCohere(model="embed-multilingual-v3.0", cohere_api_key="test")
+    cache = QueryCache(embeddings, namespace="test", max_size=1024)
+    texts = [f"pregunta {i}" for i in range(200)]
+
+    assert asyncio.run(cache.aprewarm(texts)) == len(texts)
+
+    assert max(embeddings.requests) <= DEFAULT_EMBEDDING_BATCH_SIZE
+    assert cache.embed_query("pregunta 150") == [float(len("pregunta 150")), 1.0]
+
+
+class CountingEmbeddings(Embeddings):
+    """Embeddings that record the texts they embed."""
+
+    def __init__(self):
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+def test_cached_embeddings_embed_each_document_once(tmp_path):
+    base = CountingEmbeddings()
+    embeddings = CachedEmbeddings(base, "test:2", str(tmp_path / "embeddings.sqlite"))
+    texts = [f"chunk {i}" for i in range(10)]
+
+    first = asyncio.run(embeddings.aembed_documents(texts))
+    second = asyncio.run(embeddings.aembed_documents(texts + ["new chunk"]))
+
+    assert first == second[:10] == [[float(len(text)), 1.0] for text in texts]
+    assert base.texts == texts + ["new chunk"]
+    assert embeddings.stats()["hits"] == 10
+
+
+def test_cached_embeddings_only_update_old_access_times(tmp_path):
+    embeddings = CachedEmbeddings(CountingEmbeddings(), "test:2", str(tmp_path / "embeddings.sqlite"))
+    texts = [f"chunk {i}" for i in range(10)]
+    embeddings.embed_documents(texts)
+
+    # Looking up vectors stored a moment ago writes nothing
+    changes = embeddings._connection.total_changes
+    embeddings.embed_documents(texts)
+    assert embeddings._connection.total_changes == changes
+
+    # Those last used long ago are marked as used again
+    embeddings._connection.execute("UPDATE embeddings SET accessed = ?", [time.time() - 2 * ACCESS_UPDATE_INTERVAL])
+    embeddings.embed_documents(texts[:4])
+    accessed = [row[0] for row in embeddings._connection.execute("SELECT accessed FROM embeddings")]
+    assert sum(value > time.time() - ACCESS_UPDATE_INTERVAL for value in accessed) == 4
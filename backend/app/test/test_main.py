@@ -0,0 +1,72 @@
+import threading
+from fastapi.testclient import TestClient
+import app.main as main
+from app.setup import data
+
+
+def test_healthz_responds_while_initializing(monkeypatch):
+    release = threading.Event()
+
+    def get_catalog(refresh: bool = False):
+        # Reading the chat exports takes until the test is done with the probes
+        release.wait(timeout=10)
+        raise RuntimeError("No chat exports")
+
+    monkeypatch.setattr(main, "get_catalog", get_catalog)
+    with TestClient(main.app) as client:
+        try:
+            health = client.get("/healthz")
+            ready = client.get("/readyz")
+            gift_ideas = client.get("/api/gift-ideas/Grettel")
+        finally:
+            release.set()
+
+    assert health.status_code == 200
+    assert health.json() == {"status": "ok"}
+    assert ready.status_code == 503
+    assert ready.json() == {"status": "starting"}
+    assert ready.headers["Retry-After"] == str(main.RETRY_AFTER_SECONDS)
+    assert gift_ideas.status_code == 503
+
+
+def test_team_members_wait_for_the_catalog_being_loaded(monkeypatch):
+    release = threading.Event()
+    loads = []
+
+    class Catalog:
+        files = []
+
+        def member_names(self):
+            return ["Grettel", "Laura Monestel"]
+
+    def load_catalog(timestamp_regex, date_format):
+        # Reading the chat exports takes until the test lets it finish
+        loads.append(threading.current_thread().name)
+        release.wait(timeout=10)
+        return Catalog()
+
+    async def fail_to_initialize(**kwargs):
+        raise RuntimeError("No conversations index")
+
+    async def skip_company_culture(data_files):
+        pass
+
+    monkeypatch.setattr(data, "_catalog", None)
+    monkeypatch.setattr(data, "load_catalog", load_catalog)
+    monkeypatch.setattr(main, "get_conversations_retriever", fail_to_initialize)
+    monkeypatch.setattr(main, "initialize_company_culture", skip_company_culture)
+    responses = {}
+    with TestClient(main.app) as client:
+        request = threading.Thread(target=lambda: responses.update(teamMembers=client.get("/api/teamMembers")))
+        try:
+            request.start()
+            health = client.get("/healthz")
+            waiting = request.is_alive()
+        finally:
+            release.set()
+            request.join(timeout=10)
+
+    assert health.status_code == 200
+    assert waiting
+    assert responses["teamMembers"].json() == {"teamMembers": ["Grettel", "Laura Monestel"]}
+    assert len(loads) == 1
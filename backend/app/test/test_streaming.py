@@ -0,0 +1,126 @@
+import json
+import asyncio
+import app.main as main
+from app.utils.cache import AsyncTTLCache
+from app.utils.streaming import JsonArrayStream, StreamedList
+
+
+def feed_all(parser: JsonArrayStream, pieces) -> list:
+    return [item for piece in pieces for item in parser.feed(piece)]
+
+
+def test_json_array_stream_parses_objects_split_across_tokens():
+    text = 'Final Answer: [{"name": "Libro", "description": "Le gusta leer"}, {"name": "Taza", "description": "Toma café"}] listo'
+    pieces = [text[i:i + 3] for i in range(0, len(text), 3)]
+
+    assert feed_all(JsonArrayStream(), pieces) == [
+        {"name": "Libro", "description": "Le gusta leer"},
+        {"name": "Taza", "description": "Toma café"},
+    ]
+
+
+def test_json_array_stream_handles_escaped_quotes_and_brackets_in_strings():
+    text = r'{"ideas": [{"name": "Póster \"[Star Wars]\"", "description": "Dice \\ \"{que}\""}]}'
+
+    assert feed_all(JsonArrayStream(), list(text)) == [json.loads(text)["ideas"][0]]
+
+
+def test_json_array_stream_ignores_what_follows_the_array():
+    parser = JsonArrayStream()
+
+    assert parser.feed('[{"name": "A"}] [{"name": "B"}]') == [{"name": "A"}]
+    assert parser.feed('{"name": "C"}') == []
+
+
+def test_streamed_list_sends_every_item_once():
+    ideas = StreamedList("idea")
+
+    assert ideas.update(["a"]) == [("idea", "a")]
+    assert ideas.update(["a", "b"]) == [("idea", "b")]
+    # The answer is written again the same way
+    assert ideas.update(["a"]) == []
+    assert ideas.update(["a", "b", "c"]) == [("idea", "c")]
+    assert ideas.finish(["a", "b", "c"]) == []
+
+
+def test_streamed_list_resets_when_the_answer_changes():
+    ideas = StreamedList("idea")
+    ideas.update(["a", "b"])
+
+    # A retried answer that differs from what was sent
+    assert ideas.update(["a", "x"]) == [("reset", {}), ("idea", "a"), ("idea", "x")]
+    # The final answer has fewer ideas than were streamed
+    assert ideas.finish(["a"]) == [("reset", {}), ("idea", "a")]
+
+
+def parse_sse(events: list) -> list:
+    parsed = []
+    for event in events:
+        name, data = event.strip().split("\n")
+        parsed.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return parsed
+
+
+def idea(name: str) -> dict:
+    return {"name": name, "description": f"Regalo {name}"}
+
+
+def test_stream_gift_ideas_reconciles_a_retried_answer(monkeypatch):
+    async def stream_gift_ideas_with_agent(teamMember, model_name):
+        yield "status", {"step": "ideas"}
+        # A final answer that can't be parsed, and is written again differently
+        yield "ideas", [idea("Libro")]
+        yield "ideas", [idea("Libro"), idea("Taza")]
+        yield "ideas", [idea("Libro")]
+        yield "ideas", [idea("Libro"), idea("Planta")]
+        yield "result", [idea("Libro"), idea("Planta")]
+
+    monkeypatch.setattr(main, "stream_gift_ideas_with_agent", stream_gift_ideas_with_agent)
+    monkeypatch.setattr(main, "gift_ideas_cache", AsyncTTLCache(ttl=60, max_size=8))
+    monkeypatch.setenv("PIPELINE_MODE", "agent")
+
+    async def stream():
+        return [event async for event in main.stream_gift_ideas("Grettel", "gpt-4.1-mini")]
+
+    assert parse_sse(asyncio.run(stream())) == [
+        ("status", {"step": "ideas"}),
+        ("idea", idea("Libro")),
+        ("idea", idea("Taza")),
+        ("reset", {}),
+        ("idea", idea("Libro")),
+        ("idea", idea("Planta")),
+        ("done", {"giftIdeas": [idea("Libro"), idea("Planta")]}),
+    ]
+
+
+def test_concurrent_streams_share_a_single_run(monkeypatch):
+    runs = []
+
+    async def stream_gift_ideas_with_agent(teamMember, model_name):
+        runs.append(teamMember)
+        yield "status", {"step": "ideas"}
+        for i in range(1, 4):
+            await asyncio.sleep(0.01)
+            yield "ideas", [idea(str(n)) for n in range(i)]
+        yield "result", [idea(str(n)) for n in range(3)]
+
+    monkeypatch.setattr(main, "stream_gift_ideas_with_agent", stream_gift_ideas_with_agent)
+    monkeypatch.setattr(main, "gift_ideas_cache", AsyncTTLCache(ttl=60, max_size=8))
+    monkeypatch.setenv("PIPELINE_MODE", "agent")
+
+    async def stream(delay: float):
+        await asyncio.sleep(delay)
+        return parse_sse([event async for event in main.stream_gift_ideas("Grettel", "gpt-4.1-mini")])
+
+    async def streams():
+        # The last one comes in once the gift ideas are cached
+        concurrent = await asyncio.gather(stream(0), stream(0.015))
+        return [*concurrent, await stream(0)]
+
+    first, joined, cached = asyncio.run(streams())
+
+    assert runs == ["Grettel"]
+    assert first == joined
+    assert [event for event in first if event[0] != "status"] == cached
+    assert cached[-1] == ("done", {"giftIdeas": [idea("0"), idea("1"), idea("2")]})
+    assert main.gift_ideas_streams == {}
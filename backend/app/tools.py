@@ -1,26 +1,57 @@
 from typing import Dict, Any, Optional, List
 import httpx
-import asyncio
 from langchain_core.tools import tool
 from langchain_core.vectorstores import VectorStoreRetriever
 from app.utils.chains import get_interests_rag_chain
 
 from langchain.tools import BaseTool
 
+# Question the tool asks about a team member, also embedded ahead of time on startup
+INTERESTS_QUESTION = "Cuáles son 5 de los principales intereses de {team_member}?"
+
+def get_interests_question(team_member: str) -> str:
+    return INTERESTS_QUESTION.format(team_member=team_member)
+
 class TeamMemberInterestsTool(BaseTool):
     """Tool to get interests of a team member."""
     
-    def __init__(self, vector_store_retriever: VectorStoreRetriever):
+    def __init__(self, vector_store_retriever: VectorStoreRetriever, profiles: Optional[Any] = None):
+        """
+        Args:
+            vector_store_retriever: Retriever of the conversations
+            profiles: Precomputed interests of the team members (see InterestProfiles), if any
+        """
         super().__init__(
             name="get_team_member_interests",
             description="Get the interests of a team member."
         )
         self._vector_store_retriever = vector_store_retriever
+        self._profiles = profiles
+        # Built on first use and shared by every call (see get_interests_rag_chain)
+        self._rag_chain = None
 
     @property
     def vector_store_retriever(self) -> VectorStoreRetriever:
         return self._vector_store_retriever
 
+    def _get_profile(self, team_member: str) -> Optional[str]:
+        # Answer from the precomputed profile while the member's chats haven't changed
+        if self._profiles is not None:
+            return self._profiles.get(team_member)
+        return None
+
+    def _get_rag_chain(self):
+        if not self._vector_store_retriever:
+            raise ValueError("Vector store retriever is required")
+
+        if self._rag_chain is None:
+            self._rag_chain = get_interests_rag_chain(self._vector_store_retriever)
+        return self._rag_chain
+
+    def _save_profile(self, team_member: str, interests: str) -> None:
+        if self._profiles is not None and team_member in self._profiles.versions:
+            self._profiles.put(team_member, interests)
+
     def _run(self, team_member: str) -> str:
         """
         Get the interests of a team member.
@@ -31,17 +62,31 @@ class TeamMemberInterestsTool(BaseTool):
         Returns:
             A string containing the team member's interests
         """
-        if not self._vector_store_retriever:
-            raise ValueError("Vector store retriever is required")
-            
-        rag_chain = get_interests_rag_chain(self._vector_store_retriever)
-        query_text = f"Cuáles son 5 de los principales intereses de {team_member}?"
-        response = rag_chain.invoke({"question": query_text})
+        # The agent sometimes quotes the name
+        team_member = team_member.strip().strip("\"'")
+
+        interests = self._get_profile(team_member)
+        if interests is not None:
+            return interests
+
+        # Only the conversations the team member takes part in are searched
+        query_text = get_interests_question(team_member)
+        response = self._get_rag_chain().invoke({"question": query_text, "team_member": team_member})
+        self._save_profile(team_member, response)
         return response
 
     async def _arun(self, team_member: str) -> str:
         """
-        Async implementation of _run.
-        Runs the synchronous code in a separate thread to avoid blocking.
+        Async implementation of _run: the search and the LLM call are awaited on the event
+        loop, without holding a worker thread.
         """
-        return await asyncio.to_thread(self._run, team_member)
+        team_member = team_member.strip().strip("\"'")
+
+        interests = self._get_profile(team_member)
+        if interests is not None:
+            return interests
+
+        query_text = get_interests_question(team_member)
+        response = await self._get_rag_chain().ainvoke({"question": query_text, "team_member": team_member})
+        self._save_profile(team_member, response)
+        return response
@@ -0,0 +1,183 @@
+import os
+import re
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from typing import Any, Dict, Iterable, List, Tuple
+from langchain_core.documents import Document
+from langchain_community.vectorstores.qdrant import Qdrant
+
+# Messages per block at most, so blocks stay well within the input limit of the embedding models
+DEFAULT_BLOCK_MESSAGES = 20
+
+
+def splitBlocks(text: str, timeStampRegex: str, maxMessages: int = DEFAULT_BLOCK_MESSAGES) -> List[str]:
+    """
+    Split the text of a chunk into blocks: runs of consecutive messages from the same day, of at
+    most `maxMessages` messages each.
+
+    Chunks that overlap share whole days, so the same blocks show up in every chunk that
+    contains a day and each of them only has to be embedded once.
+
+    Args:
+        text (str): Text of the chunk, one message per line
+        timeStampRegex (str): Regex pattern to match timestamps, its first group being the date
+        maxMessages (int): Maximum number of messages per block
+
+    Returns:
+        List[str]: The blocks, which joined together give back the text of the chunk
+    """
+    ts_pattern = re.compile(timeStampRegex)
+    blocks = []
+    current = []
+    current_date = None
+    for line in text.splitlines(keepends=True):
+        match = ts_pattern.search(line)
+        date = match.group(1) if match else current_date
+        if current and (date != current_date or len(current) >= maxMessages):
+            blocks.append("".join(current))
+            current = []
+        current.append(line)
+        current_date = date
+    if current:
+        blocks.append("".join(current))
+    return blocks
+
+
+def blockId(text: str) -> str:
+    """Id of a block, derived from its text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def poolVectors(vectors: List[List[float]], weights: List[float]) -> List[float]:
+    """
+    Weighted mean of the normalized vectors of the blocks of a chunk, normalized again.
+
+    Args:
+        vectors (List[List[float]]): Vector of each block
+        weights (List[float]): Weight of each block, e.g. its length
+
+    Returns:
+        List[float]: Vector of the chunk
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1, norms)
+    pooled = np.average(matrix, axis=0, weights=np.asarray(weights, dtype=np.float32))
+    norm = np.linalg.norm(pooled)
+    return (pooled / norm if norm else pooled).tolist()
+
+
+class BlockStore:
+    """
+    SQLite store of the blocks an index is built from: their text, stored once however many
+    chunks share them, and their vectors.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): Path to the SQLite database file, ":memory:" to keep it in memory
+        """
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS blocks (id TEXT PRIMARY KEY, text TEXT NOT NULL, vector BLOB)"
+        )
+        self._connection.commit()
+
+    def missing(self, ids: List[str]) -> List[str]:
+        """Ids of the blocks that don't have a vector yet."""
+        found = set()
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                found.update(row[0] for row in self._connection.execute(
+                    f"SELECT id FROM blocks WHERE vector IS NOT NULL AND id IN ({placeholders})", batch
+                ))
+        return [id for id in ids if id not in found]
+
+    def add(self, texts: List[str], vectors: List[List[float]]) -> None:
+        """Store blocks with their vectors."""
+        rows = [(blockId(text), text, np.asarray(vector, dtype=np.float32).tobytes()) for text, vector in zip(texts, vectors)]
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?)", rows)
+            self._connection.commit()
+
+    def _fetch(self, column: str, ids: Iterable[str]) -> Dict[str, Any]:
+        ids = list(dict.fromkeys(ids))
+        found = {}
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                found.update(self._connection.execute(
+                    f"SELECT id, {column} FROM blocks WHERE id IN ({placeholders})", batch
+                ))
+        return found
+
+    def texts(self, ids: Iterable[str]) -> Dict[str, str]:
+        """Text of the blocks, by id."""
+        return self._fetch("text", ids)
+
+    def vectors(self, ids: Iterable[str]) -> Dict[str, List[float]]:
+        """Vectors of the blocks, by id."""
+        return {id: np.frombuffer(blob, dtype=np.float32).tolist() for id, blob in self._fetch("vector", ids).items()}
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM blocks").fetchone()[0]
+
+    def prune(self, ids: Iterable[str]) -> int:
+        """
+        Delete every block but the given ones, e.g. those of chunks that were dropped. Their
+        space is reused by the blocks added later.
+
+        Returns:
+            int: Number of blocks deleted
+        """
+        with self._lock:
+            self._connection.execute("CREATE TEMP TABLE IF NOT EXISTS kept (id TEXT PRIMARY KEY)")
+            self._connection.execute("DELETE FROM kept")
+            self._connection.executemany("INSERT OR IGNORE INTO kept VALUES (?)", ((id,) for id in ids))
+            deleted = self._connection.execute("DELETE FROM blocks WHERE id NOT IN (SELECT id FROM kept)").rowcount
+            self._connection.execute("DELETE FROM kept")
+            self._connection.commit()
+        return deleted
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class BlockQdrant(Qdrant):
+    """
+    Qdrant vector store whose points only hold the ids of their blocks (in the "blocks" metadata
+    field). The text of the documents it returns is put back together from a BlockStore.
+    """
+
+    def __init__(self, *args: Any, block_store: BlockStore, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.block_store = block_store
+
+    def _with_block_text(self, results: List[Tuple[Document, float]]) -> List[Tuple[Document, float]]:
+        texts = self.block_store.texts(id for document, _ in results for id in document.metadata.get("blocks", []))
+        for document, _ in results:
+            if not document.page_content:
+                document.page_content = "".join(texts.get(id, "") for id in document.metadata.get("blocks", []))
+        return results
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        # The async and text searches all end up here (local Qdrant has no async client)
+        return self._with_block_text(super().similarity_search_with_score_by_vector(embedding, k, **kwargs))
+
+    def max_marginal_relevance_search_with_score_by_vector(self, embedding: List[float], k: int = 4, fetch_k: int = 20,
+                                                           lambda_mult: float = 0.5, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self._with_block_text(
+            super().max_marginal_relevance_search_with_score_by_vector(embedding, k, fetch_k, lambda_mult, **kwargs)
+        )
@@ -0,0 +1,182 @@
+import re
+import json
+import math
+import unicodedata
+import numpy as np
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+# Common Spanish words, without accents (see tokenize), that say nothing about a chunk
+SPANISH_STOPWORDS = frozenset("""
+a al algo algunas algunos ante antes como con contra cual cuales cuando de del desde donde durante
+e el ella ellas ellos en entre era es esa esas ese eso esos esta estas este esto estos esta estan
+estar estoy fue ha han has hay he hemos hasta la las le les lo los mas me mi mis mucho muchos muy
+nada ni no nos nosotros o os otra otras otro otros para pero poco por porque que quien quienes se
+sea ser si sin sobre son soy su sus tambien tanto te ti todo todos tu tus un una uno unos y ya yo
+am pm
+""".split())
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def fold(text: str) -> str:
+    """Lowercase a text and drop its accents, so "Música" and "musica" match."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def stem(token: str) -> str:
+    """
+    Light Spanish stemmer: drops the trailing vowels and plural "s" of longer words, so
+    singulars and plurals meet, e.g. "viajes" and "viaje" become "viaj", and "intereses"
+    and "interes" become "inter".
+    """
+    while len(token) > 4 and token[-1] in "aeos":
+        token = token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a Spanish text into search terms: folded (see fold), without stopwords or numbers
+    (like the ones in timestamps), and stemmed (see stem).
+    """
+    return [
+        stem(token)
+        for token in TOKEN_PATTERN.findall(fold(text))
+        if token not in SPANISH_STOPWORDS and not token.isdigit() and len(token) > 1
+    ]
+
+
+class BM25Index:
+    """
+    Inverted index of a set of documents, scored with BM25.
+
+    Postings are kept in compressed sparse rows: the documents and term frequencies of every
+    term sit next to each other in two arrays, and each term points to its slice of them.
+    """
+
+    def __init__(self, ids: List[str], lengths: np.ndarray, terms: Dict[str, int], offsets: np.ndarray, docs: np.ndarray,
+                 freqs: np.ndarray, k1: float = 1.2, b: float = 0.75):
+        """
+        Use BM25Index.build or BM25Index.load to create an index.
+
+        Args:
+            ids (List[str]): Id of each document
+            lengths (np.ndarray): Number of terms of each document
+            terms (Dict[str, int]): Row of each term
+            offsets (np.ndarray): Start of the postings of each row (and the end of the last one)
+            docs (np.ndarray): Document of each posting
+            freqs (np.ndarray): Frequency of the term in the document of each posting
+            k1 (float): Term frequency saturation
+            b (float): Document length normalization
+        """
+        self.ids = ids
+        self.lengths = lengths
+        self.terms = terms
+        self.offsets = offsets
+        self.docs = docs
+        self.freqs = freqs
+        self.k1 = k1
+        self.b = b
+        self.average_length = float(lengths.mean()) if len(lengths) else 0.0
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[str, str]]) -> "BM25Index":
+        """
+        Index some documents.
+
+        Args:
+            documents (Iterable[Tuple[str, str]]): Id and text of each document
+        """
+        ids = []
+        lengths = []
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc, (id, text) in enumerate(documents):
+            counts = Counter(tokenize(text))
+            ids.append(id)
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((doc, count))
+
+        terms = {term: row for row, term in enumerate(sorted(postings))}
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for term, row in terms.items():
+            offsets[row + 1] = offsets[row] + len(postings[term])
+        docs = np.fromiter((doc for term in terms for doc, _ in postings[term]), dtype=np.int32, count=int(offsets[-1]))
+        freqs = np.fromiter((count for term in terms for _, count in postings[term]), dtype=np.int32, count=int(offsets[-1]))
+        return cls(ids, np.asarray(lengths, dtype=np.int32), terms, offsets, docs, freqs)
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """
+        Get the documents that best match a query.
+
+        Args:
+            query (str): The query
+            k (int): Maximum number of documents to return
+
+        Returns:
+            List[Tuple[str, float]]: Id and score of the best documents, best first
+        """
+        if not self.ids:
+            return []
+
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        norms = self.k1 * (1 - self.b + self.b * self.lengths / (self.average_length or 1))
+        for term in set(tokenize(query)):
+            row = self.terms.get(term)
+            if row is None:
+                continue
+            start, end = self.offsets[row], self.offsets[row + 1]
+            docs = self.docs[start:end]
+            freqs = self.freqs[start:end]
+            idf = math.log(1 + (len(self.ids) - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * freqs * (self.k1 + 1) / (freqs + norms[docs])
+
+        matches = np.flatnonzero(scores)
+        if len(matches) > k:
+            matches = matches[np.argpartition(-scores[matches], k - 1)[:k]]
+        matches = matches[np.argsort(-scores[matches], kind="stable")]
+        return [(self.ids[doc], float(scores[doc])) for doc in matches]
+
+    def save(self, path: str, stamp: str = "") -> None:
+        """
+        Save the index to a .npz file.
+
+        Args:
+            path (str): Path to the file
+            stamp (str): Identifies what the index was built from (see load)
+        """
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                meta=np.array(json.dumps({"ids": self.ids, "terms": list(self.terms), "stamp": stamp, "k1": self.k1, "b": self.b})),
+                lengths=self.lengths,
+                offsets=self.offsets,
+                docs=self.docs,
+                freqs=self.freqs,
+            )
+
+    @classmethod
+    def load(cls, path: str, stamp: str = "") -> "BM25Index":
+        """
+        Load an index saved with save.
+
+        Raises:
+            FileNotFoundError: If there is no index
+            ValueError: If the index was saved with another stamp
+        """
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta["stamp"] != stamp:
+                raise ValueError("The keyword index is out of date")
+            return cls(
+                meta["ids"],
+                data["lengths"],
+                {term: row for row, term in enumerate(meta["terms"])},
+                data["offsets"],
+                data["docs"],
+                data["freqs"],
+                k1=meta["k1"],
+                b=meta["b"],
+            )
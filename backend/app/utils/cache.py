@@ -0,0 +1,110 @@
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class AsyncTTLCache:
+    """
+    Cache of the results of async computations, which expire after `ttl` seconds. The least
+    recently used results are evicted once there are more than `max_size`.
+
+    Concurrent requests for the same key share a single computation (single flight): the
+    first one starts it and the others wait for its result. A failed computation is not
+    cached, its error reaches everyone waiting for it.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        """
+        Args:
+            ttl (float): Seconds a result is kept
+            max_size (int): Maximum number of results kept, 0 to only coalesce concurrent requests
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def _get(self, key: Hashable) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def _put(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Get the cached result for a key, or compute it.
+
+        Args:
+            key (Hashable): Key of the result
+            compute (Callable[[], Awaitable[Any]]): Computes the result if it isn't cached
+
+        Returns:
+            Any: The result
+        """
+        # A caller that goes away (e.g. a closed connection) doesn't cancel the computation
+        # the others are waiting for
+        return await asyncio.shield(self.future(key, compute))
+
+    def future(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """
+        Same as get_or_compute, without waiting for the result: `compute` is called right away
+        if the result is neither cached nor being computed.
+
+        Returns:
+            asyncio.Future: The future of the result, already done if it's cached. Cancelling
+                it cancels the computation for everyone waiting for it
+        """
+        found, value = self._get(key)
+        if found:
+            self.hits += 1
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+            return future
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+
+            def done(task: asyncio.Future) -> None:
+                self._inflight.pop(key, None)
+                if not task.cancelled() and task.exception() is None:
+                    self._put(key, task.result())
+
+            task.add_done_callback(done)
+        return task
+
+    def invalidate(self) -> None:
+        """Drop every cached result."""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / requests if requests else 0.0,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+        }
@@ -1,18 +1,30 @@
 import os
 from langchain.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 from operator import itemgetter
 from langchain_core.vectorstores import VectorStoreRetriever
+from langchain_community.vectorstores.qdrant import Qdrant
+from qdrant_client.http.models import FieldCondition, Filter, MatchValue
+from functools import lru_cache
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from app.utils.llm import get_chat_model
+from app.utils.retrievers import abatch_retrieve
 
-def get_interests_rag_chain(vector_store_retriever: VectorStoreRetriever):
-    llm_name = os.getenv("INTERESTS_RAG_LLM")
-
-    if not llm_name:
-        raise ValueError("INTERESTS_RAG_LLM environment variable not set")
+def get_member_filter(vector_store_retriever: VectorStoreRetriever, team_member: str):
+    """
+    Search filter that only matches the chunks a team member sends messages in (their
+    "participants" metadata), in the form the vector store of the retriever takes.
+    """
+    vector_store = vector_store_retriever.vectorstore
+    if isinstance(vector_store, Qdrant):
+        return Filter(must=[
+            FieldCondition(key=f"{vector_store.metadata_payload_key}.participants", match=MatchValue(value=team_member))
+        ])
+    return {"participants": team_member}
 
-    RAG_PROMPT = """\
+RAG_PROMPT = """\
       Contexto:
       {context}
 
@@ -22,24 +34,110 @@ def get_interests_rag_chain(vector_store_retriever: VectorStoreRetriever):
       Si no hay suficiente información en el contexto para responder la pregunta, responde que no sabes la respuesta. Responde la pregunta con una lista numerada.
     """
 
-    rag_prompt_template = ChatPromptTemplate.from_template(RAG_PROMPT)
-    
-    rag_llm = ChatOpenAI(
-        model=llm_name,
-        temperature=0
-    )
+RAG_PROMPT_TEMPLATE = ChatPromptTemplate.from_template(RAG_PROMPT)
+
+def get_interests_rag_chain(vector_store_retriever: VectorStoreRetriever, team_member: Optional[str] = None):
+    """
+    Chain that answers a question from the chunks the retriever finds.
+
+    When a team member is given, only the chunks they take part in are searched. If none
+    matches (e.g. the name is spelled differently), the whole collection is searched instead.
+    The team member can also be passed with each question ("team_member" input), so a single
+    chain, built once, serves every member.
+    """
+    llm_name = os.getenv("INTERESTS_RAG_LLM")
+
+    if not llm_name:
+        raise ValueError("INTERESTS_RAG_LLM environment variable not set")
 
-    # Define a function to retrieve context based on the question
+    # The model (and its connections) are shared with every other chain
+    rag_llm = get_chat_model(llm_name, temperature=0)
+
+    def get_search_filter(inputs):
+        member = inputs.get("team_member") or team_member
+        return get_member_filter(vector_store_retriever, member) if member else None
+
+    # Define a function to retrieve context based on the question, unless it was already
+    # retrieved (see abatch_retrieve_context)
     def retrieve_context(inputs):
+        if inputs.get("context") is not None:
+            return inputs["context"]
+        question = inputs["question"]
+        search_filter = get_search_filter(inputs)
+        docs = vector_store_retriever.invoke(question, filter=search_filter) if search_filter else []
+        if not docs:
+            docs = vector_store_retriever.invoke(question)
+        return "\n\n".join(doc.page_content for doc in docs)
+
+    # Same, for ainvoke: the search doesn't hold a worker thread while the query is embedded
+    async def aretrieve_context(inputs):
+        if inputs.get("context") is not None:
+            return inputs["context"]
         question = inputs["question"]
-        docs = vector_store_retriever.invoke(question)
+        search_filter = get_search_filter(inputs)
+        docs = await vector_store_retriever.ainvoke(question, filter=search_filter) if search_filter else []
+        if not docs:
+            docs = await vector_store_retriever.ainvoke(question)
         return "\n\n".join(doc.page_content for doc in docs)
 
     # Create the RAG chain using the current API
     return (
         RunnablePassthrough()
-        | {"context": retrieve_context, "question": itemgetter("question")}
-        | rag_prompt_template
+        | {"context": RunnableLambda(retrieve_context, afunc=aretrieve_context), "question": itemgetter("question")}
+        | RAG_PROMPT_TEMPLATE
         | rag_llm
         | StrOutputParser()
-    )
\ No newline at end of file
+    )
+
+
+async def abatch_retrieve_context(vector_store_retriever: VectorStoreRetriever, questions: List[str],
+                                  team_members: List[str]) -> List[str]:
+    """
+    Context of the interests RAG chain for several questions about team members at once (the
+    "context" input of the chain), with the same filters and fallback as the chain, but with
+    one embedding call and one batched search for all of them (see abatch_retrieve).
+
+    Args:
+        vector_store_retriever (VectorStoreRetriever): Retriever of the conversations
+        questions (List[str]): The questions
+        team_members (List[str]): The team member each question is about
+
+    Returns:
+        List[str]: The context of each question
+    """
+    filters = [get_member_filter(vector_store_retriever, member) for member in team_members]
+    results = await abatch_retrieve(vector_store_retriever, questions, filters)
+
+    # Members no chunk matches fall back to the whole collection
+    empty = [i for i, docs in enumerate(results) if not docs]
+    if empty:
+        fallback = await abatch_retrieve(vector_store_retriever, [questions[i] for i in empty], [None] * len(empty))
+        for i, docs in zip(empty, fallback):
+            results[i] = docs
+    return ["\n\n".join(doc.page_content for doc in docs) for docs in results]
+
+
+GIFT_IDEAS_PROMPT = """\
+      Eres un amigo experto regalando regalos. Sugiere 3 ideas de regalos concretas que no sean demasiado caras para {team_member}, con base en sus intereses:
+      {interests}
+
+      Si no hay suficiente información sobre los intereses de la persona, no sugieras ningún regalo.
+    """
+
+class GiftIdea(BaseModel):
+    name: str = Field(description="Nombre del regalo")
+    description: str = Field(description="Una explicación simple de por qué es un buen regalo (máximo 30 palabras)")
+
+class GiftIdeas(BaseModel):
+    ideas: List[GiftIdea] = Field(description="Ideas de regalos")
+
+@lru_cache(maxsize=None)
+def get_gift_ideas_chain(model_name: str, temperature: Optional[float] = None):
+    """
+    Chain that suggests gift ideas from the interests of a team member (inputs "team_member"
+    and "interests") in a single structured output call, built once per model.
+    """
+    return (
+        ChatPromptTemplate.from_template(GIFT_IDEAS_PROMPT)
+        | get_chat_model(model_name, temperature=temperature).with_structured_output(GiftIdeas)
+    )
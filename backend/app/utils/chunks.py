@@ -1,9 +1,18 @@
+import os
 import re
+import hashlib
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, wait
 from datetime import datetime, timedelta
-from typing import Generator, Tuple, List, Dict
-from app.utils.dates import getDateIntervals
+from functools import lru_cache, partial
+from itertools import islice
+from multiprocessing import get_context
+from typing import Generator, Tuple, List, Dict, Optional
+from app.utils.dates import dateToTimestamp, getDateIntervals, getNextIntervalDate, parseDate, timestampToDate
+from app.utils.messages import MessageTable, getMessageTable
 
-def chunkTimeStampedFile(filepath: str, timeStampRegex: str, dateRegex: str, interval: str, overlap: int) -> Generator[Tuple[datetime, datetime, List[str]], None, None]:
+def chunkTimeStampedFile(filepath: str, timeStampRegex: str, dateRegex: str, interval: str, overlap: int, streaming: bool = False) -> Generator[Tuple[datetime, datetime, List[str]], None, None]:
     """
     Generator that yields chunks of a timestamped file based on intervals with overlap periods
     at both the beginning and end of each chunk.
@@ -14,6 +23,9 @@ def chunkTimeStampedFile(filepath: str, timeStampRegex: str, dateRegex: str, int
         dateRegex (str): Format string for parsing the datetime
         interval (str): One of 'day', 'week', or 'month'
         overlap (int): Number of days to overlap at the beginning and end of each chunk
+        streaming (bool): If False, query the file's message table (see getMessageTable), which
+            is parsed once and shared with every other chunker. If True, read the file without
+            keeping it in memory (see streamTimeStampedFile)
         
     Yields:
         Tuple[datetime, datetime, List[str]]: Each chunk containing:
@@ -21,93 +33,501 @@ def chunkTimeStampedFile(filepath: str, timeStampRegex: str, dateRegex: str, int
             - End date of the chunk (including overlap)
             - List of lines in the chunk
     """
+    if streaming:
+        yield from streamTimeStampedFile(filepath, timeStampRegex, dateRegex, interval, overlap)
+    else:
+        yield from chunkMessageTable(getMessageTable(filepath, timeStampRegex, dateRegex), interval, overlap)
+
+def getChunkRanges(startDate: datetime, endDate: datetime, interval: str, overlap: int) -> List[Tuple[datetime, datetime]]:
+    """
+    Date ranges of the calendar chunks of a file, one per interval, as chunkTimeStampedFile
+    makes them.
+
+    Args:
+        startDate (datetime): Date of the first line of the file
+        endDate (datetime): Latest date in the file
+        interval (str): One of 'day', 'week', or 'month'
+        overlap (int): Number of days to overlap at the beginning and end of each chunk
+
+    Returns:
+        List[Tuple[datetime, datetime]]: Start and end date (both included) of each chunk
+    """
+    # Get the base intervals (without overlap)
+    intervals = getDateIntervals(startDate, endDate, interval)
+
+    ranges = []
+    for i in range(len(intervals)):
+        # If not the first chunk, add overlap at start
+        chunk_start = intervals[i] - timedelta(days=overlap) if i > 0 else intervals[i]
+        
+        # If not the last chunk, add overlap at end
+        chunk_end = intervals[i + 1] + timedelta(days=overlap) if i < len(intervals) - 1 else endDate
+
+        ranges.append((chunk_start, chunk_end))
+    return ranges
+
+def chunkMessageTable(table: MessageTable, interval: str, overlap: int) -> Generator[Tuple[datetime, datetime, List[str]], None, None]:
+    """
+    Generator that yields the same chunks as chunkTimeStampedFile from an already parsed file.
+    
+    Args:
+        table (MessageTable): The parsed file
+        interval (str): One of 'day', 'week', or 'month'
+        overlap (int): Number of days to overlap at the beginning and end of each chunk
+        
+    Yields:
+        Tuple[datetime, datetime, List[str]]: Each chunk containing:
+            - Start date of the chunk (including overlap)
+            - End date of the chunk (including overlap)
+            - List of lines in the chunk
+    """
+    if len(table) == 0:
+        raise ValueError("Could not find timestamps in file")
+
+    # Lines of the previous chunk, so the overlap is decoded once and shared between chunks
+    previous_lines = {}
+    
+    for chunk_start, chunk_end in getChunkRanges(table.start_date, table.end_date, interval, overlap):
+        chunk_lines = {
+            row: previous_lines[row] if row in previous_lines else table.line(row)
+            for row in table.rows_between(chunk_start, chunk_end)
+        }
+        yield (chunk_start, chunk_end, list(chunk_lines.values()))
+        previous_lines = chunk_lines
+
+def getTailWatermark(table: MessageTable, startDate: datetime, interval: str, overlap: int, sha256: str) -> Dict:
+    """
+    Marks where the calendar chunks of a file can still change when lines are appended to it,
+    so chunkAppendedLines only has to parse the file from there.
+
+    Args:
+        table (MessageTable): The parsed file, or its tail as long as it has every line dated
+            from the start of the last chunks on
+        startDate (datetime): Date of the first line of the file, where the intervals start
+        interval (str): One of 'day', 'week', or 'month'
+        overlap (int): Number of days to overlap at the beginning and end of each chunk
+        sha256 (str): SHA-256 of the content of the file
+
+    Returns:
+        Dict: The watermark, with the size and SHA-256 of the file, its start and end dates, and
+            the date of the first chunk a new message could fall in with the byte offset of the
+            first line dated from then on
+    """
+    endDate = table.end_date
+    ranges = getChunkRanges(startDate, endDate, interval, overlap)
+    first = next(i for i, (start, end) in enumerate(ranges) if i == len(ranges) - 1 or end >= endDate)
+    tail_date = ranges[first][0]
+    tail_row = table.rows_between(tail_date, endDate)[0]
+
+    return {
+        "size": table.base_offset + len(table.source),
+        "sha256": sha256,
+        "start": startDate.isoformat(),
+        "end": endDate.isoformat(),
+        "tail_date": tail_date.isoformat(),
+        "tail_offset": table.base_offset + table.offsets[tail_row],
+    }
+
+def chunkAppendedLines(filepath: str, timeStampRegex: str, dateRegex: str, interval: str, overlap: int, watermark: Dict) -> Optional[Tuple[List[int], List[Tuple[int, datetime, datetime, List[str]]], Dict]]:
+    """
+    Gets the calendar chunks that changed since a file was chunked, when lines were only
+    appended to it. Only the tail of the file, from the watermark on, is parsed.
+
+    Chunks are numbered like chunkTimeStampedFile yields them. The chunks that changed are the
+    ones the new messages fall in, plus the last one before and any new ones, since their end
+    dates move.
+
+    Args:
+        filepath (str): Path to the file
+        timeStampRegex (str): Regex pattern to match timestamps in the file
+        dateRegex (str): Format string for parsing the datetime
+        interval (str): One of 'day', 'week', or 'month'
+        overlap (int): Number of days to overlap at the beginning and end of each chunk
+        watermark (Dict): Watermark of the file when it was last chunked (see getTailWatermark)
+
+    Returns:
+        Optional[Tuple[List[int], List[Tuple[int, datetime, datetime, List[str]]], Dict]]:
+            - Numbers of the chunks that existed and changed
+            - The chunks that changed or are new, with their number, start and end dates and lines
+            - The new watermark of the file
+            Or None if the file changed in some other way, or new messages are dated before
+            the tail, in which case it has to be chunked again
+    """
+    size = watermark["size"]
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        remaining = size
+        while remaining > 0:
+            block = f.read(min(remaining, 1024 * 1024))
+            if not block:
+                return None
+            digest.update(block)
+            remaining -= len(block)
+        if digest.hexdigest() != watermark["sha256"]:
+            return None
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+
+    table = MessageTable(filepath, timeStampRegex, dateRegex, offset=watermark["tail_offset"])
+    startDate = datetime.fromisoformat(watermark["start"])
+    tailDate = datetime.fromisoformat(watermark["tail_date"])
+
+    # Dates of the messages appended since the watermark
+    new_timestamps = sorted(
+        table.timestamps[row] for row in range(len(table)) if table.base_offset + table.offsets[row] >= size
+    )
+    if new_timestamps and new_timestamps[0] < dateToTimestamp(tailDate):
+        return None
+
+    old_ranges = getChunkRanges(startDate, datetime.fromisoformat(watermark["end"]), interval, overlap)
+    ranges = getChunkRanges(startDate, table.end_date, interval, overlap)
+    last = len(old_ranges) - 1
+
+    changed = [
+        i for i, (start, end) in enumerate(ranges)
+        if i >= last or bisect_right(new_timestamps, dateToTimestamp(end)) > bisect_left(new_timestamps, dateToTimestamp(start))
+    ]
+    if any(ranges[i][0] < tailDate for i in changed):
+        return None
+
+    chunks = [(i, ranges[i][0], ranges[i][1], table.lines_between(*ranges[i])) for i in changed]
+    stale = [i for i in changed if i <= last]
+    return stale, chunks, getTailWatermark(table, startDate, interval, overlap, digest.hexdigest())
+
+@lru_cache(maxsize=1)
+def getTokenEncoding():
+    """
+    The cl100k_base tiktoken encoding, or None when tiktoken is not installed or can't load it
+    (it downloads the encoding the first time it's used).
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+def countTokens(text: str) -> int:
+    """
+    Counts the tokens of a text with getTokenEncoding, or estimates them as one token every
+    4 characters when the encoding is not available.
+    """
+    encoding = getTokenEncoding()
+    if encoding is None:
+        return max(1, len(text) // 4) if text else 0
+    return len(encoding.encode(text, disallowed_special=()))
+
+def chunkMessageTableByTokens(table: MessageTable, interval: str, minTokens: int, maxTokens: int, overlap: int = 0, overlapUnit: str = "messages") -> Generator[Tuple[datetime, datetime, List[str]], None, None]:
+    """
+    Generator that yields chunks that stay within a token budget, built from calendar intervals.
+
+    Intervals with more than `maxTokens` tokens are split into runs of consecutive messages,
+    and then consecutive pieces with less than `minTokens` tokens are merged as long as they
+    fit in `maxTokens`. A single message over the budget is kept as a chunk of its own. Each
+    chunk then overlaps its neighbours by `overlap` messages or tokens, on both sides.
+    Intervals without messages yield nothing.
+    
+    Args:
+        table (MessageTable): The parsed file
+        interval (str): One of 'day', 'week', or 'month'
+        minTokens (int): Chunks smaller than this are merged with the next one
+        maxTokens (int): Chunks bigger than this are split (overlap not included)
+        overlap (int): Number of messages or tokens to overlap at the beginning and end of each chunk
+        overlapUnit (str): One of 'messages' or 'tokens'
+        
+    Yields:
+        Tuple[datetime, datetime, List[str]]: Each chunk containing:
+            - Date of the first message of the chunk (including overlap)
+            - Date of the last message of the chunk (including overlap)
+            - List of lines in the chunk
+    """
+    if len(table) == 0:
+        raise ValueError("Could not find timestamps in file")
+    if minTokens > maxTokens:
+        raise ValueError("minTokens must not be greater than maxTokens")
+    if overlapUnit not in {"messages", "tokens"}:
+        raise ValueError("overlapUnit must be one of: 'messages', 'tokens'")
+
+    startDate = table.start_date
+    endDate = table.end_date
+
+    # Get the base intervals (without overlap)
+    intervals = getDateIntervals(startDate, endDate, interval)
+
+    # Every message of the file, interval by interval, and its size in tokens
+    rows = []
+    lines = []
+    tokens = []
+    # Pieces of the intervals that fit in the budget: [first, last) positions in rows and their tokens
+    pieces = []
+
+    for i in range(len(intervals)):
+        is_last = i == len(intervals) - 1
+        piece_start = len(rows)
+        piece_tokens = 0
+
+        for row in table.rows_between(intervals[i], endDate if is_last else intervals[i + 1], include_end=is_last):
+            line = table.line(row)
+            line_tokens = countTokens(line)
+            if piece_tokens + line_tokens > maxTokens and len(rows) > piece_start:
+                pieces.append([piece_start, len(rows), piece_tokens])
+                piece_start = len(rows)
+                piece_tokens = 0
+            rows.append(row)
+            lines.append(line)
+            tokens.append(line_tokens)
+            piece_tokens += line_tokens
+
+        if len(rows) > piece_start:
+            pieces.append([piece_start, len(rows), piece_tokens])
+
+    # Merge small pieces with the next one, and a small last piece with the previous one
+    chunks = []
+    for piece in pieces:
+        if chunks and chunks[-1][2] < minTokens and chunks[-1][2] + piece[2] <= maxTokens:
+            chunks[-1][1] = piece[1]
+            chunks[-1][2] += piece[2]
+        else:
+            chunks.append(piece)
+    if len(chunks) > 1 and chunks[-1][2] < minTokens and chunks[-2][2] + chunks[-1][2] <= maxTokens:
+        last = chunks.pop()
+        chunks[-1][1] = last[1]
+        chunks[-1][2] += last[2]
+
+    for first, last, _ in chunks:
+        if overlapUnit == "messages":
+            first = max(first - overlap, 0)
+            last = min(last + overlap, len(rows))
+        else:
+            budget = overlap
+            while first > 0 and tokens[first - 1] <= budget:
+                first -= 1
+                budget -= tokens[first]
+            budget = overlap
+            while last < len(rows) and tokens[last] <= budget:
+                budget -= tokens[last]
+                last += 1
+
+        dates = [table.timestamps[row] for row in rows[first:last]]
+        yield (timestampToDate(min(dates)), timestampToDate(max(dates)), lines[first:last])
+
+def chunkTimeStampedFileByTokens(filepath: str, timeStampRegex: str, dateRegex: str, interval: str, minTokens: int, maxTokens: int, overlap: int = 0, overlapUnit: str = "messages") -> Generator[Tuple[datetime, datetime, List[str]], None, None]:
+    """
+    Generator that yields chunks of a timestamped file that stay within a token budget.
+    See chunkMessageTableByTokens.
+    """
+    yield from chunkMessageTableByTokens(
+        getMessageTable(filepath, timeStampRegex, dateRegex), interval, minTokens, maxTokens, overlap, overlapUnit
+    )
+
+def streamTimeStampedFile(filepath: str, timeStampRegex: str, dateRegex: str, interval: str, overlap: int) -> Generator[Tuple[datetime, datetime, List[str]], None, None]:
+    """
+    Streaming version of chunkTimeStampedFile that yields the same chunks without rescanning
+    the file for every interval.
+
+    A first pass over the dates records which is the last line that falls into each window.
+    The second pass assigns every line to all the windows it overlaps and yields each window
+    as soon as its last line has been read, so only the windows still being filled are kept
+    in memory (one window plus the overlap days for a file in chronological order). Lines
+    that are out of order, which do show up in chat exports, just keep their window open
+    a bit longer.
+    
+    Args:
+        filepath (str): Path to the file to chunk
+        timeStampRegex (str): Regex pattern to match timestamps in the file
+        dateRegex (str): Format string for parsing the datetime
+        interval (str): One of 'day', 'week', or 'month'
+        overlap (int): Number of days to overlap at the beginning and end of each chunk
+        
+    Yields:
+        Tuple[datetime, datetime, List[str]]: Each chunk containing:
+            - Start date of the chunk (including overlap)
+            - End date of the chunk (including overlap)
+            - List of lines in the chunk
+
+    Raises:
+        ValueError: If no timestamps found in file
+    """
     # Compile the regex for efficiency
     ts_pattern = re.compile(timeStampRegex)
-    
-    # First pass: find start and end dates
+    overlap_delta = timedelta(days=overlap)
+
+    # Base start (without overlap) of every window, extended as later dates show up
+    boundaries = []
+
+    def getWindows(line_date: datetime) -> range:
+        # Windows whose [chunk_start, chunk_end] contain the date. The last window really ends
+        # at endDate instead of its next boundary plus overlap, but no date is past endDate.
+        while boundaries[-1] <= line_date + overlap_delta:
+            boundaries.append(getNextIntervalDate(boundaries[-1], interval))
+        first = max(bisect_left(boundaries, line_date - overlap_delta) - 1, 0)
+        if line_date < boundaries[0]:
+            first = max(first, 1)
+        return range(first, bisect_right(boundaries, line_date + overlap_delta))
+
+    # First pass: find start and end dates, and the last line of each window
+    startDate = None
+    endDate = None
+    last_lines = {}
     with open(filepath, 'r', encoding='utf-8') as f:
-        # Find first timestamp
-        startDate = None
-        for line in f:
-            match = ts_pattern.search(line)
-            if match:
-                date_str = match.group(1)
-                startDate = datetime.strptime(date_str, dateRegex)
-                break
-        
-        # Find last timestamp
-        endDate = None
-        f.seek(0)  # Reset to beginning
-        for line in f:
+        for line_number, line in enumerate(f):
             match = ts_pattern.search(line)
-            if match:
-                date_str = match.group(1)
-                current_date = datetime.strptime(date_str, dateRegex)
-                if not endDate or current_date > endDate:
-                    endDate = current_date
+            if not match:
+                continue
+
+            line_date = parseDate(match.group(1), dateRegex)
+            if startDate is None:
+                startDate = line_date
+                boundaries.append(startDate)
+            if not endDate or line_date > endDate:
+                endDate = line_date
+
+            for i in getWindows(line_date):
+                last_lines[i] = line_number
 
     if not startDate or not endDate:
         raise ValueError("Could not find timestamps in file")
 
     # Get the base intervals (without overlap)
     intervals = getDateIntervals(startDate, endDate, interval)
-    
-    # Second pass: yield chunks with overlaps
+
+    # Second pass: fill the open windows and yield each one once its last line is read
+    open_chunks = {}
+    next_chunk = 0
     with open(filepath, 'r', encoding='utf-8') as f:
-        for i in range(len(intervals)):
-            # Determine chunk boundaries with overlaps
-            base_start = intervals[i]
-            
-            # If not the first chunk, add overlap at start
-            chunk_start = base_start - timedelta(days=overlap) if i > 0 else base_start
-            
-            # Determine base end date (without overlap)
-            if i == len(intervals) - 1:
-                base_end = endDate
-            else:
-                base_end = intervals[i + 1]
-            
-            # If not the last chunk, add overlap at end
-            chunk_end = base_end + timedelta(days=overlap) if i < len(intervals) - 1 else base_end
-            
-            # Reset file pointer to start
-            f.seek(0)
-            
-            # Collect lines for this chunk
-            chunk_lines = []
-            for line in f:
-                match = ts_pattern.search(line)
-                if match:
-                    date_str = match.group(1)
-                    line_date = datetime.strptime(date_str, dateRegex)
-                    if chunk_start <= line_date <= chunk_end:
-                        chunk_lines.append(line)
-            
-            yield (chunk_start, chunk_end, chunk_lines)
+        for line_number, line in enumerate(f):
+            match = ts_pattern.search(line)
+            if match:
+                line_date = parseDate(match.group(1), dateRegex)
+                for i in getWindows(line_date):
+                    open_chunks.setdefault(i, []).append(line)
 
-def analyzeChunkSizes(files: List[str], timeStampRegex: str, dateRegex: str, interval: str, overlap: int) -> None:
+            while next_chunk < len(intervals) and last_lines.get(next_chunk, -1) <= line_number:
+                chunk_start = intervals[next_chunk] - overlap_delta if next_chunk > 0 else intervals[next_chunk]
+                chunk_end = intervals[next_chunk + 1] + overlap_delta if next_chunk < len(intervals) - 1 else endDate
+                yield (chunk_start, chunk_end, open_chunks.pop(next_chunk, []))
+                next_chunk += 1
+
+def chunkFile(filepath: str, timeStampRegex: str, dateRegex: str, interval: str, overlap: int, tokenBudget: Optional[Tuple[int, int]] = None, overlapUnit: str = "messages") -> List[Tuple[datetime, datetime, List[str]]]:
+    """
+    Gets all the chunks of a timestamped file at once, so they can be sent back from a worker
+    process. Chunks follow the calendar (see chunkTimeStampedFile), or a (minTokens, maxTokens)
+    token budget when one is given (see chunkTimeStampedFileByTokens), in which case the
+    overlap is measured in `overlapUnit`.
+    """
+    if tokenBudget:
+        minTokens, maxTokens = tokenBudget
+        return list(chunkTimeStampedFileByTokens(filepath, timeStampRegex, dateRegex, interval, minTokens, maxTokens, overlap, overlapUnit))
+    return list(chunkTimeStampedFile(filepath, timeStampRegex, dateRegex, interval, overlap))
+
+def chunkFileWithWatermark(filepath: str, sha256: str, timeStampRegex: str, dateRegex: str, interval: str, overlap: int) -> Tuple[List[Tuple[datetime, datetime, List[str]]], Dict]:
+    """
+    Same as chunkFile for calendar chunks, along with the tail watermark of the file (see
+    getTailWatermark), taken from the same parsed file.
     """
-    Analyze the size of chunks across multiple files.
+    table = getMessageTable(filepath, timeStampRegex, dateRegex)
+    chunks = list(chunkMessageTable(table, interval, overlap))
+    return chunks, getTailWatermark(table, table.start_date, interval, overlap, sha256)
+
+def chunkFiles(filepaths: List[str], timeStampRegex: str, dateRegex: str, interval: str, overlap: int, workers: int = 1, tokenBudget: Optional[Tuple[int, int]] = None, overlapUnit: str = "messages",
+               digests: Optional[Dict[str, str]] = None) -> Generator[Tuple[str, Future], None, None]:
+    """
+    Generator that chunks many timestamped files, in parallel on a process pool when
+    `workers` is more than 1.
+
+    Files are yielded in the same order they were given, as soon as each one is chunked,
+    with a future holding its chunks (see chunkFile). The future raises if the file could
+    not be chunked, so callers can handle the errors of every file separately. Only a few
+    files per worker are chunked ahead of the caller.
+
+    Given the SHA-256 of every file, the futures hold the calendar chunks of each file with
+    its tail watermark instead (see chunkFileWithWatermark), so the file isn't parsed again
+    for it.
+    
+    Args:
+        filepaths (List[str]): List of file paths to chunk
+        timeStampRegex (str): Regex pattern to match timestamps in the files
+        dateRegex (str): Format string for parsing the datetime
+        interval (str): One of 'day', 'week', or 'month'
+        overlap (int): Number of days (or `overlapUnit` with a token budget) to overlap at beginning and end of chunks
+        workers (int): Number of worker processes, 1 to chunk the files in this process
+        tokenBudget (Optional[Tuple[int, int]]): Minimum and maximum tokens per chunk (see chunkFile)
+        overlapUnit (str): One of 'messages' or 'tokens', only used with a token budget
+        digests (Optional[Dict[str, str]]): SHA-256 of each file by path, to get their watermarks
+            too (calendar chunks only)
+        
+    Yields:
+        Tuple[str, Future]: Each file path with the future of its chunks (and watermark)
+    """
+    if digests is None:
+        chunker = partial(
+            chunkFile,
+            timeStampRegex=timeStampRegex,
+            dateRegex=dateRegex,
+            interval=interval,
+            overlap=overlap,
+            tokenBudget=tokenBudget,
+            overlapUnit=overlapUnit
+        )
+        arguments = lambda filepath: (filepath,)
+    else:
+        if tokenBudget:
+            raise ValueError("Watermarks can only be taken of calendar chunks")
+        chunker = partial(chunkFileWithWatermark, timeStampRegex=timeStampRegex, dateRegex=dateRegex, interval=interval, overlap=overlap)
+        arguments = lambda filepath: (filepath, digests[filepath])
+
+    if workers <= 1 or len(filepaths) <= 1:
+        for filepath in filepaths:
+            result = Future()
+            try:
+                result.set_result(chunker(*arguments(filepath)))
+            except Exception as e:
+                result.set_exception(e)
+            yield (filepath, result)
+        return
+
+    # Spawned workers don't inherit the threads and state of a running server
+    with ProcessPoolExecutor(max_workers=min(workers, len(filepaths)), mp_context=get_context("spawn")) as executor:
+        pending = deque()
+        remaining = iter(filepaths)
+        for filepath in islice(remaining, 2 * workers):
+            pending.append((filepath, executor.submit(chunker, *arguments(filepath))))
+
+        while pending:
+            filepath, result = pending.popleft()
+            next_filepath = next(remaining, None)
+            if next_filepath is not None:
+                pending.append((next_filepath, executor.submit(chunker, *arguments(next_filepath))))
+            wait([result])
+            yield (filepath, result)
+
+def analyzeChunkSizes(files: List[str], timeStampRegex: str, dateRegex: str, interval: str, overlap: int, workers: int = 1, tokenBudget: Optional[Tuple[int, int]] = None, overlapUnit: str = "messages") -> None:
+    """
+    Analyze the size of chunks, in characters and tokens, across multiple files.
     
     Args:
         files (List[str]): List of file paths to analyze
         timeStampRegex (str): Regex pattern to match timestamps in the files
         dateRegex (str): Format string for parsing the datetime
         interval (str): One of 'day', 'week', or 'month'
-        overlap (int): Number of days to overlap at beginning and end of chunks
+        overlap (int): Number of days (or `overlapUnit` with a token budget) to overlap at beginning and end of chunks
+        workers (int): Number of processes chunking the files (see chunkFiles)
+        tokenBudget (Optional[Tuple[int, int]]): Minimum and maximum tokens per chunk, to analyze
+            the chunks of chunkTimeStampedFileByTokens instead of the calendar ones
+        overlapUnit (str): One of 'messages' or 'tokens', only used with a token budget
     """
     all_chunk_sizes = []
+    all_chunk_tokens = []
     
-    for filepath in files:
+    for filepath, chunks in chunkFiles(files, timeStampRegex, dateRegex, interval, overlap, workers, tokenBudget, overlapUnit):
         print(f"\nAnalyzing file: {filepath}")
         try:
             # Process each chunk in the file
-            for i, (start, end, lines) in enumerate(chunkTimeStampedFile(
-                filepath, timeStampRegex, dateRegex, interval, overlap
-            )):
+            for i, (start, end, lines) in enumerate(chunks.result()):
                 chunk_size = sum(len(clean_up_string(line, {"timeStampRegex": timeStampRegex})) for line in lines)
+                chunk_tokens = countTokens("".join(lines))
                 all_chunk_sizes.append(chunk_size)
-                print(f"  Chunk {i + 1}: {chunk_size:,} characters")
+                all_chunk_tokens.append(chunk_tokens)
+                print(f"  Chunk {i + 1} ({start:%d/%m/%y} - {end:%d/%m/%y}): {chunk_size:,} characters, {chunk_tokens:,} tokens")
                 
         except FileNotFoundError:
             print(f"  Error: File not found: {filepath}")
@@ -125,9 +545,19 @@ def analyzeChunkSizes(files: List[str], timeStampRegex: str, dateRegex: str, int
         avg_size = sum(all_chunk_sizes) / len(all_chunk_sizes)
         
         print("\nSummary Statistics:")
+        print(f"Chunks: {len(all_chunk_sizes):,}")
         print(f"Smallest chunk: {min_size:,} characters")
         print(f"Biggest chunk: {max_size:,} characters")
         print(f"Average chunk size: {avg_size:,.2f} characters")
+
+        sorted_tokens = sorted(all_chunk_tokens)
+        percentiles = {p: sorted_tokens[min(len(sorted_tokens) - 1, int(p / 100 * len(sorted_tokens)))] for p in (10, 25, 50, 75, 90, 99)}
+        print(f"Total tokens: {sum(sorted_tokens):,} (encoding: {'cl100k_base' if getTokenEncoding() else '~4 characters per token'})")
+        print(f"Tokens per chunk: min {sorted_tokens[0]:,}, max {sorted_tokens[-1]:,}, average {sum(sorted_tokens) / len(sorted_tokens):,.2f}")
+        print("Token percentiles: " + ", ".join(f"p{p} {value:,}" for p, value in percentiles.items()))
+        if tokenBudget:
+            print(f"Chunks over {tokenBudget[1]:,} tokens (including overlap): {sum(t > tokenBudget[1] for t in sorted_tokens):,}")
+            print(f"Chunks under {tokenBudget[0]:,} tokens: {sum(t < tokenBudget[0] for t in sorted_tokens):,}")
     else:
         print("\nNo chunks were processed successfully.")
 
@@ -148,53 +578,21 @@ def getFirstChunkFromFile(filepath: str, timeStampRegex: str, dateRegex: str, in
         ValueError: If no timestamps found in file
         FileNotFoundError: If file doesn't exist
     """
-    # Compile the regex for efficiency
-    ts_pattern = re.compile(timeStampRegex)
-    
-    # First pass: find start date and first interval end date
-    with open(filepath, 'r', encoding='utf-8') as f:
-        # Find first timestamp
-        startDate = None
-        for line in f:
-            match = ts_pattern.search(line)
-            if match:
-                date_str = match.group(1)
-                startDate = datetime.strptime(date_str, dateRegex)
-                break
-                
-        if not startDate:
-            raise ValueError("Could not find timestamps in file")
-            
-        # Get the end date for the first interval
-        intervals = getDateIntervals(startDate, startDate + timedelta(days=31), interval)
-        if len(intervals) < 2:
-            # If we only got one interval, we need to look for the actual end date
-            f.seek(0)
-            endDate = None
-            for line in f:
-                match = ts_pattern.search(line)
-                if match:
-                    date_str = match.group(1)
-                    current_date = datetime.strptime(date_str, dateRegex)
-                    if not endDate or current_date > endDate:
-                        endDate = current_date
-        else:
-            endDate = intervals[1]  # Use the start of next interval as our end date
-    
-    # Second pass: collect lines for the first chunk
-    chunk_lines = []
-    with open(filepath, 'r', encoding='utf-8') as f:
-        for line in f:
-            match = ts_pattern.search(line)
-            if match:
-                date_str = match.group(1)
-                line_date = datetime.strptime(date_str, dateRegex)
-                if startDate <= line_date < endDate:
-                    chunk_lines.append(line)
-                elif line_date >= endDate:
-                    break  # We've gone past our chunk
+    table = getMessageTable(filepath, timeStampRegex, dateRegex)
+    if len(table) == 0:
+        raise ValueError("Could not find timestamps in file")
+
+    startDate = table.start_date
+        
+    # Get the end date for the first interval
+    intervals = getDateIntervals(startDate, startDate + timedelta(days=31), interval)
+    if len(intervals) < 2:
+        # If we only got one interval, use the actual end date
+        endDate = table.end_date
+    else:
+        endDate = intervals[1]  # Use the start of next interval as our end date
     
-    return chunk_lines
+    return table.lines_between(startDate, endDate, include_end=False)
 
 def clean_up_string(chunk: str, patterns: Dict[str, str]) -> str:
     """
@@ -221,24 +619,31 @@ def clean_up_string(chunk: str, patterns: Dict[str, str]) -> str:
 
 if __name__ == "__main__":
     # Example usage
-    files_to_analyze = [
-        "app/data/_chat_abel_mesen.txt",
-        "app/data/_chat_francisco_salas.txt",
-        "app/data/_chat_grettel.txt",
-        "app/data/_chat_laura_monestel.txt",
-        "app/data/_chat_luisa_alfaro.txt",
-        "app/data/_chat_maria_jose_alfaro.txt",
-        "app/data/_chat_maritza_ortiz.txt",
-        "app/data/_chat_paola_mora_lopez.txt",
-        "app/data/_chat_robert_monestel.txt",
-    ]
+    from app.setup.catalog import load_catalog
+
+    files_to_analyze = load_catalog(
+        r"\[(\d{1,2}/\d{1,2}/\d{2}), \d{1,2}:\d{2}:\d{2}(?:.AM|.PM)?\]",
+        "%d/%m/%y",
+        path=""
+    ).files
     
     analyzeChunkSizes(
         files_to_analyze,
         r"\[(\d{1,2}/\d{1,2}/\d{2}), \d{1,2}:\d{2}:\d{2}(?:.AM|.PM)?\]",
         "%d/%m/%y",
         "week",
-        2
+        2,
+        workers=os.cpu_count() or 1
+    )
+
+    print("\nWith a token budget of 200-800 tokens and 5 messages of overlap:")
+    analyzeChunkSizes(
+        files_to_analyze,
+        r"\[(\d{1,2}/\d{1,2}/\d{2}), \d{1,2}:\d{2}:\d{2}(?:.AM|.PM)?\]",
+        "%d/%m/%y",
+        "week",
+        5,
+        tokenBudget=(200, 800)
     )
 
     print("\nTesting getFirstChunkFromFile:")
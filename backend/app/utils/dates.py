@@ -1,5 +1,19 @@
-from datetime import datetime, timedelta
-from typing import List
+import re
+import numpy as np
+from array import array
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+# WhatsApp exports use day/month/two-digit year dates
+DEFAULT_DATE_FORMAT = "%d/%m/%y"
+DEFAULT_DATE_PATTERN = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{2})")
+
+# Distinct date strings remembered by parseTimestamp. An export has one per active day.
+DATE_CACHE_SIZE = 8192
 
 
 def getDateIntervals(startDate: datetime, endDate: datetime, interval: str) -> List[datetime]:
@@ -66,6 +80,110 @@ def getNextIntervalDate(date: datetime, interval: str) -> datetime:
         raise ValueError("interval must be one of: 'day', 'week', 'month'")
 
 
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parseTimestamp(date_str: str, dateRegex: str) -> int:
+    """
+    Parse a date string into seconds since the epoch, remembering the most recent results.
+
+    Chat lines share a handful of distinct dates, so most calls are cache hits instead of a
+    datetime.strptime call. Dates in the default format skip strptime altogether.
+
+    Args:
+        date_str (str): The date to parse
+        dateRegex (str): Format string for parsing the datetime
+
+    Returns:
+        int: Seconds since the epoch (the date is taken as UTC)
+
+    Raises:
+        ValueError: If the date doesn't match the format
+    """
+    if dateRegex == DEFAULT_DATE_FORMAT:
+        match = DEFAULT_DATE_PATTERN.fullmatch(date_str)
+        if match:
+            day, month, year = (int(group) for group in match.groups())
+            # Same pivot as strptime's %y: 69-99 are 1969-1999, 00-68 are 2000-2068
+            year += 1900 if year >= 69 else 2000
+            try:
+                return (date(year, month, day).toordinal() - EPOCH_ORDINAL) * 86400
+            except ValueError:
+                pass  # Let strptime raise its usual error
+
+    return dateToTimestamp(datetime.strptime(date_str, dateRegex))
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parseDate(date_str: str, dateRegex: str) -> datetime:
+    """
+    Memoized equivalent of datetime.strptime(date_str, dateRegex). See parseTimestamp.
+    """
+    return timestampToDate(parseTimestamp(date_str, dateRegex))
+
+
+def parseDefaultDates(date_strs: List[str]) -> Optional[List[int]]:
+    """
+    Convert dates in the default format (day/month/two-digit year) into seconds since the
+    epoch all at once: the fields are split with the regex and the days since the epoch are
+    worked out with NumPy datetime arithmetic.
+
+    Args:
+        date_strs (List[str]): The dates to convert
+
+    Returns:
+        Optional[List[int]]: Seconds since the epoch for each date, or None if one of them
+            isn't a valid date in the default format
+    """
+    matches = [DEFAULT_DATE_PATTERN.fullmatch(date_str) for date_str in date_strs]
+    if not all(matches):
+        return None
+
+    day, month, year = np.array([match.groups() for match in matches], dtype=np.int64).reshape(-1, 3).T
+    # Same pivot as strptime's %y: 69-99 are 1969-1999, 00-68 are 2000-2068
+    year = year + np.where(year >= 69, 1900, 2000)
+    months = (year - 1970) * 12 + month - 1
+    month_starts = months.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64)
+    month_days = (months + 1).astype("datetime64[M]").astype("datetime64[D]").astype(np.int64) - month_starts
+    if ((month < 1) | (month > 12) | (day < 1) | (day > month_days)).any():
+        return None
+    return ((month_starts + day - 1) * 86400).tolist()
+
+
+def parseTimestamps(date_strs: Iterable[str], dateRegex: str) -> array:
+    """
+    Parse many date strings at once into seconds since the epoch.
+
+    Every distinct string is parsed only once, no matter how many lines share it, and those
+    in the default format are all converted at once (see parseDefaultDates).
+
+    Args:
+        date_strs (Iterable[str]): The dates to parse
+        dateRegex (str): Format string for parsing the datetime
+
+    Returns:
+        array: Seconds since the epoch for each date, in the same order
+
+    Raises:
+        ValueError: If a date doesn't match the format
+    """
+    date_strs = date_strs if isinstance(date_strs, list) else list(date_strs)
+    distinct = list(dict.fromkeys(date_strs))
+    timestamps = parseDefaultDates(distinct) if dateRegex == DEFAULT_DATE_FORMAT else None
+    if timestamps is None:
+        timestamps = [parseTimestamp(date_str, dateRegex) for date_str in distinct]
+    parsed = dict(zip(distinct, timestamps))
+    return array('q', map(parsed.__getitem__, date_strs))
+
+
+def dateToTimestamp(date: datetime) -> int:
+    """Convert a (naive) datetime into seconds since the epoch."""
+    return int((date - EPOCH).total_seconds())
+
+
+def timestampToDate(timestamp: int) -> datetime:
+    """Convert seconds since the epoch back into a (naive) datetime."""
+    return EPOCH + timedelta(seconds=timestamp)
+
+
 if __name__ == "__main__":
     # Example usage
     print("Testing getDateIntervals:")
@@ -93,4 +211,9 @@ if __name__ == "__main__":
     print("Current date:", d)
     print("Next day:", getNextIntervalDate(d, "day"))
     print("Next Monday:", getNextIntervalDate(d, "week"))
-    print("First of next month:", getNextIntervalDate(d, "month")) 
\ No newline at end of file
+    print("First of next month:", getNextIntervalDate(d, "month"))
+
+    # Test parseDate
+    print("\nTesting parseDate:")
+    print("25/3/25:", parseDate("25/3/25", DEFAULT_DATE_FORMAT))
+    print("Cache:", parseTimestamp.cache_info())
@@ -0,0 +1,342 @@
+import os
+import sqlite3
+import threading
+import time
+import asyncio
+import hashlib
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+from langchain_cohere import CohereEmbeddings
+from app.setup.ingestion import get_embedding_batch_size, get_embedding_concurrency
+
+# Seconds between updates of the last access time of a cached vector: eviction only needs it
+# roughly, and a warm start then reads the cache without writing it all again
+ACCESS_UPDATE_INTERVAL = 3600
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that keeps document vectors in a local SQLite cache.
+
+    Vectors are stored under a hash of the namespace (embedding model and dimension) and the
+    text, so only texts that were never embedded with the current configuration reach the
+    provider. When the cache grows past `max_bytes`, the least recently used vectors (to
+    within ACCESS_UPDATE_INTERVAL) are evicted. Queries are not cached. The async methods
+    read and write the cache in a worker thread.
+    """
+
+    def __init__(self, embeddings: Embeddings, namespace: str, path: str, max_bytes: Optional[int] = None):
+        """
+        Args:
+            embeddings (Embeddings): The embeddings to cache
+            namespace (str): Identifies the embedding configuration, e.g. "model:dimension"
+            path (str): Path to the SQLite database file
+            max_bytes (Optional[int]): Maximum size of the stored vectors, unbounded if None
+        """
+        self.embeddings = embeddings
+        self.namespace = namespace
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed)")
+        self._connection.commit()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, texts: List[str]) -> List[Optional[List[float]]]:
+        keys = [self._key(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        now = time.time()
+        stale = []
+        with self._lock:
+            # Stay well below SQLite's limit of variables per statement
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT key, vector, accessed FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob, accessed in rows:
+                    found[key] = array("f", blob).tolist()
+                    if accessed < now - ACCESS_UPDATE_INTERVAL:
+                        stale.append((now, key))
+            if stale:
+                self._connection.executemany("UPDATE embeddings SET accessed = ? WHERE key = ?", stale)
+                self._connection.commit()
+
+        vectors = [found.get(key) for key in keys]
+        hits = sum(vector is not None for vector in vectors)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        return vectors
+
+    def _store(self, texts: List[str], vectors: List[List[float]]) -> None:
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = array("f", vector).tobytes()
+            rows.append((self._key(text), blob, len(blob), now))
+
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            if self.max_bytes is not None:
+                self._evict()
+            self._connection.commit()
+
+    def _evict(self) -> None:
+        # Drop the least recently used vectors until the cache fits again
+        total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        while total > self.max_bytes:
+            rows = self._connection.execute(
+                "SELECT key, size FROM embeddings ORDER BY accessed LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+            evicted = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                evicted.append((key,))
+                total -= size
+            self._connection.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+            self.evictions += len(evicted)
+
+    def _merge(self, texts: List[str], cached: List[Optional[List[float]]], embedded: List[List[float]]) -> List[List[float]]:
+        missing = [text for text, vector in zip(texts, cached) if vector is None]
+        if missing:
+            self._store(missing, embedded)
+        embedded_iter = iter(embedded)
+        return [vector if vector is not None else next(embedded_iter) for vector in cached]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        cached = self._lookup(texts)
+        missing = [text for text, vector in zip(texts, cached) if vector is None]
+        embedded = self.embeddings.embed_documents(missing) if missing else []
+        return self._merge(texts, cached, embedded)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        cached = await asyncio.to_thread(self._lookup, texts)
+        missing = [text for text, vector in zip(texts, cached) if vector is None]
+        embedded = await self.embeddings.aembed_documents(missing) if missing else []
+        return await asyncio.to_thread(self._merge, texts, cached, embedded)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.embeddings.aembed_query(text)
+
+    def stats(self) -> Dict[str, int]:
+        """Cache hits, misses and evictions since the wrapper was created."""
+        with self._lock:
+            entries, size = self._connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+class QueryCache(Embeddings):
+    """
+    Embeddings wrapper that keeps the vectors of the most recent queries in memory.
+
+    The queries the app embeds come from a few templates (e.g. one question per team member),
+    so most of them were already embedded. Vectors are kept by model and query text, and the
+    least recently used ones are dropped past `max_size` entries. Documents pass through.
+    """
+
+    def __init__(self, embeddings: Embeddings, namespace: str, max_size: int = 1024):
+        """
+        Args:
+            embeddings (Embeddings): The embeddings to cache the queries of
+            namespace (str): Identifies the embedding configuration, e.g. "model:dimension"
+            max_size (int): Maximum number of queries to remember
+        """
+        self.embeddings = embeddings
+        self.namespace = namespace
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._vectors: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, text: str) -> Optional[List[float]]:
+        key = (self.namespace, text)
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._vectors.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def _put(self, text: str, vector: List[float]) -> None:
+        with self._lock:
+            self._vectors[(self.namespace, text)] = vector
+            self._vectors.move_to_end((self.namespace, text))
+            while len(self._vectors) > self.max_size:
+                self._vectors.popitem(last=False)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self._get(text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._put(text, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self._get(text)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self._put(text, vector)
+        return vector
+
+    async def aprewarm(self, texts: Iterable[str]) -> int:
+        """
+        Embed the queries that aren't cached yet, all at once, e.g. on startup.
+
+        Returns:
+            int: Number of queries embedded
+        """
+        with self._lock:
+            missing = list(dict.fromkeys(text for text in texts if (self.namespace, text) not in self._vectors))
+        vectors = await aembed_queries(self.embeddings, missing) if missing else []
+        for text, vector in zip(missing, vectors):
+            self._put(text, vector)
+        return len(missing)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries, the ones that aren't cached all at once (see aembed_queries)."""
+        cached = [self._get(text) for text in texts]
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+        embedded = dict(zip(missing, await aembed_queries(self.embeddings, missing))) if missing else {}
+        for text, vector in embedded.items():
+            self._put(text, vector)
+        return [vector if vector is not None else embedded[text] for text, vector in zip(texts, cached)]
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache hits, misses and hit rate since the wrapper was created."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._vectors),
+        }
+
+
+async def aembed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embed several queries with as few requests to the provider as it allows (Cohere takes
+    batches of up to EMBEDDING_BATCH_SIZE texts as queries, EMBEDDING_CONCURRENCY of them at
+    once), instead of one request per query. Other embeddings embed them concurrently (local
+    ones batch concurrent queries themselves).
+
+    Args:
+        embeddings (Embeddings): The embeddings, possibly wrapped by the caches
+        texts (List[str]): The queries
+
+    Returns:
+        List[List[float]]: The vector of each query
+    """
+    if isinstance(embeddings, QueryCache):
+        return await embeddings.aembed_queries(texts)
+    # The document cache lets queries through
+    if isinstance(embeddings, CachedEmbeddings):
+        embeddings = embeddings.embeddings
+    if isinstance(embeddings, CohereEmbeddings):
+        batch_size = get_embedding_batch_size()
+        semaphore = asyncio.Semaphore(get_embedding_concurrency())
+
+        async def embed(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await embeddings.aembed(batch, input_type="search_query")
+
+        batches = await asyncio.gather(*(embed(texts[start:start + batch_size]) for start in range(0, len(texts), batch_size)))
+        return [vector for batch in batches for vector in batch]
+    return list(await asyncio.gather(*(embeddings.aembed_query(text) for text in texts)))
+
+
+def get_cache_stats(embeddings: Embeddings) -> Dict[str, Dict[str, Any]]:
+    """
+    Stats of every cache wrapping some embeddings, by cache ("queries" for QueryCache and
+    "documents" for CachedEmbeddings).
+    """
+    stats = {}
+    while isinstance(embeddings, (QueryCache, CachedEmbeddings)):
+        stats["queries" if isinstance(embeddings, QueryCache) else "documents"] = embeddings.stats()
+        embeddings = embeddings.embeddings
+    return stats
+
+
+def cache_queries(embeddings: Embeddings, model_name: str, embedding_dim: int) -> Embeddings:
+    """
+    Wraps embeddings with the in-memory query cache, of QUERY_CACHE_SIZE queries (1024 by
+    default, 0 to disable it).
+
+    Args:
+        embeddings (Embeddings): The embeddings to cache the queries of
+        model_name (str): Name of the embedding model
+        embedding_dim (int): Dimension of the embeddings
+
+    Returns:
+        Embeddings: The cached embeddings, or the same embeddings if the cache is disabled
+    """
+    max_size = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+    if max_size <= 0:
+        return embeddings
+    return QueryCache(embeddings, namespace=f"{model_name}:{embedding_dim}", max_size=max_size)
+
+
+def cache_embeddings(embeddings: Embeddings, model_name: str, embedding_dim: int) -> Embeddings:
+    """
+    Wraps embeddings with the on-disk cache configured through the environment.
+
+    EMBEDDING_CACHE_DIR is the cache directory (".cache/embeddings" by default, empty to
+    disable the cache) and EMBEDDING_CACHE_MAX_MB the maximum size of the stored vectors.
+
+    Args:
+        embeddings (Embeddings): The embeddings to cache
+        model_name (str): Name of the embedding model
+        embedding_dim (int): Dimension of the embeddings
+
+    Returns:
+        Embeddings: The cached embeddings, or the same embeddings if the cache is disabled
+    """
+    cache_dir = os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings")
+    if not cache_dir:
+        return embeddings
+
+    max_mb = os.getenv("EMBEDDING_CACHE_MAX_MB", "512")
+    max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else None
+
+    return CachedEmbeddings(
+        embeddings,
+        namespace=f"{model_name}:{embedding_dim}",
+        path=os.path.join(cache_dir, "embeddings.sqlite"),
+        max_bytes=max_bytes,
+    )
@@ -0,0 +1,53 @@
+import os
+import httpx
+from functools import lru_cache
+from typing import Optional, Tuple
+from langchain_openai import ChatOpenAI
+
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_CONNECTIONS = 10
+DEFAULT_KEEPALIVE_EXPIRY = 60
+DEFAULT_TIMEOUT = 60
+
+
+@lru_cache(maxsize=1)
+def get_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """
+    HTTP clients every chat model shares, so requests reuse open connections instead of
+    doing a new TCP and TLS handshake each time.
+
+    LLM_MAX_CONNECTIONS (20 by default) bounds the connections open at once, and
+    LLM_KEEPALIVE_CONNECTIONS (10) and LLM_KEEPALIVE_EXPIRY (60 seconds) how many idle ones
+    are kept and for how long.
+
+    Returns:
+        Tuple[httpx.Client, httpx.AsyncClient]: The sync and async clients
+    """
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS)),
+        max_keepalive_connections=int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", DEFAULT_KEEPALIVE_CONNECTIONS)),
+        keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", DEFAULT_KEEPALIVE_EXPIRY)),
+    )
+    timeout = httpx.Timeout(DEFAULT_TIMEOUT, connect=10)
+    return httpx.Client(limits=limits, timeout=timeout), httpx.AsyncClient(limits=limits, timeout=timeout)
+
+
+async def close_http_clients() -> None:
+    """Close the shared HTTP clients, e.g. on shutdown."""
+    if get_http_clients.cache_info().currsize:
+        client, async_client = get_http_clients()
+        client.close()
+        await async_client.aclose()
+        get_http_clients.cache_clear()
+        get_chat_model.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(model: str, temperature: Optional[float] = None) -> ChatOpenAI:
+    """
+    Chat model built once per model and temperature, on the shared HTTP clients (see
+    get_http_clients). Chat models keep no state between calls, so they can be shared by
+    every request. Without a temperature, the default of the model is used.
+    """
+    client, async_client = get_http_clients()
+    return ChatOpenAI(model=model, temperature=temperature, http_client=client, http_async_client=async_client)
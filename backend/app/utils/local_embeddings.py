@@ -0,0 +1,212 @@
+import os
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Any, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+
+# EMBEDDING_MODEL values with this prefix (or that are a directory) are served in-process
+LOCAL_MODEL_PREFIX = "local:"
+
+DEFAULT_MAX_BATCH = 32
+DEFAULT_BATCH_WAIT_MS = 5
+
+# Quantization the ONNX variant is exported with (see export_dynamic_quantized_onnx_model)
+ONNX_QUANTIZATION = "avx2"
+
+
+def is_local_model(model_name: str) -> bool:
+    """Whether EMBEDDING_MODEL names a local SentenceTransformer model instead of a Cohere one."""
+    return model_name.startswith(LOCAL_MODEL_PREFIX) or os.path.isdir(model_name)
+
+
+def get_local_model_path(model_name: str) -> str:
+    return model_name[len(LOCAL_MODEL_PREFIX):] if model_name.startswith(LOCAL_MODEL_PREFIX) else model_name
+
+
+def get_local_model_digest(model_path: str) -> Optional[str]:
+    """
+    SHA-256 of the files of a local model (configuration, tokenizer and weights), which changes
+    when the model is trained again at the same path. The ONNX exports made from it are left
+    out. None if the model isn't a directory (e.g. a Hugging Face id).
+    """
+    if not os.path.isdir(model_path):
+        return None
+
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(model_path):
+        dirs[:] = sorted(name for name in dirs if root != model_path or name != "onnx")
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, model_path).encode("utf-8") + b"\0")
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+    return digest.hexdigest()
+
+
+class QueryBatcher:
+    """
+    Groups the texts encoded at the same time by different threads or tasks into a single
+    call to the model. A worker thread waits up to `max_wait` seconds for more texts once the
+    first one arrives, and never encodes more than `max_batch` texts at once.
+    """
+
+    def __init__(self, encode, max_batch: int = DEFAULT_MAX_BATCH, max_wait: float = DEFAULT_BATCH_WAIT_MS / 1000):
+        """
+        Args:
+            encode (Callable[[List[str]], List[List[float]]]): Encodes a batch of texts
+            max_batch (int): Maximum number of texts per batch
+            max_wait (float): Seconds to wait for more texts before encoding a batch
+        """
+        self.encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.texts = 0
+        self._pending: List[Tuple[str, Future]] = []
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+
+    def submit(self, text: str) -> Future:
+        """Queue a text to be encoded, getting the future of its vector."""
+        future = Future()
+        with self._condition:
+            self._pending.append((text, future))
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+                self._worker.start()
+            self._condition.notify()
+        return future
+
+    def _next_batch(self) -> List[Tuple[str, Future]]:
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            # Give concurrent callers a moment to join the batch
+            self._condition.wait_for(lambda: len(self._pending) >= self.max_batch, timeout=self.max_wait)
+            batch = self._pending[:self.max_batch]
+            self._pending = self._pending[self.max_batch:]
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            try:
+                vectors = self.encode([text for text, _ in batch])
+            except BaseException as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(batch)
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    Embeddings computed in-process on CPU with a SentenceTransformer model, like the one
+    test/fine_tune_embeddings.py trains into app/test/fine_tuned_model.
+
+    Queries are micro-batched (see QueryBatcher), so concurrent requests share one forward
+    pass. Documents are encoded in batches of `batch_size`. The model can run on PyTorch, with
+    optional dynamic int8 quantization of its linear layers, or as an ONNX export.
+    """
+
+    def __init__(self, model_path: str, backend: str = "torch", quantize: bool = False, batch_size: int = DEFAULT_MAX_BATCH,
+                 max_wait: float = DEFAULT_BATCH_WAIT_MS / 1000):
+        """
+        Args:
+            model_path (str): Directory (or Hugging Face id) of the SentenceTransformer model
+            backend (str): One of 'torch' or 'onnx'
+            quantize (bool): Whether to quantize the model to int8
+            batch_size (int): Maximum number of texts per forward pass
+            max_wait (float): Seconds a query waits for others to be batched with
+
+        Raises:
+            ImportError: If sentence-transformers (or optimum, for ONNX) is not installed
+            ValueError: If the backend is not one of 'torch' or 'onnx'
+        """
+        if backend not in {"torch", "onnx"}:
+            raise ValueError("backend must be one of: 'torch', 'onnx'")
+
+        self.model_path = model_path
+        self.backend = backend
+        self.quantize = quantize
+        self.batch_size = batch_size
+        self.model = self._load_model()
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        # Tells apart the vectors of the model from those of a retrained one at the same path
+        self.digest = get_local_model_digest(model_path)
+        # Forward passes run one at a time, each already using every core
+        self._lock = threading.Lock()
+        self.batcher = QueryBatcher(self._encode, max_batch=batch_size, max_wait=max_wait)
+
+    def _load_model(self) -> Any:
+        from sentence_transformers import SentenceTransformer
+
+        if self.backend == "onnx":
+            if not self.quantize:
+                return SentenceTransformer(self.model_path, device="cpu", backend="onnx")
+
+            # Export the quantized model next to the original the first time
+            file_name = f"onnx/model_qint8_{ONNX_QUANTIZATION}.onnx"
+            if not os.path.exists(os.path.join(self.model_path, file_name)):
+                from sentence_transformers import export_dynamic_quantized_onnx_model
+                model = SentenceTransformer(self.model_path, device="cpu", backend="onnx")
+                export_dynamic_quantized_onnx_model(model, ONNX_QUANTIZATION, self.model_path)
+            return SentenceTransformer(self.model_path, device="cpu", backend="onnx", model_kwargs={"file_name": file_name})
+
+        model = SentenceTransformer(self.model_path, device="cpu")
+        if self.quantize:
+            import torch
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            vectors = self.model.encode(
+                texts,
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            )
+        return vectors.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(texts) if texts else []
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.batcher.submit(text).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self.batcher.submit(text))
+
+
+def get_local_embeddings(model_name: str) -> LocalEmbeddings:
+    """
+    Load the local embedding model named by EMBEDDING_MODEL ("local:<path>" or a directory).
+
+    LOCAL_EMBEDDING_BACKEND picks the runtime ("torch" by default, or "onnx"),
+    LOCAL_EMBEDDING_QUANTIZE=true quantizes it to int8, and LOCAL_EMBEDDING_MAX_BATCH and
+    LOCAL_EMBEDDING_BATCH_WAIT_MS tune how queries are batched together.
+
+    Args:
+        model_name (str): Value of EMBEDDING_MODEL
+
+    Returns:
+        LocalEmbeddings: The loaded model
+    """
+    return LocalEmbeddings(
+        get_local_model_path(model_name),
+        backend=os.getenv("LOCAL_EMBEDDING_BACKEND", "torch").lower(),
+        quantize=os.getenv("LOCAL_EMBEDDING_QUANTIZE", "false").lower() == "true",
+        batch_size=int(os.getenv("LOCAL_EMBEDDING_MAX_BATCH", DEFAULT_MAX_BATCH)),
+        max_wait=float(os.getenv("LOCAL_EMBEDDING_BATCH_WAIT_MS", DEFAULT_BATCH_WAIT_MS)) / 1000,
+    )
@@ -0,0 +1,219 @@
+import os
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.utils.dates import dateToTimestamp, parseTimestamps, timestampToDate
+
+def parseSender(message: str) -> Optional[str]:
+    """
+    Get the sender of a message, the text right after its timestamp, which looks like
+    "Sender: text". Returns None for lines without a sender, like system messages.
+    """
+    sender, separator, _ = message.partition(": ")
+    return sender.strip() if separator else None
+
+
+def getSenders(lines: Iterable[str], timeStampRegex: str) -> List[str]:
+    """
+    Get everyone that sends a message in some timestamped lines, e.g. the lines of a chunk.
+
+    Args:
+        lines (Iterable[str]): The lines
+        timeStampRegex (str): Regex pattern to match timestamps in the lines
+
+    Returns:
+        List[str]: Names of the senders, sorted
+    """
+    ts_pattern = re.compile(timeStampRegex)
+    senders = set()
+    for line in lines:
+        match = ts_pattern.search(line)
+        sender = parseSender(line[match.end():]) if match else None
+        if sender:
+            senders.add(sender)
+    return sorted(senders)
+
+
+class MessageTable:
+    """
+    Columnar view of a timestamped chat export, parsed once.
+
+    Each timestamped line is a row stored in compact arrays: its timestamp (seconds since the
+    epoch), an interned sender id and the byte offset and length of the line in the source.
+    The text itself stays in the source bytes and is only decoded for the rows a query returns.
+    Lines without a timestamp are skipped, just like the chunkers do.
+    """
+
+    def __init__(self, filepath: str, timeStampRegex: str, dateRegex: str, offset: int = 0):
+        """
+        Parse a timestamped file into a message table.
+
+        Args:
+            filepath (str): Path to the file to parse
+            timeStampRegex (str): Regex pattern to match timestamps in the file
+            dateRegex (str): Format string for parsing the datetime
+            offset (int): Byte offset (at the start of a line) to parse the file from, to only
+                parse its tail. Row offsets stay relative to it.
+
+        Raises:
+            FileNotFoundError: If file doesn't exist
+        """
+        self.filepath = filepath
+        self.base_offset = offset
+        self.senders = array('i')
+        self.offsets = array('q')
+        self.lengths = array('I')
+        self.sender_names: List[str] = []
+        self._sender_ids: Dict[str, int] = {}
+
+        with open(filepath, 'rb') as f:
+            f.seek(offset)
+            self.source = f.read()
+
+        ts_pattern = re.compile(timeStampRegex)
+        date_strs = []
+        offset = 0
+        for raw_line in self.source.splitlines(keepends=True):
+            match = ts_pattern.search(raw_line.decode('utf-8'))
+            if match:
+                date_strs.append(match.group(1))
+                self.senders.append(self._intern_sender(match.string[match.end():]))
+                self.offsets.append(offset)
+                self.lengths.append(len(raw_line))
+            offset += len(raw_line)
+
+        # Dates are parsed in one go, once per distinct date string
+        self.timestamps = parseTimestamps(date_strs, dateRegex)
+
+        # Rows sorted by timestamp, so date ranges can be found with bisect. Chat exports are
+        # mostly chronological, in which case this is just the file order.
+        self._order = array('q', sorted(range(len(self.timestamps)), key=self.timestamps.__getitem__))
+        self._sorted_timestamps = array('q', (self.timestamps[row] for row in self._order))
+        self._chronological = all(row == i for i, row in enumerate(self._order))
+
+    def _intern_sender(self, message: str) -> int:
+        sender = parseSender(message)
+        if sender is None:
+            return -1
+        if sender not in self._sender_ids:
+            self._sender_ids[sender] = len(self.sender_names)
+            self.sender_names.append(sender)
+        return self._sender_ids[sender]
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def start_date(self) -> datetime:
+        """Date of the first timestamped line in the file."""
+        return timestampToDate(self.timestamps[0])
+
+    @property
+    def end_date(self) -> datetime:
+        """Latest date in the file."""
+        return timestampToDate(self._sorted_timestamps[-1])
+
+    def date(self, row: int) -> datetime:
+        return timestampToDate(self.timestamps[row])
+
+    def sender(self, row: int) -> str:
+        sender_id = self.senders[row]
+        return self.sender_names[sender_id] if sender_id >= 0 else ""
+
+    def line(self, row: int) -> str:
+        """
+        Decode a row from the source. Line endings are normalized to "\\n", as when the file
+        is read in text mode.
+        """
+        offset = self.offsets[row]
+        line = self.source[offset:offset + self.lengths[row]].decode('utf-8')
+        if line.endswith("\r\n"):
+            return line[:-2] + "\n"
+        if line.endswith("\r"):
+            return line[:-1] + "\n"
+        return line
+
+    def rows_between(self, start: datetime, end: datetime, include_end: bool = True) -> List[int]:
+        """
+        Get the rows dated within a range, in file order.
+
+        Args:
+            start (datetime): First date of the range
+            end (datetime): Last date of the range
+            include_end (bool): Whether rows dated exactly at `end` are included
+
+        Returns:
+            List[int]: Row numbers in the order they appear in the file
+        """
+        lo = bisect_left(self._sorted_timestamps, dateToTimestamp(start))
+        end_ts = dateToTimestamp(end)
+        hi = bisect_right(self._sorted_timestamps, end_ts) if include_end else bisect_left(self._sorted_timestamps, end_ts)
+        if lo >= hi:
+            return []
+        if self._chronological:
+            return list(range(lo, hi))
+        return sorted(self._order[lo:hi])
+
+    def lines_between(self, start: datetime, end: datetime, include_end: bool = True) -> List[str]:
+        """Get the lines dated within a range, in file order. See rows_between."""
+        return [self.line(row) for row in self.rows_between(start, end, include_end)]
+
+
+# Tables already parsed, by file and parsing options. Only the MAX_MESSAGE_TABLES most recently
+# used are kept, since each one holds the whole file
+MAX_MESSAGE_TABLES = 8
+_tables: "OrderedDict[Tuple[str, str, str], Tuple[Tuple[int, int], MessageTable]]" = OrderedDict()
+
+def getMessageTable(filepath: str, timeStampRegex: str, dateRegex: str) -> MessageTable:
+    """
+    Get the message table of a file, parsing it only the first time or when the file changed
+    (as long as it's one of the MAX_MESSAGE_TABLES most recently used).
+
+    Args:
+        filepath (str): Path to the file
+        timeStampRegex (str): Regex pattern to match timestamps in the file
+        dateRegex (str): Format string for parsing the datetime
+
+    Returns:
+        MessageTable: The parsed file
+
+    Raises:
+        FileNotFoundError: If file doesn't exist
+    """
+    stat = os.stat(filepath)
+    version = (stat.st_mtime_ns, stat.st_size)
+    key = (os.path.abspath(filepath), timeStampRegex, dateRegex)
+
+    cached = _tables.get(key)
+    if cached and cached[0] == version:
+        _tables.move_to_end(key)
+        return cached[1]
+
+    table = MessageTable(filepath, timeStampRegex, dateRegex)
+    _tables[key] = (version, table)
+    _tables.move_to_end(key)
+    while len(_tables) > MAX_MESSAGE_TABLES:
+        _tables.popitem(last=False)
+    return table
+
+
+def clearMessageTables() -> None:
+    """Forget every parsed message table, e.g. to free their memory once ingestion is done."""
+    _tables.clear()
+
+
+if __name__ == "__main__":
+    # Example usage
+    table = getMessageTable(
+        "app/data/_chat_grettel.txt",
+        r"\[(\d{1,2}/\d{1,2}/\d{2}), \d{1,2}:\d{2}:\d{2}(?:.AM|.PM)?\]",
+        "%d/%m/%y"
+    )
+    print(f"Messages: {len(table)}")
+    print(f"Senders: {table.sender_names}")
+    print(f"From {table.start_date} to {table.end_date}")
+    for line in table.lines_between(table.start_date, table.start_date + timedelta(days=1)):
+        print(line.strip())
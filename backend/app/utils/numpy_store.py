@@ -0,0 +1,274 @@
+import json
+import asyncio
+import numpy as np
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from app.utils.blocks import BlockStore
+
+# Rows of an int8 matrix converted back to float32 at a time while searching
+DEQUANTIZE_ROWS = 4096
+
+
+def metadata_matches(metadata: dict, filter: Optional[Dict[str, Any]]) -> bool:
+    """
+    Whether the metadata of a document passes a search filter: a dict of the values some
+    fields must have. List fields (like "participants") pass if they contain the value.
+    """
+    for key, value in (filter or {}).items():
+        field = metadata.get(key)
+        if field != value and not (isinstance(field, list) and value in field):
+            return False
+    return True
+
+
+def quantize(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Quantize the rows of a matrix to int8, each with its own scale.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The int8 matrix and the scale of each row
+    """
+    scales = np.abs(matrix).max(axis=1) / 127
+    scales[scales == 0] = 1
+    return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Vector store that keeps every vector in one contiguous NumPy matrix and searches it
+    exactly, by cosine similarity: a single matrix product and argpartition per batch of
+    queries. The matrix can be quantized to int8 (with a scale per row), which takes a
+    quarter of the memory.
+
+    Filters are dicts of the values some metadata fields must have (see metadata_matches).
+    """
+
+    def __init__(self, embeddings: Embeddings, ids: List[str], vectors: np.ndarray, texts: List[str],
+                 metadatas: List[dict], quantized: bool = False, scales: Optional[np.ndarray] = None,
+                 block_store: Optional[BlockStore] = None):
+        """
+        Use NumpyVectorStore.from_vectors or NumpyVectorStore.load to create a store.
+
+        Args:
+            embeddings (Embeddings): Embeddings used to encode the queries
+            ids (List[str]): Id of each vector
+            vectors (np.ndarray): Normalized vectors, one per row (int8 if quantized)
+            texts (List[str]): Text of each vector, empty for the pooled chunks of a block store
+            metadatas (List[dict]): Metadata of each vector
+            quantized (bool): Whether the vectors are quantized to int8
+            scales (Optional[np.ndarray]): Scale of each row of a quantized matrix
+            block_store (Optional[BlockStore]): Store the text of pooled chunks is put back
+                together from (see BlockQdrant)
+        """
+        self._embeddings = embeddings
+        self.ids = ids
+        self.vectors = vectors
+        self.texts = texts
+        self.metadatas = metadatas
+        self.quantized = quantized
+        self.scales = scales
+        self.block_store = block_store
+        self._rows = {id: row for row, id in enumerate(ids)}
+        # Rows that pass each filter searched with so far
+        self._masks: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_vectors(cls, embeddings: Embeddings, ids: List[str], vectors: Iterable[List[float]], texts: List[str],
+                     metadatas: List[dict], quantized: bool = False, block_store: Optional[BlockStore] = None) -> "NumpyVectorStore":
+        """Create a store from already embedded texts (see __init__)."""
+        matrix = normalize(np.asarray(list(vectors), dtype=np.float32).reshape(len(ids), -1))
+        scales = None
+        if quantized:
+            matrix, scales = quantize(matrix)
+        return cls(embeddings, ids, np.ascontiguousarray(matrix), texts, metadatas, quantized, scales, block_store)
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, quantized: bool = False, **kwargs: Any) -> "NumpyVectorStore":
+        ids = ids or [str(i) for i in range(len(texts))]
+        return cls.from_vectors(
+            embedding, ids, embedding.embed_documents(texts), list(texts), metadatas or [{} for _ in texts], quantized
+        )
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embeddings
+
+    @property
+    def nbytes(self) -> int:
+        """Memory taken by the vectors."""
+        return self.vectors.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, *,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        ids = ids or [str(len(self.ids) + i) for i in range(len(texts))]
+        added = NumpyVectorStore.from_vectors(
+            self._embeddings, ids, self._embeddings.embed_documents(texts), texts, metadatas or [{} for _ in texts], self.quantized
+        )
+        self.vectors = np.concatenate([self.vectors, added.vectors])
+        if self.quantized:
+            self.scales = np.concatenate([self.scales, added.scales])
+        self.ids += ids
+        self.texts += texts
+        self.metadatas += added.metadatas
+        self._rows = {id: row for row, id in enumerate(self.ids)}
+        self._masks = {}
+        return ids
+
+    def _document(self, row: int) -> Document:
+        return Document(
+            id=self.ids[row],
+            page_content=self.texts[row],
+            metadata={**self.metadatas[row], "_id": self.ids[row]},
+        )
+
+    def _documents(self, rows: Iterable[int]) -> List[Document]:
+        documents = [self._document(row) for row in rows]
+        if self.block_store is not None:
+            texts = self.block_store.texts(id for document in documents for id in document.metadata.get("blocks", []))
+            for document in documents:
+                if not document.page_content:
+                    document.page_content = "".join(texts.get(id, "") for id in document.metadata.get("blocks", []))
+        return documents
+
+    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        return self._documents(self._rows[id] for id in ids if id in self._rows)
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        if not self.quantized:
+            return queries @ self.vectors.T
+        # Mixed int8/float32 products don't use BLAS, so rows are converted a block at a time
+        scores = np.empty((len(queries), len(self.ids)), dtype=np.float32)
+        for start in range(0, len(self.ids), DEQUANTIZE_ROWS):
+            end = start + DEQUANTIZE_ROWS
+            scores[:, start:end] = queries @ self.vectors[start:end].astype(np.float32).T
+        return scores * self.scales
+
+    def _mask(self, filter: Dict[str, Any]) -> np.ndarray:
+        key = json.dumps(filter, sort_keys=True, default=str)
+        if key not in self._masks:
+            self._masks[key] = np.fromiter(
+                (metadata_matches(metadata, filter) for metadata in self.metadatas), dtype=bool, count=len(self.ids)
+            )
+        return self._masks[key]
+
+    def search_by_vectors(self, embeddings: List[List[float]], k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                          filters: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[List[Tuple[Document, float]]]:
+        """
+        Search the best matches of several query vectors at once.
+
+        Args:
+            embeddings (List[List[float]]): The query vectors
+            k (int): Number of documents to return for each query
+            filter (Optional[Dict[str, Any]]): Values some metadata fields must have
+            filters (Optional[List[Optional[Dict[str, Any]]]]): Filter of each query, on top of `filter`
+
+        Returns:
+            List[List[Tuple[Document, float]]]: Documents and cosine similarity of the best
+                matches of each query, best first
+        """
+        if not self.ids or not embeddings:
+            return [[] for _ in embeddings]
+
+        queries = normalize(np.asarray(embeddings, dtype=np.float32))
+        scores = self._scores(queries)
+        if filter:
+            scores[:, ~self._mask(filter)] = -np.inf
+        for query, query_filter in enumerate(filters or []):
+            if query_filter:
+                scores[query, ~self._mask(query_filter)] = -np.inf
+        k = min(k, len(self.ids))
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best = np.take_along_axis(best, np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1, kind="stable"), axis=1)
+
+        results = []
+        for query, rows in enumerate(best):
+            rows = [row for row in rows if np.isfinite(scores[query, row])]
+            results.append(list(zip(self._documents(rows), (float(scores[query, row]) for row in rows))))
+        return results
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Dict[str, Any]] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.search_by_vectors([embedding], k, filter)[0]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self._embeddings.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    async def asimilarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(await self._embeddings.aembed_query(query), k, **kwargs)
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in await self.asimilarity_search_with_score(query, k, **kwargs)]
+
+    async def abatch_similarity_search(self, queries: List[str], k: int = 4,
+                                       filter: Optional[Dict[str, Any]] = None) -> List[List[Document]]:
+        """
+        Search several queries with a single matrix product. The queries are embedded
+        concurrently, so the query cache and batching of the embeddings apply.
+        """
+        embeddings = await asyncio.gather(*(self._embeddings.aembed_query(query) for query in queries))
+        return [[document for document, _ in results] for results in self.search_by_vectors(list(embeddings), k, filter)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Scores are already cosine similarities
+        return lambda score: score
+
+    def save(self, path: str, stamp: str = "") -> None:
+        """
+        Save the store (without its embeddings and block store) to a .npz file.
+
+        Args:
+            path (str): Path to the file
+            stamp (str): Identifies what the store was built from (see load)
+        """
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                meta=np.array(json.dumps({
+                    "ids": self.ids,
+                    "texts": self.texts,
+                    "metadatas": self.metadatas,
+                    "quantized": self.quantized,
+                    "stamp": stamp,
+                }, ensure_ascii=False)),
+                vectors=self.vectors,
+                scales=self.scales if self.scales is not None else np.zeros(0, dtype=np.float32),
+            )
+
+    @classmethod
+    def load(cls, path: str, embeddings: Embeddings, stamp: str = "", block_store: Optional[BlockStore] = None) -> "NumpyVectorStore":
+        """
+        Load a store saved with save.
+
+        Raises:
+            FileNotFoundError: If there is no store
+            ValueError: If the store was saved with another stamp
+        """
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta["stamp"] != stamp:
+                raise ValueError("The vector store is out of date")
+            return cls(
+                embeddings,
+                meta["ids"],
+                data["vectors"],
+                meta["texts"],
+                meta["metadatas"],
+                quantized=meta["quantized"],
+                scales=data["scales"] if meta["quantized"] else None,
+                block_store=block_store,
+            )
@@ -0,0 +1,198 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore, VectorStoreRetriever
+from langchain_community.vectorstores.qdrant import Qdrant
+from qdrant_client.http.models import Filter, HasIdCondition, QueryRequest
+from app.utils.blocks import BlockQdrant
+from app.utils.bm25 import BM25Index
+from app.utils.embeddings import aembed_queries
+from app.utils.numpy_store import NumpyVectorStore, metadata_matches
+
+# Constant of reciprocal rank fusion, which damps the weight of the first ranks
+DEFAULT_RRF_K = 60
+
+
+def get_documents_by_ids(vector_store: VectorStore, ids: List[str], filter: Optional[Any] = None) -> Dict[str, Document]:
+    """
+    Get documents from a vector store by id, leaving out the ones a search filter excludes.
+
+    Args:
+        vector_store (VectorStore): The vector store
+        ids (List[str]): Ids of the documents
+        filter (Optional[Any]): Search filter, in the form the vector store takes
+
+    Returns:
+        Dict[str, Document]: The documents, by id
+    """
+    if not ids:
+        return {}
+
+    if isinstance(vector_store, Qdrant):
+        conditions = [HasIdCondition(has_id=ids)]
+        if filter is not None:
+            conditions.append(filter if isinstance(filter, Filter) else vector_store._qdrant_filter_from_dict(filter))
+        records, _ = vector_store.client.scroll(
+            collection_name=vector_store.collection_name,
+            scroll_filter=Filter(must=conditions),
+            limit=len(ids),
+            with_payload=True,
+            with_vectors=False,
+        )
+        documents = [
+            vector_store._document_from_scored_point(
+                record, vector_store.collection_name, vector_store.content_payload_key, vector_store.metadata_payload_key
+            )
+            for record in records
+        ]
+        if isinstance(vector_store, BlockQdrant):
+            documents = [document for document, _ in vector_store._with_block_text([(document, 0.0) for document in documents])]
+        return {str(document.metadata["_id"]): document for document in documents}
+
+    return {
+        str(document.id): document
+        for document in vector_store.get_by_ids(ids)
+        if not isinstance(filter, dict) or metadata_matches(document.metadata, filter)
+    }
+
+
+class HybridRetriever(VectorStoreRetriever):
+    """
+    Retriever that fuses the results of a vector search and a BM25 keyword search with
+    reciprocal rank fusion, so chunks that share the literal words of a question (names,
+    places, hobbies) rank high even when their vectors don't.
+
+    It takes the same search kwargs as VectorStoreRetriever ("k" and "filter"), and looks at
+    the best `fetch_k` results of each search.
+    """
+
+    keyword_index: BM25Index
+    fetch_k: int = 20
+    rrf_k: int = DEFAULT_RRF_K
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def _fuse(self, vector_results: List[Tuple[Document, float]], query: str, filter: Optional[Any], k: int) -> List[Document]:
+        scores: Dict[str, float] = {}
+        documents: Dict[str, Document] = {}
+        for rank, (document, _) in enumerate(vector_results):
+            id = str(document.metadata.get("_id", document.id))
+            documents[id] = document
+            scores[id] = scores.get(id, 0.0) + 1 / (self.rrf_k + rank + 1)
+
+        keyword_results = self.keyword_index.search(query, self.fetch_k)
+        if filter is not None:
+            # Keyword matches only count if the filter lets them through
+            allowed = get_documents_by_ids(self.vectorstore, [id for id, _ in keyword_results], filter)
+            keyword_results = [(id, score) for id, score in keyword_results if id in allowed]
+            documents.update({id: document for id, document in allowed.items() if id not in documents})
+        for rank, (id, _) in enumerate(keyword_results):
+            scores[id] = scores.get(id, 0.0) + 1 / (self.rrf_k + rank + 1)
+
+        best = sorted(scores, key=scores.get, reverse=True)[:k]
+        missing = [id for id in best if id not in documents]
+        documents.update(get_documents_by_ids(self.vectorstore, missing))
+        return [documents[id] for id in best if id in documents]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun, **kwargs: Any) -> List[Document]:
+        search_kwargs = {**self.search_kwargs, **kwargs}
+        k = search_kwargs.pop("k", 4)
+        vector_results = self.vectorstore.similarity_search_with_score(query, k=max(k, self.fetch_k), **search_kwargs)
+        return self._fuse(vector_results, query, search_kwargs.get("filter"), k)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun, **kwargs: Any) -> List[Document]:
+        search_kwargs = {**self.search_kwargs, **kwargs}
+        k = search_kwargs.pop("k", 4)
+        vector_results = await self.vectorstore.asimilarity_search_with_score(query, k=max(k, self.fetch_k), **search_kwargs)
+        if isinstance(self.vectorstore, Qdrant):
+            # Local Qdrant has no async client: its lookups of the keyword matches block
+            return await asyncio.to_thread(self._fuse, vector_results, query, search_kwargs.get("filter"), k)
+        return self._fuse(vector_results, query, search_kwargs.get("filter"), k)
+
+
+def search_qdrant_batch(vector_store: Qdrant, embeddings: List[List[float]], k: int,
+                        filters: List[Optional[Any]]) -> List[List[Tuple[Document, float]]]:
+    """
+    Search several query vectors, each with its own filter, in a single Qdrant request. The
+    payloads of the matches are fetched afterwards, once for all the queries (queries about
+    members of the same chats share many of them).
+
+    Returns:
+        List[List[Tuple[Document, float]]]: Documents and scores of the best matches of each query
+    """
+    requests = [
+        QueryRequest(
+            query=embedding,
+            using=vector_store.vector_name,
+            filter=filter if filter is None or isinstance(filter, Filter) else vector_store._qdrant_filter_from_dict(filter),
+            limit=k,
+            with_payload=False,
+            with_vector=False,
+        )
+        for embedding, filter in zip(embeddings, filters)
+    ]
+    responses = vector_store.client.query_batch_points(collection_name=vector_store.collection_name, requests=requests)
+    ids = list(dict.fromkeys(point.id for response in responses for point in response.points))
+    records = vector_store.client.retrieve(vector_store.collection_name, ids, with_payload=True, with_vectors=False)
+    documents = {
+        record.id: vector_store._document_from_scored_point(
+            record, vector_store.collection_name, vector_store.content_payload_key, vector_store.metadata_payload_key
+        )
+        for record in records
+    }
+
+    results = [
+        [(documents[point.id], point.score) for point in response.points if point.id in documents]
+        for response in responses
+    ]
+    if isinstance(vector_store, BlockQdrant):
+        results = [vector_store._with_block_text(query_results) for query_results in results]
+    return results
+
+
+async def abatch_retrieve(retriever: VectorStoreRetriever, queries: List[str],
+                          filters: List[Optional[Any]]) -> List[List[Document]]:
+    """
+    Retrieve the documents of several queries, each with its own search filter, embedding
+    them all at once (see aembed_queries) and searching them with a single batched vector
+    query, instead of one embedding and one search per query.
+
+    Args:
+        retriever (VectorStoreRetriever): The retriever, its "k" is the number of documents of each query
+        queries (List[str]): The queries
+        filters (List[Optional[Any]]): Search filter of each query, in the form the vector store takes
+
+    Returns:
+        List[List[Document]]: The documents of each query
+    """
+    if not queries:
+        return []
+
+    vector_store = retriever.vectorstore
+    k = retriever.search_kwargs.get("k", 4)
+    hybrid = isinstance(retriever, HybridRetriever)
+    fetch_k = max(k, retriever.fetch_k) if hybrid else k
+
+    embeddings = await aembed_queries(vector_store.embeddings, queries)
+    if isinstance(vector_store, NumpyVectorStore):
+        results = vector_store.search_by_vectors(embeddings, fetch_k, filters=filters)
+    elif isinstance(vector_store, Qdrant):
+        # Local Qdrant has no async client
+        results = await asyncio.to_thread(search_qdrant_batch, vector_store, embeddings, fetch_k, filters)
+    else:
+        # Only the order of the documents matters from here on
+        results = [
+            [(document, 0.0) for document in await vector_store.asimilarity_search_by_vector(embedding, fetch_k, filter=filter)]
+            for embedding, filter in zip(embeddings, filters)
+        ]
+
+    if not hybrid:
+        return [[document for document, _ in query_results] for query_results in results]
+
+    def fuse() -> List[List[Document]]:
+        return [retriever._fuse(*arguments, k) for arguments in zip(results, queries, filters)]
+
+    if isinstance(vector_store, Qdrant):
+        return await asyncio.to_thread(fuse)
+    return fuse()
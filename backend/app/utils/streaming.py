@@ -0,0 +1,153 @@
+import json
+import asyncio
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+
+class JsonArrayStream:
+    """
+    Incremental parser of the first JSON array in a text that arrives in pieces, e.g. the
+    tokens of an LLM: every object in the array is returned as soon as it is complete,
+    without waiting for the rest of the text.
+
+    Whatever comes before the array (e.g. `{"ideas": ` or a "Final Answer:") and after it is
+    skipped.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        # Depth of the array once it's found, and characters of the object being read
+        self.array_depth: Optional[int] = None
+        self.item: Optional[List[str]] = None
+        self.done = False
+
+    def feed(self, text: str) -> List[Any]:
+        """
+        Args:
+            text (str): Next piece of the text
+
+        Returns:
+            List[Any]: The objects of the array completed by this piece
+        """
+        items = []
+        for char in text:
+            if self.done:
+                break
+            if self.item is not None:
+                self.item.append(char)
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "[{":
+                self.depth += 1
+                if char == "[" and self.array_depth is None:
+                    self.array_depth = self.depth
+                elif char == "{" and self.array_depth is not None and self.depth == self.array_depth + 1:
+                    self.item = [char]
+            elif char in "]}":
+                if self.item is not None and self.depth == self.array_depth + 1:
+                    try:
+                        items.append(json.loads("".join(self.item)))
+                    except json.JSONDecodeError:
+                        pass
+                    self.item = None
+                elif self.array_depth is not None and self.depth == self.array_depth:
+                    self.done = True
+                self.depth -= 1
+        return items
+
+
+class StreamedList:
+    """
+    Keeps the items of a list sent one event at a time consistent with the list as it's
+    written, when it can be written more than once (e.g. an LLM answer that fails to parse and
+    is retried) or end up different from what was streamed.
+
+    Items already sent are not sent again. When the list stops starting with them, a "reset"
+    event tells to drop them, and the items of the list are sent again.
+    """
+
+    def __init__(self, event: str):
+        """
+        Args:
+            event (str): Name of the events of the items
+        """
+        self.event = event
+        self.sent: List[Any] = []
+
+    def _resend(self, items: List[Any]) -> List[Tuple[str, Any]]:
+        self.sent = list(items)
+        return [("reset", {})] + [(self.event, item) for item in items]
+
+    def update(self, items: List[Any]) -> List[Tuple[str, Any]]:
+        """
+        Args:
+            items (List[Any]): The items written so far of the current version of the list
+
+        Returns:
+            List[Tuple[str, Any]]: The events to send, with their data
+        """
+        if items[:len(self.sent)] == self.sent:
+            new_items = items[len(self.sent):]
+            self.sent.extend(new_items)
+            return [(self.event, item) for item in new_items]
+        if self.sent[:len(items)] == items:
+            # Written again, the same so far
+            return []
+        return self._resend(items)
+
+    def finish(self, items: List[Any]) -> List[Tuple[str, Any]]:
+        """Same as update with the final list, after which exactly its items were sent."""
+        events = self.update(items)
+        if self.sent != items:
+            events = self._resend(items)
+        return events
+
+
+class EventLog:
+    """
+    Events of a computation that several consumers follow, e.g. the streams of the clients
+    waiting for the same result: each one gets every event from the first one on, as they
+    arrive, until the log is closed.
+    """
+
+    def __init__(self):
+        self.events: List[Any] = []
+        self.closed = False
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def append(self, event: Any) -> None:
+        self.events.append(event)
+        self._notify()
+
+    def close(self) -> None:
+        self.closed = True
+        self._notify()
+
+    async def follow(self) -> AsyncIterator[Any]:
+        """Every event of the log, waiting for the next ones until it's closed."""
+        i = 0
+        while True:
+            while i < len(self.events):
+                yield self.events[i]
+                i += 1
+            if self.closed:
+                return
+            await self._changed.wait()
+
+
+def format_sse(event: str, data: Any) -> str:
+    """A server-sent event, with its data as JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,6 @@
+import os
+
+# app.main checks the API keys on import, the tests never call the providers
+os.environ.setdefault("ENV", "test")
+for key in ["OPENAI_API_KEY", "GOOGLE_API_KEY", "GOOGLE_CSE_ID", "COHERE_API_KEY"]:
+    os.environ.setdefault(key, "test")
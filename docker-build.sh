@@ -1,13 +1,22 @@
 #!/bin/bash
 set -e
 
+BUILD_ARGS=()
+if [ -f backend/.env ]; then
+  echo "Found backend/.env, the conversations index will be built into the image"
+  BUILD_ARGS=(--build-arg BUILD_INDEX=true --secret id=env,src=backend/.env)
+fi
+
 echo "Building Docker image..."
-docker build -t teic:latest .
+DOCKER_BUILDKIT=1 docker build "${BUILD_ARGS[@]}" -t teic:latest .
 
 echo "Verifying Docker image file structure..."
 # Run a temporary container to verify file structure
 docker run --rm teic:latest ls -la /app/frontend/build
 docker run --rm teic:latest ls -la /app/frontend/build/assets
+if [ -f backend/.env ]; then
+  docker run --rm teic:latest cat /app/.cache/index/manifest.json
+fi
 
 echo "All checks passed! You can now run the container with:"
 echo "docker run -e ENV=production -p 7860:7860 teic:latest" 
\ No newline at end of file
@@ -55,13 +55,13 @@ function App() {
     abortControllerRef.current = controller;
 
     try {
+      // Gift ideas arrive as server-sent events, each one as soon as it's written
       const response = await fetch(
-        `/api/gift-ideas/${encodeURIComponent(teamMember)}`,
+        `/api/gift-ideas/${encodeURIComponent(teamMember)}/stream`,
         {
           method: 'GET',
           headers: {
-            'Content-Type': 'application/json',
-            Accept: 'application/json',
+            Accept: 'text/event-stream',
           },
           signal, // Add the abort signal
         }
@@ -71,11 +71,47 @@ function App() {
         throw new Error(`Error: ${response.status}`);
       }
 
-      const data = await response.json();
-      setPresents(data.giftIdeas);
-
-      // Open the modal when presents are fetched
-      setIsModalOpen(true);
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      const ideas = [];
+      let buffer = '';
+
+      const handleEvent = (event, data) => {
+        if (event === 'idea') {
+          ideas.push(data);
+          setPresents([...ideas]);
+          // Open the modal with the first gift idea
+          setIsModalOpen(true);
+        } else if (event === 'reset') {
+          // The ideas were written again differently, the next ones replace them
+          ideas.length = 0;
+          setPresents([]);
+        } else if (event === 'done') {
+          setPresents(data.giftIdeas);
+          setIsModalOpen(true);
+        } else if (event === 'error') {
+          throw new Error(data.detail);
+        }
+      };
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const rawEvent of events) {
+          let event = 'message';
+          let data = '';
+          for (const line of rawEvent.split('\n')) {
+            if (line.startsWith('event: ')) event = line.slice(7);
+            else if (line.startsWith('data: ')) data += line.slice(6);
+          }
+          handleEvent(event, JSON.parse(data));
+        }
+      }
     } catch (error) {
       console.error('Error fetching presents:', error);
       setPresents('Error fetching presents. Please try again.');